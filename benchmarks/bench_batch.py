@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Compares rolling an expression n times with roll_many against a Python loop
+over compiled expressions, as in a Monte Carlo simulation.
+
+Usage:
+    python benchmarks/bench_batch.py [--n=<n>]
+"""
+
+import argparse
+import time
+import warnings
+
+from zardoz.dice import compile, roll_many
+
+EXPRESSIONS = [
+    "1d100",
+    "1d100 <= 45",
+    "4d6^3t",
+    "4d6^3t + 8 <= 1d100",
+    "2d10 + 4",
+    "10d10x9e8",
+    "6d6rr2t",
+]
+
+
+def time_call(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=100000)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    roll_many('1d6', 1)  # imports numpy
+    print(f'{"expression":<24} {"loop":>10} {"roll_many":>10} {"speedup":>8}')
+    for expr in EXPRESSIONS:
+        compiled = compile(expr)
+        slow = time_call(lambda: [compiled() for i in range(args.n)])
+        fast = time_call(lambda: roll_many(expr, args.n))
+        print(f'{expr:<24} {slow * 1e3:>8.1f}ms {fast * 1e3:>8.1f}ms {slow / fast:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Compares rolling compiled expressions with evaluating the element tree.
+
+Both sides use the parse cache, so this measures evaluation only.
+
+Usage:
+    python benchmarks/bench_compile.py [--number=<n>]
+"""
+
+import argparse
+import timeit
+import warnings
+
+from zardoz.dice import compile, roll
+
+EXPRESSIONS = [
+    "20",
+    "1d100",
+    "1d100 <= 45",
+    "4d6^3",
+    "4d6^3t + 8 <= 1d100",
+    "3d6 + 2*4 - 1",
+    "(2d6)d(2d6)",
+    "2d6 | 3d6, 4d6",
+    "10d10x9e8",
+    "64d6rr2t",
+]
+
+
+def time_call(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    print(f'{"expression":<24} {"roll":>12} {"compiled":>12} {"speedup":>8}')
+    for expr in EXPRESSIONS:
+        compiled = compile(expr)
+        slow = time_call(lambda: roll(expr), args.number)
+        fast = time_call(compiled, args.number)
+        print(f'{expr:<24} {slow * 1e6:>10.1f}us {fast * 1e6:>10.1f}us {slow / fast:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Compares evaluating optimized trees with the kernels picked for the kinds of
+their operands against the same trees using each operator's general function.
+
+Usage:
+    python benchmarks/bench_dispatch.py [--number=<n>]
+"""
+
+import argparse
+import timeit
+import warnings
+
+from zardoz.dice import parse_expression
+from zardoz.dice.elements import Operator, Trace
+
+EXPRESSIONS = [
+    "1d20t + 5",
+    "1d20t + 5 + 3 + 2",
+    "1d20t - 2 - 3",
+    "2d6t * 2 * 3",
+    "-(1d6t)",
+    "1d100t <= 45",
+    "4d6^3t + 8 <= 1d100",
+    "3d6 + 2*4 - 1",
+]
+
+
+def time_call(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def generic(node, seen):
+    """Resets the kernels of an optimized tree to the general function"""
+    if isinstance(node, Operator) and id(node) not in seen:
+        seen.add(id(node))
+        node.kernel = 'function'
+        for operand in node.original_operands:
+            generic(operand, seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=5000)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    print(f'{"expression":<24} {"general":>12} {"kernels":>12} {"speedup":>8}')
+    for expr in EXPRESSIONS:
+        fast_ast = parse_expression(expr, cache=False, optimize=True)
+        slow_ast = parse_expression(expr, cache=False, optimize=True)
+        generic(slow_ast[0], set())
+
+        slow = time_call(lambda: Trace.evaluate(slow_ast, keep_intermediates=False),
+                         args.number)
+        fast = time_call(lambda: Trace.evaluate(fast_ast, keep_intermediates=False),
+                         args.number)
+        print(f'{expr:<24} {slow * 1e6:>10.1f}us {fast * 1e6:>10.1f}us {slow / fast:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Compares computing exact distributions with estimating them by sampling.
+
+The sampled side rolls each expression --samples times with roll_many and
+reports how far its mean lies from the exact one.
+
+Usage:
+    python benchmarks/bench_distribution.py [--samples=<n>]
+"""
+
+import argparse
+import time
+import warnings
+
+from zardoz.dice import distribution, roll_many
+
+EXPRESSIONS = [
+    "3d6t",
+    "4d6^3t",
+    "1d20+5 >= 15",
+    "6d6rr2t",
+    "10d10xt",
+    "20d10h5t",
+    "200d10t",
+    "1000d100t",
+]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=100000)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    # Warm up the NumPy import
+    roll_many("1d6", 10)
+
+    print(f'{"expression":<16} {"exact":>10} {"sampled":>10} {"mean":>10} {"error":>8}')
+    for expr in EXPRESSIONS:
+        dist, exact = timed(lambda: distribution(expr, max_dice=1000))
+        sample, sampled = timed(lambda: roll_many(expr, args.samples, max_dice=1000))
+        if sample.dtype.names:
+            sample = sample['value']
+            mean = dist.probability
+        else:
+            mean = dist.mean
+        if sample.ndim > 1:
+            sample = sample.sum(axis=1)
+        error = abs(sample.mean() - mean)
+        print(f'{expr:<16} {exact * 1e3:>8.1f}ms {sampled * 1e3:>8.1f}ms {mean:>10.3f} {error:>8.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Compares exploding a roll one round at a time, rolling again for the dice
+that exploded in the last round, against drawing the length of each die's
+chain of explosions from the geometric distribution and its faces in one
+batch, across pool sizes and thresholds.
+
+Engines with randints and geometric methods, like the numpy engine, draw each
+batch in one call.
+
+Usage:
+    python benchmarks/bench_explode.py [--number=<n>] [--engine=<name>]
+"""
+
+import argparse
+import timeit
+import warnings
+
+from zardoz.dice import parse_expression
+from zardoz.dice.elements import Roll
+from zardoz.dice.rng import ENGINES, engine
+
+POOLS = [1, 10, 100, 1000]
+DICE = [(6, [2, 4, 6]), (20, [5, 10, 20])]
+
+
+def time_call(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=200)
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='python')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    rng = engine(args.engine, 0)
+    print(f'{"expression":<14} {"rounds":>12} {"geometric":>12} {"speedup":>8}')
+    for sides, thresholds in DICE:
+        for thresh in thresholds:
+            for amount in POOLS:
+                expr = f'{amount}d{sides}x{thresh}'
+                node = parse_expression(expr, cache=False)[0]
+                roll = Roll(node.original_operands[0], random=rng)
+
+                slow = time_call(lambda: node.explode_rounds(roll, thresh, random=rng),
+                                 args.number)
+                fast = time_call(lambda: node.function(roll, thresh, random=rng),
+                                 args.number)
+                print(f'{expr:<14} {slow * 1e6:>10.1f}us {fast * 1e6:>10.1f}us '
+                      f'{slow / fast:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Compares lexing roll commands in one pass with the compiled lexer against
+the pipeline it replaced: re.split on a pattern rebuilt each call, a regex
+match to filter each token, then a second pass to expand variables and the
+default die and a join of the expanded tokens.
+
+Reports the time per command, and the most memory allocated at once while
+lexing it, as traced by tracemalloc.
+
+Usage:
+    python benchmarks/bench_lexer.py [--number=<n>]
+"""
+
+import argparse
+import logging
+import re
+import timeit
+import tracemalloc
+
+from zardoz.rolls import lex_roll
+from zardoz.state import MODE_DICE, GameMode
+
+COMMANDS = [
+    "1d20+5",
+    "r <= 45 # shoot",
+    "4d6^3t + $str # strength check",
+    "(2d6)d(2d6) + $a - $b <= 1d100 # everything at once",
+    " + ".join(["(2d6)d(2d6) - r <= 1d100"] * 16) + " # a long one",
+]
+VARIABLES = {'str': 3, 'a': 2, 'b': 1}
+
+log = logging.getLogger()
+OPS = ['+', '-', '<=', '<', '>=', '>', '(', ')', '==', '.+', '.-', '|', r'#']
+SPLIT_PAT = '|'.join(list(map(re.escape, OPS)) + [r'\s'])
+
+
+def split_lex(cmd, mode=GameMode.DEFAULT, variables={}):
+    """The previous pipeline, logging included"""
+    log.info(f'Tokenize: "{cmd}"')
+    log.info(f'SPLIT "{cmd}" on: "{SPLIT_PAT}"')
+    raw = [t for t in re.split(f'({SPLIT_PAT})', cmd)]
+    raw = [t for t in raw if t and not re.match(r'\s', t)]
+
+    tokens, tag = raw, ''
+    for i, token in enumerate(raw):
+        if token.startswith('#'):
+            tokens = raw[:i]
+            tag = ' '.join(raw[i:])
+            break
+    tag = tag.strip('# ')
+
+    expanded = []
+    for token in tokens:
+        if token.isnumeric() or token in OPS:
+            expanded.append(token)
+        elif token.startswith('$'):
+            expanded.append(variables[token.strip('$')])
+        else:
+            expanded.append(MODE_DICE[mode] if token == 'r' else token)
+    return tokens, tag, expanded, ' '.join((str(token) for token in expanded))
+
+
+def time_call(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def peak_call(func):
+    func()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        func()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f'{"command":<52} {"split":>9} {"lexer":>9} {"speedup":>8} '
+          f'{"split":>7} {"lexer":>7}')
+    for cmd in COMMANDS:
+        assert split_lex(cmd, variables=VARIABLES) == lex_roll(cmd, variables=VARIABLES)[:4]
+
+        slow = time_call(lambda: split_lex(cmd, variables=VARIABLES), args.number)
+        fast = time_call(lambda: lex_roll(cmd, variables=VARIABLES), args.number)
+        slow_peak = peak_call(lambda: split_lex(cmd, variables=VARIABLES))
+        fast_peak = peak_call(lambda: lex_roll(cmd, variables=VARIABLES))
+        print(f'{cmd[:52]:<52} {slow * 1e6:>7.2f}us {fast * 1e6:>7.2f}us {slow / fast:>7.2f}x '
+              f'{slow_peak:>6}B {fast_peak:>6}B')
+
+
+if __name__ == '__main__':
+    main()
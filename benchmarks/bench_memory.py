@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Measures the peak memory of evaluating the largest rolls allowed by default,
+with tracemalloc. Intermediate results are kept, as for a breakdown, and the
+comparisons of a comparison roll are listed, as the bot does to describe
+each one.
+
+Usage:
+    python benchmarks/bench_memory.py [--dice=<n>]
+"""
+
+import argparse
+import gc
+import tracemalloc
+import warnings
+
+from zardoz.dice import parse_expression
+from zardoz.dice.constants import MAX_ROLL_DICE
+from zardoz.dice.elements import Trace
+
+EXPRESSIONS = [
+    "{n}d6",
+    "{n}d6 + 1",
+    "{n}d6 >= 4",
+    "{n}d6^{half} * 2 - 1",
+    "{n}d6x",
+]
+
+
+def peak(func):
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dice', type=int, default=MAX_ROLL_DICE)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    print(f'{"expression":<24} {"peak":>10} {"per die":>9}')
+    for template in EXPRESSIONS:
+        expr = template.format(n=args.dice, half=args.dice // 2)
+        ast = parse_expression(expr, optimize=True)
+
+        def evaluate():
+            trace = Trace.evaluate(ast)
+            return trace, [list(r) for r in trace.results]
+
+        size = peak(evaluate)
+        print(f'{expr:<24} {size / 1024:>8.1f}KiB {size / args.dice:>8.1f}B')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Compares the pyparsing grammar with the precedence-climbing parser.
+
+Usage:
+    python benchmarks/bench_parser.py [--number=<n>]
+"""
+
+import argparse
+import timeit
+import warnings
+
+from zardoz.dice import PARSERS
+
+EXPRESSIONS = [
+    "20",
+    "1d100",
+    "1d100 <= 45",
+    "4d6^3",
+    "3d6 + 2*4 - 1",
+    "4d6^3t + 8 <= 1d100",
+    "(2d6)d(2d6)",
+    "2d6 | 3d6, 4d6",
+    "10d10x9e8",
+]
+
+
+def time_parser(parse, expr, number):
+    return min(timeit.repeat(lambda: parse(expr), number=number, repeat=3)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    print(f'{"expression":<24} {"pyparsing":>12} {"precedence":>12} {"speedup":>8}')
+    for expr in EXPRESSIONS:
+        slow = time_parser(PARSERS['pyparsing'], expr, args.number)
+        fast = time_parser(PARSERS['precedence'], expr, args.number)
+        print(f'{expr:<24} {slow * 1e6:>10.1f}us {fast * 1e6:>10.1f}us {slow / fast:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Compares rolling large pools of dice as lists with rolling them as counts of
+each face.
+
+Usage:
+    python benchmarks/bench_pools.py [--number=<n>]
+"""
+
+import argparse
+import timeit
+import warnings
+
+from zardoz.dice import roll
+
+EXPRESSIONS = ["{}d10e8", "{}d10t", "{}d6^10t", "{}d6v(0-10)", "{}d6m10", "{}d6rr2 >= 5"]
+AMOUNTS = [1000, 10000, 100000]
+
+
+def time_call(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    # Warm up the NumPy import
+    roll('100d6', max_dice=1, max_pool_dice=100)
+
+    print(f'{"expression":<20} {"listed":>10} {"counted":>10} {"speedup":>8}')
+    for template in EXPRESSIONS:
+        for amount in AMOUNTS:
+            expr = template.format(amount)
+            listed = time_call(lambda: roll(expr, max_dice=amount), args.number)
+            counted = time_call(lambda: roll(expr, max_dice=1, max_pool_dice=amount),
+                                args.number)
+            print(f'{expr:<20} {listed * 1e3:>8.2f}ms {counted * 1e3:>8.2f}ms '
+                  f'{listed / counted:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
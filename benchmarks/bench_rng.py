@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Compares the per-die cost of the random engines, and checks their fairness.
+
+For each engine this times single randint calls, whole pools drawn at once
+(randints, where the engine has it) and rolling "64d6" through the element
+tree. It then runs a chi-square test of the faces of a few dice against a
+uniform distribution.
+
+Usage:
+    python benchmarks/bench_rng.py [--dice=<n>] [--samples=<n>]
+"""
+
+import argparse
+import math
+import time
+import warnings
+
+from zardoz.dice import roll
+from zardoz.dice.rng import engine
+
+ENGINES = ['python', 'system', 'numpy', 'secure']
+SIDES = [2, 6, 7, 20, 100]
+
+
+def per_die(func, dice):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) / dice
+
+
+def chi_square(counts, expected):
+    return sum((c - expected) ** 2 / expected for c in counts)
+
+
+def critical_value(df, z=3.09):
+    """The chi-square value exceeded with probability ~0.001, by the
+    Wilson-Hilferty approximation"""
+    k = 2.0 / (9 * df)
+    return df * (1 - k + z * math.sqrt(k)) ** 3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dice', type=int, default=200000)
+    parser.add_argument('--samples', type=int, default=600000)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+
+    print(f'{"engine":<8} {"randint":>10} {"randints":>10} {"64d6":>10}')
+    for name in ENGINES:
+        rng = engine(name)
+        randint = rng.randint
+        single = per_die(lambda: [randint(1, 6) for i in range(args.dice)], args.dice)
+        if hasattr(rng, 'randints'):
+            pool = f'{per_die(lambda: rng.randints(1, 6, args.dice), args.dice) * 1e9:>8.0f}ns'
+        else:
+            pool = f'{"-":>10}'
+        rolls = args.dice // 64
+        tree = per_die(lambda: [roll('64d6', random=rng) for i in range(rolls)], rolls * 64)
+        print(f'{name:<8} {single * 1e9:>8.0f}ns {pool} {tree * 1e9:>8.0f}ns')
+
+    print()
+    print(f'{"engine":<8} {"sides":>5} {"chi2":>10} {"critical":>10} {"fair":>5}')
+    for name in ENGINES:
+        rng = engine(name)
+        for sides in SIDES:
+            counts = [0] * sides
+            for face in (rng.randint(1, sides) for i in range(args.samples)):
+                counts[face - 1] += 1
+            stat = chi_square(counts, args.samples / sides)
+            limit = critical_value(sides - 1)
+            print(f'{name:<8} {sides:>5} {stat:>10.2f} {limit:>10.2f} {"yes" if stat < limit else "NO":>5}')
+
+
+if __name__ == '__main__':
+    main()
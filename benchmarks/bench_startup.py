@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Measures the cold start of the dice package in fresh interpreters: the time
+to import it, to build the grammar and parse a first expression, and to roll
+it, as the roll CLI and each new pool worker would.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs=<n>]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROGRAM = '''
+import time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+import zardoz.dice as dice
+imported = time.perf_counter()
+ast = dice.parse_expression("4d6^3t + 8 <= 1d100")
+parsed = time.perf_counter()
+dice.roll("4d6^3t + 8 <= 1d100")
+rolled = time.perf_counter()
+print(imported - start, parsed - imported, rolled - start)
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    samples = []
+    for i in range(args.runs):
+        out = subprocess.run([sys.executable, '-c', PROGRAM], env=env, cwd=ROOT,
+                             check=True, stdout=subprocess.PIPE).stdout
+        samples.append([float(x) * 1e3 for x in out.split()])
+
+    for i, name in enumerate(('import', 'first parse', 'import to first roll')):
+        values = [s[i] for s in samples]
+        print(f'{name:<22} median {statistics.median(values):>7.1f}ms '
+              f'min {min(values):>7.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
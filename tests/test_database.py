@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""Tests for the guild state of `zardoz`, without a database."""
+
+import asyncio
+
+import pytest
+
+from zardoz.database import GuildState, ZardozDatabase
+from zardoz.state import ROLL_LIMITS, STATE_CACHE_MEMBERS
+
+
+class Loader:
+    """Stands in for a table of vars, counting the loads from it."""
+
+    def __init__(self, rows, delay=0):
+        self.rows = rows
+        self.delay = delay
+        self.loads = 0
+
+    def __call__(self, key):
+        async def load():
+            self.loads += 1
+            await asyncio.sleep(self.delay)
+            return dict(self.rows.get(key, {}))
+        return load
+
+
+def test_single_load():
+    state = GuildState()
+    loader = Loader({1: {'str': 3}}, delay=0.01)
+
+    async def run():
+        return await asyncio.gather(*(state.get(1, loader(1)) for _ in range(8)))
+
+    results = asyncio.run(run())
+    assert loader.loads == 1
+    assert all(result is results[0] for result in results)
+    assert results[0] == {'str': 3}
+    assert state.info().misses == 8
+    assert state.info().hits == 0
+
+
+def test_write_through():
+    state = GuildState()
+    loader = Loader({None: {'MODE': 1}, 1: {'str': 3}})
+
+    async def run():
+        await state.get(None, loader(None))
+        await state.get(1, loader(1))
+
+        state.set(1, 'dex', 2)
+        state.set(None, 'MODE', 2)
+        state.delete(1, 'str')
+        # Never loaded, so only a later load sees it
+        state.set(2, 'str', 1)
+
+        assert await state.get(1, loader(1)) == {'dex': 2}
+        assert await state.get(None, loader(None)) == {'MODE': 2}
+        assert await state.get(2, loader(2)) == {}
+
+    asyncio.run(run())
+    assert loader.loads == 3
+
+
+def test_write_during_load():
+    state = GuildState()
+    loader = Loader({1: {'str': 3}}, delay=0.01)
+
+    async def run():
+        task = asyncio.ensure_future(state.get(1, loader(1)))
+        await asyncio.sleep(0.005)
+        # The write lands while the first load is out, so it's loaded again
+        loader.rows[1]['str'] = 4
+        state.set(1, 'str', 4)
+        return await task
+
+    assert asyncio.run(run()) == {'str': 4}
+    assert loader.loads == 2
+
+
+def test_eviction():
+    state = GuildState()
+    loader = Loader({})
+
+    async def run():
+        await state.get(None, loader(None))
+        for member_id in range(STATE_CACHE_MEMBERS + 10):
+            await state.get(member_id, loader(member_id))
+        # The least recently used members go, never the guild's vars
+        await state.get(None, loader(None))
+        await state.get(10, loader(10))
+        await state.get(9, loader(9))
+
+    asyncio.run(run())
+    info = state.info()
+    assert info.evictions == 11
+    assert info.currsize == info.maxsize == STATE_CACHE_MEMBERS + 1
+    assert info.hits == 2
+    assert info.misses == STATE_CACHE_MEMBERS + 12
+    assert loader.loads == STATE_CACHE_MEMBERS + 12
+    assert state.hit_rate == 2 / (STATE_CACHE_MEMBERS + 14)
+
+
+def test_counters():
+    state = GuildState(max_members=2)
+    loader = Loader({})
+    assert state.hit_rate == 0.0
+
+    async def run():
+        for member_id in (1, 2, 1, 3, 2, 1):
+            await state.get(member_id, loader(member_id))
+
+    asyncio.run(run())
+    # 1 hits once; 3 evicts 2, which evicts 1, which evicts 3
+    assert tuple(state.info()) == (1, 5, 3, 2, 3)
+    assert state.hit_rate == 1 / 6
+
+
+class LimitsTable:
+    """Stands in for the guild_limits commands of a ZardozDatabase."""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def set_guild_limit_cmd(self, name, val):
+        self.rows[name] = val
+
+    def get_guild_limits_cursor_cmd(self):
+        rows = [{'name': name, 'val': val} for name, val in self.rows.items()]
+
+        class Cursor:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def __aiter__(self):
+                for row in rows:
+                    yield row
+
+        return Cursor()
+
+    async def commit(self):
+        pass
+
+
+def test_guild_limits():
+    table = LimitsTable()
+    db = ZardozDatabase.__new__(ZardozDatabase)
+    db.con = table
+    db.set_guild_limit_cmd = table.set_guild_limit_cmd
+    db.get_guild_limits_cursor_cmd = table.get_guild_limits_cursor_cmd
+    db.limits = None
+    db.state = GuildState()
+
+    async def run():
+        assert await db.get_guild_limits() == ROLL_LIMITS
+        await db.set_guild_limit('dice', 100)
+        await db.set_guild_limit('ms', 250)
+        with pytest.raises(ValueError):
+            await db.set_guild_limit('dice', ROLL_LIMITS['max_rolled'] + 1)
+        with pytest.raises(ValueError):
+            await db.set_guild_limit('LIMIT_DICE', 1)
+        return await db.get_guild_limits()
+
+    limits = asyncio.run(run())
+    assert limits == dict(ROLL_LIMITS, max_rolled=100, timeout=0.25)
+    # They're kept in their own table, not among the guild's vars
+    assert table.rows == {'dice': 100, 'ms': 250}
+    assert db.state.info().currsize == 0
+
+    db.limits = None
+    assert asyncio.run(db.get_guild_limits()) == limits
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""Tests for the roll command lexer of `zardoz`, against the tokenizer it
+replaced."""
+
+import re
+import tracemalloc
+
+import pytest
+
+from zardoz.rolls import lex_roll
+from zardoz.state import GameMode, MODE_DICE
+
+
+# The previous tokenizer, kept as the reference the lexer has to agree with
+OLD_OPS = ['+', '-', '<=', '<', '>=', '>', '(', ')', '==', '.+', '.-', '|', r'#']
+OLD_SPLIT_PAT = '|'.join(list(map(re.escape, OLD_OPS)) + [r'\s'])
+
+
+def old_tokenize_roll(cmd):
+    raw = []
+    for arg in ([cmd] if isinstance(cmd, str) else cmd):
+        raw.extend(re.split(f'({OLD_SPLIT_PAT})', arg))
+    raw = [t for t in raw if t and not re.match(r'\s', t)]
+
+    tokens, tag = raw, ''
+    for i, token in enumerate(raw):
+        if token.startswith('#'):
+            tokens = raw[:i]
+            tag = ' '.join(raw[i:])
+            break
+    return tokens, tag.strip('# ')
+
+
+def old_expand_tokens(tokens, mode, variables):
+    expanded = []
+    for token in tokens:
+        if token.isnumeric() or token in OLD_OPS:
+            expanded.append(token)
+        elif token.startswith('$'):
+            var = token.strip('$')
+            if var not in variables:
+                raise ValueError(f'Sorry bruh, that variable isn\'t defined: `{var}`')
+            if not isinstance(variables[var], int):
+                raise ValueError('Non-integer variable!')
+            expanded.append(variables[var])
+        else:
+            expanded.append(MODE_DICE[mode] if token == 'r' else token)
+    return expanded
+
+
+def old_lex_roll(cmd, mode=GameMode.DEFAULT, variables={}, require_tag=False):
+    tokens, tag = old_tokenize_roll(cmd)
+    if require_tag and not tag:
+        raise ValueError('Add a tag, it\'s the polite thing to do.')
+    expanded = old_expand_tokens(tokens, mode, variables)
+    return tokens, tag, expanded, ' '.join((str(token) for token in expanded))
+
+
+def outcome(lex, *args, **kwargs):
+    try:
+        return tuple(lex(*args, **kwargs)[:4])
+    except ValueError as e:
+        return str(e)
+
+
+VARIABLES = {'str': 3, 'dex': -1, 'MODE_x': 2, 'name': 'Zardoz'}
+
+
+@pytest.mark.parametrize('cmd', [
+    # tags
+    '1d20 #attack', '1d20#attack', '1d20 # attack roll', '1d20 ## two # marks',
+    '#only a tag', '1d6 #', '1d6+2#', '1d6 # tag with 1d6+2 and $str',
+    # element-wise operators
+    '3d6 .+ 1', '3d6.-1', '3d6 . + 1', '1.5d6', '3d6.+.-1', '4d6 .+ (1d4)',
+    # comparisons
+    '1d6 == 3', '1d6 = 3', '1d6=3', '1d6===3', '1d6====3', '1d6 <= 3', '1d6< =3',
+    '1d6>=3', '1d6<3|1d6>3',
+    # variables
+    '1d20 + $str', '1d20+$dex', '$str d6', '1d20 + $$str', '1d20 + $MODE_x',
+    '1d20 + $nope', '1d20 + $name', '$nope + $name', '$name + $nope',
+    '1d20 + $', '1d20 + $nope # tagged', '1d20 + $str$dex',
+    # the default die
+    'r', 'r + 1', 'r<=45 # shoot', '2r', 'rr', 'r r', '(r)', '$r',
+    # whitespace
+    '', '   ', '\t1d6 \n+\t2 ', 'd%  +  1',
+])
+@pytest.mark.parametrize('mode', list(GameMode))
+def test_lex_matches_tokenizer(cmd, mode):
+    assert outcome(lex_roll, cmd, mode=mode, variables=VARIABLES) == \
+           outcome(old_lex_roll, cmd, mode=mode, variables=VARIABLES)
+
+
+@pytest.mark.parametrize('cmd', [
+    '1d20 #attack', '1d20', '1d20 #', '1d20 + $nope', '1d20 + $nope # tag',
+    '1d20 + $name', '#',
+])
+def test_lex_error_order(cmd):
+    # A missing tag is reported before a bad variable
+    assert outcome(lex_roll, cmd, variables=VARIABLES, require_tag=True) == \
+           outcome(old_lex_roll, cmd, variables=VARIABLES, require_tag=True)
+
+
+def test_lex_words():
+    assert outcome(lex_roll, ['1d20', '+$str', '#', 'to', 'hit'], variables=VARIABLES) == \
+           outcome(old_lex_roll, ['1d20', '+$str', '#', 'to', 'hit'], variables=VARIABLES)
+
+
+def peak_allocated(func, *args, **kwargs):
+    func(*args, **kwargs)
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(5):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            func(*args, **kwargs)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        return min(peaks)
+    finally:
+        tracemalloc.stop()
+
+
+def test_lex_allocates_less():
+    cmd = ' + '.join(['(2d6)d(2d6) - r <= 1d100'] * 16) + ' # everything at once'
+    assert peak_allocated(lex_roll, cmd) < peak_allocated(old_lex_roll, cmd)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""Tests for the roll worker pool of `zardoz`."""
+
+import asyncio
+import time
+
+import pytest
+
+from zardoz.pool import RollPool
+
+
+def test_timeout_stays_pending():
+    pool = RollPool(workers=1, max_pending=1, timeout=0.1)
+
+    async def run():
+        with pytest.raises(ValueError) as e:
+            await pool.run(time.sleep, 1)
+        assert 'gave up after 0.1s' in str(e.value)
+        # The worker is still sleeping, so there's no room for another task
+        assert pool.pending == 1
+        with pytest.raises(ValueError) as e:
+            await pool.run(abs, -1)
+        assert 'as fast as I can' in str(e.value)
+
+        await asyncio.sleep(1.5)
+        assert pool.pending == 0
+        assert await pool.run(abs, -1) == 1
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.close()
+
+
+def test_close_cancels_queued():
+    pool = RollPool(workers=1, max_pending=8, timeout=5)
+
+    async def run():
+        tasks = [asyncio.ensure_future(pool.run(time.sleep, 0.5)) for _ in range(6)]
+        await asyncio.sleep(0.1)
+        pool.close()
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        cancelled = [r for r in results if isinstance(r, asyncio.CancelledError)]
+        # One task is running, and the executor hands at most two more to
+        # the worker ahead of time
+        assert len(cancelled) >= len(tasks) - 3
+        assert results.count(None) == len(results) - len(cancelled)
+
+        await asyncio.sleep(0)
+        assert pool.pending == 0
+        assert pool.futures == set()
+
+    asyncio.run(run())
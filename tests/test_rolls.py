@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Tests for the roll handling of `zardoz`, without discord."""
+
+from dataclasses import replace
+import logging
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from zardoz.database import ZardozDatabase
+from zardoz.dice import parse_cache, roll
+from zardoz.rolls import (compile_roll, evaluate_compiled_roll, evaluate_roll,
+                          evaluate_stats, variable_error)
+
+
+def test_stats():
+    report = evaluate_stats('3d6t + $str #damage', {'str': 2})
+    assert report.tag == 'damage'
+    assert report.expr == '3d6t+2'
+    assert report.odds.startswith('mean: 12.50, sd: 2.96, range: 5..20')
+
+    report = evaluate_stats('1d20 >= 11')
+    assert report.odds == 'P(success): 50.00%, mean margin: 5.00'
+
+
+def test_stats_pool():
+    # More dice than a single roll allows, as /zr would roll them
+    report = evaluate_stats('200d10t')
+    assert report.odds.startswith('mean: 1100.00, sd: 40.62, range: 200..2000')
+
+
+@pytest.mark.parametrize('roll,error', [
+    ('3d6 > 2d8', 'Element-wise comparison requires lists of equal length'),
+    ('64d1000^32', 'Exact distributions of selections this large are not supported.'),
+    ('64d1000t * 100', 'Too many outcomes to work out exactly!'),
+    ('4d6 + (64d6x)x', 'Too many dice!'),
+    ('$x + 1', 'that variable isn\'t defined'),
+])
+def test_stats_refused(roll, error):
+    with pytest.raises(ValueError) as e:
+        evaluate_stats(roll)
+    assert error in str(e.value)
+
+
+@pytest.mark.parametrize('roll', [
+    '4d6^3t + $str #attack',
+    'r + $dex',
+    '2d20h1 >= 10 + $str',
+    '6d6x6 | 1d6',
+    '3d6 + 4',
+])
+def test_compiled_roll(roll):
+    variables = {'str': 3, 'dex': 1}
+    compiled = compile_roll(roll, variables)
+
+    random.seed(roll)
+    report = evaluate_roll(roll, variables)
+    random.seed(roll)
+    compiled_report = evaluate_compiled_roll(compiled, variables)
+
+    # The summary holds the reprs of the results
+    assert replace(report, summary=None) == replace(compiled_report, summary=None)
+
+
+def test_compiled_roll_variables():
+    compiled = compile_roll('1d20 + $str + $dex', {'str': 3, 'dex': 1})
+    assert compiled.variables == {'str', 'dex'}
+    assert compiled.bind({'str': 2, 'dex': 0}) == (['1d20', '+', 2, '+', 0], '1d20 + 2 + 0')
+
+    with pytest.raises(ValueError) as e:
+        compiled.bind({'str': 2})
+    assert str(e.value) == variable_error('dex', {'str': 2})
+    assert 'isn\'t defined: `dex`' in str(e.value)
+
+    with pytest.raises(ValueError) as e:
+        compiled.bind({'str': 2, 'dex': 'MODE'})
+    assert str(e.value) == 'Non-integer variable!'
+
+
+def test_compiled_roll_spans():
+    # The cache holds a tree parsed from another spelling of the template
+    parse_cache.clear()
+    roll('1d20  /  $z', variables={'z': 1})
+    compiled = compile_roll('1d20 / $z', {'z': 0})
+
+    parse_cache.clear()
+    with pytest.raises(ValueError) as e:
+        evaluate_compiled_roll(compiled, {'z': 0})
+    assert 'Division by zero' in str(e.value)
+    assert 'at char 7' in str(e.value)
+
+
+def test_compiled_roll_refused():
+    with pytest.raises(ValueError) as e:
+        compile_roll('1d20 + $a!b', {'a!b': 1})
+    assert 'letters, digits and _' in str(e.value)
+
+    with pytest.raises(ValueError) as e:
+        compile_roll('4d6 + (64d6x)x')
+    assert 'Too many dice!' in str(e.value)
+
+
+def test_invalidate_macros():
+    db = SimpleNamespace(log=logging.getLogger(), compiled_macros={
+        (1, 'attack'): compile_roll('1d20 + $str', {'str': 3}),
+        (1, 'sneak'): compile_roll('1d20 + $dex', {'dex': 1}),
+        (0, 'fireball'): compile_roll('8d6'),
+    })
+
+    ZardozDatabase.invalidate_macros(db, 'str')
+    assert set(db.compiled_macros) == {(1, 'sneak'), (0, 'fireball')}
+    ZardozDatabase.invalidate_macros(db, 'con')
+    assert set(db.compiled_macros) == {(1, 'sneak'), (0, 'fireball')}
+    ZardozDatabase.invalidate_macros(db)
+    assert db.compiled_macros == {}
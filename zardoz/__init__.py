@@ -15,6 +15,18 @@ __splash__ = f'''
 __about__ = 'A discord dice-rolling bot with lots of nifty features.'
 __testing__ = bool(os.environ.get('ZARDOZ_DEBUG', False))
 
-from .cli import main
-from . import cogs
-from . import dice
+# The bot (cli, cogs, and through them discord.py) is only imported when it's
+# used, so that zardoz.dice can be imported on its own without paying for it.
+LAZY_SUBMODULES = ('cli', 'cogs', 'dice')
+
+
+def main():
+    from .cli import main
+    return main()
+
+
+def __getattr__(name):
+    if name in LAZY_SUBMODULES:
+        import importlib
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
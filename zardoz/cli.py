@@ -32,6 +32,7 @@ import textwrap
 from discord.ext import commands
 
 from . import __version__, __splash__, __about__, __testing__
+from .state import ROLL_POOL_WORKERS
 from .utils import default_log_file, default_database_dir, SYNTAX
 
 
@@ -46,6 +47,7 @@ class Bot(commands.Bot):
         log = logging.getLogger()
         log.info('DatabaseCache close()')
         await self.DB.close()
+        self.pool.close()
         log.info('Bot close()')
         await super().close()
         log.info('Bot closed.')
@@ -73,6 +75,12 @@ def add_parser_args(parser, token_name='ZARDOZ_TOKEN'):
         help='Path to the log file. Default follows the '\
              'XDG specifiction.'
     )
+    parser.add_argument(
+        '--roll-workers',
+        type=int,
+        default=ROLL_POOL_WORKERS,
+        help='Number of worker processes for evaluating rolls.'
+    )
 
 
 def main():
@@ -118,11 +126,14 @@ def build_bot(args, token_name='ZARDOZ_TOKEN', prefix='z', loop=None):
 
     from .database import DatabaseCache
     from .logging import setup as setup_logger
+    from .pool import RollPool
     
     from .cogs.history import HistoryCommands
+    from .cogs.macro import MacroCommands
     from .cogs.mode import ModeCommands
     from .cogs.roll import RollCommands
     from .cogs.sample import SampleCommands
+    from .cogs.stats import StatsCommands
     from .cogs.vars import VarCommands
 
     log = setup_logger(args.log)
@@ -146,11 +157,17 @@ def build_bot(args, token_name='ZARDOZ_TOKEN', prefix='z', loop=None):
     bot = Bot(command_prefix=prefix, loop=loop)
     bot.DB = DB
 
-    bot.add_cog(RollCommands(bot, DB))
+    # start the roll workers before the bot connects
+    pool = RollPool(workers=args.roll_workers)
+    bot.pool = pool
+
+    bot.add_cog(RollCommands(bot, DB, pool))
     bot.add_cog(VarCommands(bot, DB))
+    bot.add_cog(MacroCommands(bot, DB, pool))
     bot.add_cog(ModeCommands(bot, DB))
     bot.add_cog(HistoryCommands(bot, DB))
     bot.add_cog(SampleCommands(bot, DB))
+    bot.add_cog(StatsCommands(bot, DB, pool))
 
     return bot, DB
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (c) Camille Scott, 2021
+# File   : macro.py
+# License: MIT
+# Author : Camille Scott <camille.scott.w@gmail.com>
+# Date   : 22.02.2021
+
+import re
+
+from discord.ext import commands
+
+from ..database import fetch_guild_db
+from ..logging import LoggingMixin
+from ..rolls import compile_roll
+
+
+MACRO_NAME = re.compile(r'\w+')
+
+
+class MacroCommands(commands.Cog, LoggingMixin):
+
+    def __init__(self, bot, db, pool):
+        self.bot = bot
+        self.db = db
+        self.pool = pool
+
+        super().__init__()
+
+    async def save(self, ctx, member_id, name, roll):
+        if not MACRO_NAME.fullmatch(name):
+            await ctx.message.reply(f'Macro names are letters, digits and _, not `{name}`.')
+            return
+
+        # Compiled now, so a broken macro is refused before it's saved
+        try:
+            compiled = await self.pool.run(compile_roll, roll, ctx.variables,
+                                           game_mode=ctx.game_mode)
+        except ValueError as e:
+            self.log.error(f'Macro compile failed: {e}')
+            await ctx.message.reply(f'You fucked up your macro, {ctx.author}. {e}')
+        else:
+            await ctx.guild_db.set_macro(member_id, name, roll, compiled)
+            await ctx.send(f'**@{name}** = `{roll}`')
+
+    @commands.group(name='macro')
+    async def macro(self, ctx):
+        '''
+        Manage roll macros, rolled with /zr @name.
+        '''
+        if ctx.invoked_subcommand is None:
+            pass
+
+    @macro.command(name='list')
+    @fetch_guild_db
+    async def macro_list(self, ctx):
+        '''
+        List your macros and the server's.
+        '''
+        macros = await ctx.guild_db.get_macros()
+        result = [f'**@{name}**: `{roll}`' + (' (server)' if member_id == 0 else '')
+                  for (member_id, name), roll in sorted(macros.items())
+                  if member_id in (0, ctx.author.id)]
+        if result:
+            await ctx.send('\n'.join(result))
+        else:
+            await ctx.send('**No macros set.**')
+
+    @macro.command(name='set')
+    @fetch_guild_db
+    async def macro_set(self, ctx, name: str, *, roll: str):
+        '''
+        Set one of your macros.
+        '''
+        await self.save(ctx, ctx.author.id, name, roll)
+
+    @macro.command(name='gset')
+    @fetch_guild_db
+    async def macro_gset(self, ctx, name: str, *, roll: str):
+        '''
+        Set a macro for the whole server.
+        '''
+        await self.save(ctx, 0, name, roll)
+
+    @macro.command(name='get')
+    @fetch_guild_db
+    async def macro_get(self, ctx, name: str):
+        '''
+        Get the roll of the given macro.
+        '''
+        _, roll = await ctx.guild_db.get_macro(ctx.author.id, name)
+        if roll is None:
+            await ctx.send(f'**@{name}** is not defined.')
+        else:
+            await ctx.send(f'**@{name}** = `{roll}`')
+
+    @macro.command(name='del')
+    @fetch_guild_db
+    async def macro_del(self, ctx, name: str):
+        '''
+        Delete one of your macros.
+        '''
+        await ctx.guild_db.del_macro(ctx.author.id, name)
+        await ctx.send(f'**@{name}** deleted')
+
+    @macro.command(name='gdel')
+    @fetch_guild_db
+    async def macro_gdel(self, ctx, name: str):
+        '''
+        Delete a macro of the server.
+        '''
+        await ctx.guild_db.del_macro(0, name)
+        await ctx.send(f'**@{name}** deleted')
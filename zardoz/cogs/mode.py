@@ -12,7 +12,7 @@ from discord.ext import commands
 
 from ..database import fetch_guild_db
 from ..logging import LoggingMixin
-from ..state import GameMode, MODE_META
+from ..state import GameMode, LIMIT_NAMES, MODE_META
 
 
 class ModeConvert(commands.Converter):
@@ -62,3 +62,23 @@ class ModeCommands(commands.Cog, LoggingMixin):
         modes = '\n'.join((f'{mode.name}: {MODE_META[mode]}' for mode in GameMode))
         await ctx.message.reply(modes)
 
+    @mode.command(name='limits')
+    @fetch_guild_db
+    async def limits(self, ctx, name: typing.Optional[str], val: typing.Optional[int]):
+        '''
+        Get the limits on each roll for this server, or lower one of them:
+        steps, dice or ms.
+        '''
+        if name is not None:
+            try:
+                await ctx.guild_db.set_guild_limit(name, val or 0)
+            except ValueError as e:
+                await ctx.message.reply(f'{e}')
+                return
+            ctx.roll_limits = await ctx.guild_db.get_guild_limits()
+
+        shown = []
+        for limit, key in LIMIT_NAMES.items():
+            val = ctx.roll_limits[key]
+            shown.append(f'{limit}: {val * 1000:g}' if limit == 'ms' else f'{limit}: {val}')
+        await ctx.message.reply('**Roll Limits:** ' + ', '.join(shown))
@@ -14,18 +14,41 @@ from discord.ext import commands
 from ..database import fetch_guild_db
 from ..logging import LoggingMixin
 from ..rolls import (RollHandler, QuietRollHandler, SekretRollHandler, RerollHandler,
-                    tokenize_roll)
+                    fetch_macro, tokenize_roll)
 from ..utils import handle_http_exception
 
 
 class RollCommands(commands.Cog, LoggingMixin):
 
-    def __init__(self, bot, db):
+    def __init__(self, bot, db, pool):
         self.bot = bot
         self.db = db
+        self.pool = pool
 
         super().__init__()
 
+    async def submit(self, handler, ctx, args, **kwargs):
+        """Submits a roll to the pool, or the compiled macro named by a
+        leading @, as in `@lasgun # at the ork`."""
+
+        if not args.startswith('@'):
+            return await handler.submit(self.pool, ctx, self.log, ctx.variables, args,
+                                        game_mode=ctx.game_mode, limits=ctx.roll_limits,
+                                        **kwargs)
+
+        tokens, tag = tokenize_roll(args)
+        if len(tokens) != 1:
+            raise ValueError('A macro goes by itself, with a tag if you like: `@name # tag`.')
+        compiled = await fetch_macro(self.pool, ctx.guild_db, ctx.author.id, tokens[0][1:],
+                                     ctx.variables, game_mode=ctx.game_mode)
+        if kwargs.get('require_tag') and not (tag or compiled.tag):
+            raise ValueError('Add a tag, it\'s the polite thing to do.')
+
+        return await handler.submit_compiled(self.pool, ctx, self.log, ctx.variables,
+                                             compiled, tag=tag,
+                                             game_mode=ctx.game_mode,
+                                             limits=ctx.roll_limits)
+
     @commands.command(name='r', aliases=['roll'])
     @fetch_guild_db
     @handle_http_exception
@@ -36,8 +59,7 @@ class RollCommands(commands.Cog, LoggingMixin):
         '''
 
         try:
-            roll = RollHandler(ctx, self.log, ctx.variables, args,
-                               game_mode=ctx.game_mode)
+            roll = await self.submit(RollHandler, ctx, args)
         except ValueError as e:
             self.log.error(f'Roll handling failed: {e}')
             await ctx.message.reply(f'You fucked up your roll, {ctx.author}. {e}')
@@ -54,8 +76,7 @@ class RollCommands(commands.Cog, LoggingMixin):
         in the source channel.
         '''
         try:
-            roll = QuietRollHandler(ctx, self.log, ctx.variables, args,
-                                    game_mode=ctx.game_mode)
+            roll = await self.submit(QuietRollHandler, ctx, args)
         except ValueError as e:
             self.log.error(f'Roll handling failed: {e}')
             await ctx.message.reply(f'You fucked up your roll, {ctx.author}. {e}')
@@ -75,8 +96,7 @@ class RollCommands(commands.Cog, LoggingMixin):
             member = ctx.author
 
         try:
-            roll = SekretRollHandler(ctx, self.log, ctx.variables, args,
-                                     game_mode=ctx.game_mode, require_tag=True)
+            roll = await self.submit(SekretRollHandler, ctx, args, require_tag=True)
         except ValueError as e:
             self.log.error(f'Roll handling failed: {e}')
             await ctx.author.send(f'You fucked up your roll, {ctx.author}. {e}')
@@ -107,8 +127,14 @@ class RollCommands(commands.Cog, LoggingMixin):
                 tag = saved['tag']
             tag = '# ' + tag
 
-            roll = RerollHandler(ctx, self.log, ctx.variables, cmd + tag,
-                                 game_mode=ctx.game_mode)
+            try:
+                roll = await RerollHandler.submit(self.pool, ctx, self.log, ctx.variables,
+                                                  cmd + tag, game_mode=ctx.game_mode,
+                                                  limits=ctx.roll_limits)
+            except ValueError as e:
+                self.log.error(f'Reroll handling failed: {e}')
+                await ctx.message.reply(f'You fucked up your reroll, {ctx.author}. {e}')
+                return
 
             if member == ctx.author:
                 target = 'self'
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (c) Camille Scott, 2021
+# File   : stats.py
+# License: MIT
+# Author : Camille Scott <camille.scott.w@gmail.com>
+# Date   : 17.10.2026
+
+from discord.ext import commands
+
+from ..database import fetch_guild_db
+from ..logging import LoggingMixin
+from ..rolls import StatsHandler
+from ..utils import handle_http_exception
+
+
+class StatsCommands(commands.Cog, LoggingMixin):
+
+    def __init__(self, bot, db, pool):
+        self.bot = bot
+        self.db = db
+        self.pool = pool
+
+        super().__init__()
+
+    @commands.command(name='stats', aliases=['odds'])
+    @fetch_guild_db
+    @handle_http_exception
+    async def stats(self, ctx, *, args):
+        '''
+        Report the exact odds of a dice roll without rolling it: mean,
+        standard deviation and percentiles, or the chance of success
+        of a comparison.
+        '''
+
+        try:
+            stats = await StatsHandler.submit(self.pool, ctx, self.log, ctx.variables, args,
+                                              game_mode=ctx.game_mode)
+        except ValueError as e:
+            self.log.error(f'Stats handling failed: {e}')
+            await ctx.message.reply(f'You fucked up your roll, {ctx.author}. {e}')
+        else:
+            await ctx.message.reply(stats.msg())
@@ -11,13 +11,15 @@ import aiosql
 import aiosqlite
 
 import asyncio
+from collections import OrderedDict
 from datetime import datetime
 import functools
 import os
 import sqlite3
 
+from .dice.cache import CacheInfo
 from .logging import LoggingMixin
-from .state import GameMode
+from .state import GameMode, LIMIT_NAMES, ROLL_LIMITS, STATE_CACHE_MEMBERS
 from .utils import ZARDOZ_PKG_DIR
 
 
@@ -48,18 +50,106 @@ class DatabaseCache(LoggingMixin):
             self.cache[guild_id] = db
         return db
 
+    def info(self):
+        """Returns the counters of the guild state caches, summed"""
+        infos = [db.state.info() for db in self.cache.values()]
+        return CacheInfo(*(sum(counts) for counts in zip(*infos))) if infos \
+               else CacheInfo(0, 0, 0, 0, 0)
+
     async def close(self):
+        info = self.info()
+        self.log.info(f'Guild state cache: {info}')
         self.log.info(f'Closing {len(self.cache)} database connections.')
         for guild_id, db in self.cache.items():
             await db.close()
 
 
+class GuildState(LoggingMixin):
+    """A write-through cache of a guild's state: its vars, which hold its
+    mode too, under None, and the user vars of its most recently
+    active members, under their ids. Writes update the cached vars in place,
+    and concurrent misses on the same key wait on a single load."""
+
+    def __init__(self, max_members=STATE_CACHE_MEMBERS):
+        self.max_members = max_members
+        self.hits = self.misses = self.evictions = 0
+        self._vars = OrderedDict()
+        self._loading = {}
+        self._writes = 0
+
+        super().__init__()
+
+    async def get(self, key, load):
+        """Returns the vars cached under key, awaiting load() for them on a
+        miss. The dict returned is the cached one, and is not to be changed."""
+        cached = self._vars.get(key)
+        if cached is not None:
+            self._vars.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, load))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        # A waiter being cancelled doesn't cancel the load for the others
+        return await asyncio.shield(task)
+
+    async def _load(self, key, load):
+        while True:
+            writes = self._writes
+            loaded = await load()
+            # Loaded from before a write, which may have missed it
+            if writes == self._writes:
+                break
+
+        self._vars[key] = loaded
+        self._vars.move_to_end(key)
+        # The guild's own vars are never evicted
+        while len(self._vars) > self.max_members + (None in self._vars):
+            evicted = next(k for k in self._vars if k is not None)
+            del self._vars[evicted]
+            self.evictions += 1
+        return loaded
+
+    def set(self, key, var, val):
+        self._writes += 1
+        if key in self._vars:
+            self._vars[key][var] = val
+
+    def delete(self, key, var):
+        self._writes += 1
+        if key in self._vars:
+            self._vars[key].pop(var, None)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def info(self):
+        """Returns the hit, miss and eviction counters of the cache"""
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         len(self._vars), self.max_members + 1)
+
+
 class ZardozDatabase(LoggingMixin):
 
     def __init__(self, con, guild_id, async_mode=True):
         self.con = con
         self.con.row_factory = sqlite3.Row
         self.guild_id = guild_id
+        # Macro rolls by (member_id, name), where member 0 is the guild,
+        # loaded on first use; and their compiled forms, compiled on first
+        # use and dropped whenever something they were compiled from changes
+        self.macros = None
+        self.compiled_macros = {}
+        # The limits the guild has set, by name, loaded on first use; kept
+        # apart from its vars so they can't be read or changed as vars
+        self.limits = None
+        self.state = GuildState()
 
         if async_mode:
             self.cmds = load_sql_commands()
@@ -131,20 +221,28 @@ class ZardozDatabase(LoggingMixin):
         return roll
 
     async def get_merged_vars(self, member_id: int):
-        user_vars = await self.get_user_vars(member_id)
         guild_vars = await self.get_guild_vars()
-        guild_vars.update(user_vars)
+        guild_vars.update(await self.state.get(member_id,
+                                               functools.partial(self.load_user_vars, member_id)))
         return guild_vars
 
     async def set_user_var(self, member_id: int, var: str, val: int):
         await self.set_user_var_cmd(member_id=member_id, var=var, val=val)
         await self.con.commit()
+        self.state.set(member_id, var, val)
+        self.invalidate_macros(var)
 
     async def get_user_var(self, member_id: int, var: str):
-        result = await self.get_user_var_cmd(member_id=member_id, var=var)
-        return result['val'] if result else None
+        user_vars = await self.state.get(member_id,
+                                         functools.partial(self.load_user_vars, member_id))
+        return user_vars.get(var)
     
     async def get_user_vars(self, member_id: int):
+        user_vars = await self.state.get(member_id,
+                                         functools.partial(self.load_user_vars, member_id))
+        return dict(user_vars)
+
+    async def load_user_vars(self, member_id: int):
         user_vars = {}
         async with self.get_user_vars_cursor_cmd(member_id=member_id) as cur:
             async for row in cur:
@@ -154,16 +252,24 @@ class ZardozDatabase(LoggingMixin):
     async def del_user_var(self, member_id: int, var: str):
         await self.del_user_var_cmd(member_id=member_id, var=var)
         await self.con.commit()
+        self.state.delete(member_id, var)
+        self.invalidate_macros(var)
 
     async def set_guild_var(self, member_id: int, var: str, val: int):
         await self.set_guild_var_cmd(member_id=member_id, var=var, val=val)
         await self.con.commit()
+        self.state.set(None, var, val)
+        self.invalidate_macros(var)
 
     async def get_guild_var(self, var: str):
-        result = await self.get_guild_var_cmd(var=var)
-        return result['val'] if result else None
+        guild_vars = await self.state.get(None, self.load_guild_vars)
+        return guild_vars.get(var)
     
     async def get_guild_vars(self):
+        guild_vars = await self.state.get(None, self.load_guild_vars)
+        return dict(guild_vars)
+
+    async def load_guild_vars(self):
         guild_vars = {}
         async with self.get_guild_vars_cursor_cmd() as cur:
             async for row in cur:
@@ -173,6 +279,8 @@ class ZardozDatabase(LoggingMixin):
     async def del_guild_var(self, var: str):
         await self.del_guild_var_cmd(var=var)
         await self.con.commit()
+        self.state.delete(None, var)
+        self.invalidate_macros(var)
     
     async def set_guild_mode(self, mode: GameMode):
         if not isinstance(mode, GameMode):
@@ -181,6 +289,8 @@ class ZardozDatabase(LoggingMixin):
             except KeyError:
                 raise ValueError(f'{mode} is not a valid GameMode')
         await self.set_guild_var(0, 'MODE', mode)
+        # The mode's die is compiled into every macro using `r`
+        self.invalidate_macros()
 
     async def get_guild_mode(self):
         mode = await self.get_guild_var('MODE')
@@ -190,6 +300,77 @@ class ZardozDatabase(LoggingMixin):
             await self.set_guild_mode(GameMode.DEFAULT)
             return GameMode.DEFAULT
 
+    async def set_guild_limit(self, name: str, val: int):
+        if name not in LIMIT_NAMES:
+            raise ValueError(f'{name} is not a valid limit, try one of: '
+                             f'{", ".join(LIMIT_NAMES)}')
+        key = LIMIT_NAMES[name]
+        most = ROLL_LIMITS[key] * 1000 if name == 'ms' else ROLL_LIMITS[key]
+        if not 0 < val <= most:
+            raise ValueError(f'The {name} limit must be between 1 and {most:g}')
+        await self.set_guild_limit_cmd(name=name, val=val)
+        await self.con.commit()
+        if self.limits is not None:
+            self.limits[name] = val
+
+    async def get_guild_limits(self):
+        if self.limits is None:
+            guild_limits = {}
+            async with self.get_guild_limits_cursor_cmd() as cur:
+                async for row in cur:
+                    guild_limits[row['name']] = row['val']
+            self.limits = guild_limits
+
+        limits = dict(ROLL_LIMITS)
+        for name, val in self.limits.items():
+            if name in LIMIT_NAMES:
+                key = LIMIT_NAMES[name]
+                limits[key] = val / 1000 if name == 'ms' else val
+        return limits
+
+    async def get_macros(self):
+        if self.macros is None:
+            macros = {}
+            async with self.get_macros_cursor_cmd() as cur:
+                async for row in cur:
+                    macros[(row['member_id'], row['name'])] = row['roll']
+            self.macros = macros
+        return self.macros
+
+    async def get_macro(self, member_id: int, name: str):
+        """Returns the key and roll of the macro a member gets by name: their
+        own, or else the guild's (member 0). Both are None if neither exists."""
+        macros = await self.get_macros()
+        for key in ((member_id, name), (0, name)):
+            if key in macros:
+                return key, macros[key]
+        return None, None
+
+    async def set_macro(self, member_id: int, name: str, roll: str, compiled=None):
+        await self.set_macro_cmd(member_id=member_id, name=name, roll=roll)
+        await self.con.commit()
+        macros = await self.get_macros()
+        macros[(member_id, name)] = roll
+        self.compiled_macros.pop((member_id, name), None)
+        if compiled is not None:
+            self.compiled_macros[(member_id, name)] = compiled
+
+    async def del_macro(self, member_id: int, name: str):
+        await self.del_macro_cmd(member_id=member_id, name=name)
+        await self.con.commit()
+        macros = await self.get_macros()
+        macros.pop((member_id, name), None)
+        self.compiled_macros.pop((member_id, name), None)
+
+    def invalidate_macros(self, var=None):
+        """Drops the compiled macros referencing var, or all of them."""
+        stale = [key for key, compiled in self.compiled_macros.items()
+                 if var is None or var in compiled.variables]
+        for key in stale:
+            del self.compiled_macros[key]
+        if stale:
+            self.log.info(f'Invalidated {len(stale)} compiled macros ({var}).')
+
 
 def fetch_guild_db(func):
 
@@ -198,6 +379,7 @@ def fetch_guild_db(func):
         ctx.guild_db = await self.db.get_guild_db(ctx.guild.id)
         ctx.game_mode = await ctx.guild_db.get_guild_mode()
         ctx.variables = await ctx.guild_db.get_merged_vars(ctx.author.id)
+        ctx.roll_limits = await ctx.guild_db.get_guild_limits()
         return await func(self, ctx, *args, **kwargs)
 
     return wrapper
@@ -4,23 +4,47 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 from pyparsing import ParseBaseException
 
+from . import compiler
+from . import cost
 from . import elements
 from . import grammar
+from . import optimize as optimizer
+from . import packed
+from . import parser
 from . import utilities
+from .cache import ParseCache, canonicalize
 from .constants import DiceExtreme
-from .exceptions import DiceBaseException, DiceException, DiceFatalException
+from .exceptions import (
+    DiceBaseException,
+    DiceException,
+    DiceFatalException,
+    DiceLimitException,
+)
+from .limits import Limits
 
 __all__ = [
     "roll",
     "roll_min",
     "roll_max",
+    "roll_many",
+    "distribution",
+    "compile",
+    "compiler",
+    "cost",
     "elements",
     "grammar",
+    "optimizer",
+    "packed",
+    "parser",
     "utilities",
     "command",
+    "parse_cache",
+    "canonicalize",
     "DiceBaseException",
     "DiceException",
     "DiceFatalException",
+    "DiceLimitException",
+    "Limits",
     "DiceExtreme",
 ]
 __author__ = "Sam Clements <sam@borntyping.co.uk>, " "Caleb Johnson <me@calebj.io>"
@@ -42,24 +66,110 @@ def roll_max(string, **kwargs):
     return _roll(string, force_extreme=DiceExtreme.EXTREME_MAX, **kwargs)
 
 
-def parse_expression(string):
-    return grammar.expression.parseString(string, parseAll=True)
+def compile(string, cache=True, parser=None):
+    """Parses a dice expression and compiles it for repeated rolling.
 
+    The returned CompiledExpression takes the same keyword arguments as
+    roll(), and returns plain ints and lists rather than elements."""
+    try:
+        ast = parse_expression(string, cache=cache, parser=parser, optimize=True)
+    except ParseBaseException as e:
+        raise DiceBaseException.from_other(e)
+
+    compiled = compiler.CompiledExpression(string, ast)
+    if cache:
+        parse = PARSERS[parser or DEFAULT_PARSER]
+        compiled.relocate = lambda e: parse_cache.relocate(e, string, parse)
+    return compiled
+
+
+def roll_many(string, n, rng=None, cache=True, parser=None, **kwargs):
+    """Parses a dice expression and rolls it n times at once, returning an
+    array of outcomes. See batch.roll_many for the other arguments."""
+    # NumPy is only needed here, so isn't imported with the package
+    from . import batch
 
-def _roll(string, single=True, raw=False, return_kwargs=False, **kwargs):
     try:
-        ast = parse_expression(string)
-        elements = list(ast)
+        ast = parse_expression(string, cache=cache, parser=parser)
+    except ParseBaseException as e:
+        raise DiceBaseException.from_other(e)
+
+    return batch.roll_many(ast, n, rng=rng, **kwargs)
+
+
+def distribution(string, cache=True, parser=None, **kwargs):
+    """Parses a dice expression and computes the exact distribution of its
+    value. See probability.distribution for the other arguments."""
+    from . import probability
+
+    try:
+        ast = parse_expression(string, cache=cache, parser=parser)
+    except ParseBaseException as e:
+        raise DiceBaseException.from_other(e)
+
+    return probability.distribution(ast, **kwargs)
+
+
+def _parse_uncached(string):
+    return grammar.get_expression().parseString(string, parseAll=True)
+
+
+# Both parsers build identical trees, so they share a cache.
+PARSERS = {
+    "pyparsing": _parse_uncached,
+    "precedence": parser.parse,
+}
+DEFAULT_PARSER = "pyparsing"
+
+parse_cache = ParseCache(_parse_uncached)
+
+
+def parse_expression(string, cache=True, parser=None, optimize=False):
+    """Parses a dice expression, returning its top-level elements.
+
+    parser selects one of PARSERS, defaulting to DEFAULT_PARSER. With
+    cache=True (the default) the tree comes from parse_cache, and may be
+    shared with other callers: evaluation never modifies it. With
+    optimize=True, the parts of the tree without dice are evaluated once,
+    see optimize.optimize."""
+    parse = PARSERS[parser or DEFAULT_PARSER]
+    if cache:
+        return parse_cache(string, parse, optimize=optimize)
+    elements = list(parse(string))
+    if optimize:
+        return optimizer.optimize(elements)
+    return elements
+
+
+def _roll(string, single=True, raw=False, return_kwargs=False, cache=True,
+          parser=None, optimize=None, **kwargs):
+    # Raw trees are returned as parsed unless asked otherwise
+    if optimize is None:
+        optimize = not raw
+
+    try:
+        result = parse_expression(
+            string, cache=cache, parser=parser, optimize=optimize
+        )
 
         if not raw:
-            elements = [element.evaluate_cached(**kwargs) for element in elements]
+            result = elements.Trace.evaluate(
+                result, keep_intermediates=False, **kwargs
+            ).results
 
         if single:
-            elements = utilities.single(elements)
+            result = utilities.single(result)
 
         if return_kwargs:
-            return elements, kwargs
-
-        return elements
+            return result, kwargs
+
+        return result
+    except DiceBaseException as e:
+        # A cached tree may have been parsed from another spelling
+        if cache and not raw:
+            raise parse_cache.relocate(
+                e, string, PARSERS[parser or DEFAULT_PARSER]
+            ) from None
+        raise
     except ParseBaseException as e:
         raise DiceBaseException.from_other(e)
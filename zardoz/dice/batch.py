@@ -0,0 +1,778 @@
+"""
+Evaluates a dice expression many times at once over NumPy arrays
+
+Each node is lowered, as in compiler.py, into a closure that produces a
+column of n outcomes: scalars become arrays of shape (n,), and dice become
+(n, amount) matrices. Lists whose length varies between rows, such as
+exploded dice, are kept padded, with the valid values at the start of each
+row and a separate array of row lengths.
+
+Nodes without a vectorized kernel fall back to rolling their compiled
+closure once per row.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from collections import namedtuple
+import random
+
+import numpy as np
+
+from . import compiler
+from .compiler import COMPARISONS, LIST, ROLL, SCALAR, Compiled, is_numeric, static_bounds
+from .constants import MAX_EXPLOSIONS, MAX_ROLL_DICE, DiceExtreme
+from .elements import (
+    Add,
+    AddEvenSubOdd,
+    Again,
+    Array,
+    Dice,
+    Div,
+    Element,
+    Equals,
+    Explode,
+    Extend,
+    ForceReroll,
+    GreaterThan,
+    GreaterThanEqual,
+    Highest,
+    Integer,
+    LessThan,
+    LessThanEqual,
+    Lowest,
+    Middle,
+    Modulo,
+    Mul,
+    Negate,
+    Reroll,
+    Sort,
+    Sub,
+    SuccessFail,
+    Successes,
+    Total,
+    Variable,
+    WildDice,
+)
+from .utilities import single
+
+Batch = namedtuple("Batch", "values lengths deltas")
+Batch.__new__.__defaults__ = (None, None)
+Batch.__doc__ = """The outcomes of a node over n rolls: an (n,) array for
+scalars, or an (n, width) array for lists, where only the first lengths[i]
+values of row i are valid (all of them if lengths is None). Comparisons keep
+their outcomes in values and the margins in deltas."""
+
+VECTORIZERS = {}
+
+
+class Context(object):
+    """The options a batch is evaluated with"""
+
+    def __init__(self, n, rng=None, force_extreme=None, max_dice=MAX_ROLL_DICE,
+                 variables=None):
+        self.n = n
+        self.rng = np.random.default_rng(rng)
+        self.force_extreme = force_extreme
+        self.max_dice = max_dice
+        self.variables = variables
+        self._random = None
+
+    @property
+    def random(self):
+        """A random.Random seeded from rng, for fallbacks"""
+        if self._random is None:
+            self._random = random.Random(int(self.rng.integers(2 ** 63)))
+        return self._random
+
+    def compiler_context(self):
+        return compiler.Context(
+            random=self.random, force_extreme=self.force_extreme,
+            max_dice=self.max_dice, variables=self.variables,
+        )
+
+
+def vectorizes(*classes):
+    """Registers a vectorized compiler for the given element classes"""
+
+    def register(func):
+        for cls in classes:
+            VECTORIZERS[cls] = func
+        return func
+
+    return register
+
+
+def valid(batch):
+    """Returns the mask of valid values of a list batch"""
+    values, lengths = batch.values, batch.lengths
+    if lengths is None:
+        return np.ones(values.shape, dtype=bool)
+    return np.arange(values.shape[1]) < lengths[:, None]
+
+
+def compact(values, mask, deltas=None):
+    """Moves the values selected by mask to the start of each row, keeping
+    their order"""
+    order = np.argsort(~mask, axis=1, kind="stable")
+    lengths = mask.sum(axis=1)
+    width = int(lengths.max()) if len(lengths) else 0
+    order = order[:, :width]
+
+    values = np.take_along_axis(values, order, axis=1)
+    if deltas is not None:
+        deltas = np.take_along_axis(deltas, order, axis=1)
+
+    if width and (lengths == width).all():
+        lengths = None
+    return Batch(values, lengths, deltas)
+
+
+def row_sums(batch):
+    if batch.values.ndim == 1:
+        return batch.values
+    elif batch.deltas is not None:
+        raise TypeError("Cannot convert a list of comparisons to an integer")
+    return np.where(valid(batch), batch.values, 0).sum(axis=1)
+
+
+def from_plain(results):
+    """Builds a batch from the plain results of a compiled closure"""
+    if all(isinstance(r, int) for r in results):
+        return Batch(np.array(results, dtype=np.int64))
+
+    lengths = np.array([len(r) for r in results])
+    width = int(lengths.max()) if len(lengths) else 0
+    values = np.zeros((len(results), width), dtype=np.int64)
+    deltas = None
+
+    if any(isinstance(x, tuple) for r in results for x in r):
+        values = values.astype(bool)
+        deltas = np.zeros((len(results), width), dtype=np.int64)
+
+    for i, row in enumerate(results):
+        for j, x in enumerate(row):
+            if deltas is None:
+                values[i, j] = x
+            else:
+                values[i, j], deltas[i, j] = x
+
+    if width and (lengths == width).all():
+        lengths = None
+    return Batch(values, lengths, deltas)
+
+
+def fallback(node):
+    """Vectorizes a node by rolling its compiled closure once per row"""
+    function = compiler.compile_node(node).function
+
+    def rows(ctx):
+        compiler_ctx = ctx.compiler_context()
+        return from_plain([function(compiler_ctx) for i in range(ctx.n)])
+
+    return Compiled(None, rows, None)
+
+
+def vectorize_node(node):
+    """Lowers an element into a Compiled closure over batches"""
+    if not isinstance(node, Element) or type(node) is Integer:
+        value = int(node)
+        return Compiled(SCALAR, lambda ctx: Batch(np.full(ctx.n, value, dtype=np.int64)), None)
+
+    for cls in type(node).__mro__:
+        if cls in VECTORIZERS:
+            compiled = VECTORIZERS[cls](node)
+            if compiled is not None:
+                return compiled
+            break
+
+    return fallback(node)
+
+
+def vectorize_scalar(node):
+    """Vectorizes a node whose value is coerced to an Integer, returning a
+    function giving an (n,) array"""
+    function = vectorize_node(node).function
+    return lambda ctx: row_sums(function(ctx))
+
+
+def operands(node):
+    return [vectorize_node(o) for o in node.original_operands]
+
+
+@vectorizes(Variable)
+def vectorize_variable(node):
+    def value(ctx):
+        value = int(node.evaluate(variables=ctx.variables))
+        return Batch(np.full(ctx.n, value, dtype=np.int64))
+
+    return Compiled(SCALAR, value, None)
+
+
+@vectorizes(Dice)
+def vectorize_dice(node):
+    if isinstance(node, WildDice):
+        return None
+
+    amount = vectorize_scalar(node.amount)
+    min_value = vectorize_scalar(node.min_value)
+    max_value = vectorize_scalar(node.max_value)
+
+    def roll(ctx):
+        n = amount(ctx)
+        low = min_value(ctx)
+        high = max_value(ctx)
+
+        if (n > ctx.max_dice).any():
+            raise node.fatal("Too many dice! (max is %i)" % ctx.max_dice)
+        elif (n < 0).any():
+            msg = "Cannot roll less than zero dice!"
+            if not isinstance(node.amount, int):
+                msg += " (%s evaluated to %s)" % (node.amount, n[n < 0][0])
+            raise node.fatal(msg)
+
+        width = int(n.max()) if ctx.n else 0
+        lengths = None if (n == width).all() else n
+        shape = (ctx.n, width)
+
+        if ctx.force_extreme is DiceExtreme.EXTREME_MIN:
+            return Batch(np.broadcast_to(low[:, None], shape).copy(), lengths)
+        elif ctx.force_extreme is DiceExtreme.EXTREME_MAX:
+            return Batch(np.broadcast_to(high[:, None], shape).copy(), lengths)
+
+        invalid = (low > high) & (n > 0)
+        if invalid.any():
+            i = np.flatnonzero(invalid)[0]
+            raise node.fatal(
+                "Roll must have a valid range (got %s - %s, "
+                "which evaluated to %i - %i). Are you trying to "
+                "use a fudge roll as the sides?"
+                % (node.min_value, node.max_value, low[i], high[i])
+            )
+
+        high = np.maximum(low, high)
+        values = ctx.rng.integers(low[:, None], high[:, None] + 1, size=shape)
+        return Batch(values, lengths)
+
+    return Compiled(ROLL, roll, node if static_bounds(node) else None)
+
+
+ARITHMETIC = {
+    Add: np.add,
+    Sub: np.subtract,
+    Mul: np.multiply,
+    Div: np.floor_divide,
+    Modulo: np.mod,
+}
+
+
+@vectorizes(*ARITHMETIC)
+def vectorize_arithmetic(node):
+    left = vectorize_node(node.original_operands[0])
+    if not is_numeric(left):
+        return None
+
+    func = ARITHMETIC[type(node)]
+    checks_zero = func in (np.floor_divide, np.mod)
+    rights = [vectorize_scalar(o) for o in node.original_operands[1:]]
+    left_fn = left.function
+    is_scalar = left.kind is SCALAR
+
+    def arithmetic(ctx):
+        batch = left_fn(ctx)
+        values = batch.values
+
+        for i, right in enumerate(rights):
+            scalar = right(ctx)
+
+            if checks_zero:
+                # Empty lists are never divided, so can't raise
+                zero = scalar == 0
+                if not is_scalar:
+                    zero &= valid(batch).any(axis=1)
+                if zero.any():
+                    raise compiler.division_by_zero(node, i + 1)
+
+                scalar = np.where(scalar == 0, 1, scalar)
+
+            values = func(values, scalar if is_scalar else scalar[:, None])
+
+        return Batch(values, batch.lengths)
+
+    return Compiled(SCALAR if is_scalar else LIST, arithmetic, None)
+
+
+def less_than(left, right):
+    result = left < right
+    return result, np.abs(right - left) + np.where(result, -1, 1)
+
+
+def greater_than(left, right):
+    result = left > right
+    return result, np.abs(right - left) + np.where(result, -1, 1)
+
+
+COMPARATORS = {
+    Equals: lambda left, right: (left == right, np.abs(right - left)),
+    LessThan: less_than,
+    LessThanEqual: lambda left, right: (left <= right, np.abs(right - left)),
+    GreaterThan: greater_than,
+    GreaterThanEqual: lambda left, right: (left >= right, np.abs(left - right)),
+}
+
+
+@vectorizes(*COMPARATORS)
+def vectorize_comparison(node):
+    if len(node.original_operands) != 2:
+        return None
+
+    left, right = operands(node)
+    if not is_numeric(left, right):
+        return None
+
+    impl = COMPARATORS[type(node)]
+    left_fn, right_fn = left.function, right.function
+    left_scalar, right_scalar = left.kind is SCALAR, right.kind is SCALAR
+
+    def comparison(ctx):
+        lhs, rhs = left_fn(ctx), right_fn(ctx)
+
+        if left_scalar and right_scalar:
+            values, deltas = impl(lhs.values[:, None], rhs.values[:, None])
+            return Batch(values, None, deltas)
+        elif left_scalar:
+            lengths = rhs.lengths
+            values, deltas = impl(lhs.values[:, None], rhs.values)
+        elif right_scalar:
+            lengths = lhs.lengths
+            values, deltas = impl(lhs.values, rhs.values[:, None])
+        else:
+            left_lengths, right_lengths = lengths_of(lhs), lengths_of(rhs)
+            if (left_lengths != right_lengths).any():
+                raise TypeError("Element-wise comparison requires lists of equal length")
+
+            width = min(lhs.values.shape[1], rhs.values.shape[1])
+            lengths = lhs.lengths if lhs.lengths is not None else rhs.lengths
+            values, deltas = impl(lhs.values[:, :width], rhs.values[:, :width])
+
+        return Batch(values, lengths, deltas)
+
+    return Compiled(COMPARISONS, comparison, None)
+
+
+def lengths_of(batch):
+    if batch.lengths is None:
+        return np.full(len(batch.values), batch.values.shape[1])
+    return batch.lengths
+
+
+@vectorizes(Total)
+def vectorize_total(node):
+    if len(node.original_operands) != 1:
+        return None
+
+    (operand,) = operands(node)
+    if not is_numeric(operand):
+        return None
+
+    function = operand.function
+    return Compiled(SCALAR, lambda ctx: Batch(row_sums(function(ctx))), None)
+
+
+def sort_rows(batch, keys=None):
+    """Sorts the valid values of each row, or orders them by keys"""
+    mask = valid(batch)
+    if keys is None:
+        keys = batch.values
+    # invalid values sort last, and ties keep their order
+    order = np.lexsort((keys, ~mask), axis=-1)
+    return np.take_along_axis(batch.values, order, axis=1)
+
+
+@vectorizes(Sort)
+def vectorize_sort(node):
+    if len(node.original_operands) != 1:
+        return None
+
+    (operand,) = operands(node)
+    if operand.kind not in (LIST, ROLL):
+        return None
+
+    function = operand.function
+
+    def sort(ctx):
+        batch = function(ctx)
+        return Batch(sort_rows(batch), batch.lengths)
+
+    return Compiled(operand.kind, sort, operand.element)
+
+
+def slice_index(index, lengths):
+    """Vectorized position of a Python slice index in lists of lengths"""
+    return np.where(index < 0, np.maximum(index + lengths, 0), np.minimum(index, lengths))
+
+
+def window(ctx, batch, start, stop):
+    """Keeps the values ranked start to stop in each row, in the order they
+    were rolled. Equal values rank in the order they were rolled."""
+    lengths = np.maximum(stop - start, 0)
+    width = int(lengths.max()) if ctx.n else 0
+
+    if width == 0:
+        return Batch(np.zeros((ctx.n, 0), dtype=np.int64), lengths)
+
+    # invalid values rank last, and ties keep their order
+    order = np.lexsort((batch.values, ~valid(batch)), axis=-1)
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(order.shape[1])[None, :], axis=1)
+    kept = (ranks >= start[:, None]) & (ranks < stop[:, None])
+
+    # kept values move to the front of each row, keeping their order
+    index = np.argsort(~kept, axis=1, kind="stable")[:, :width]
+    values = np.take_along_axis(batch.values, index, axis=1)
+
+    if (lengths == width).all():
+        return Batch(values, None)
+    return Batch(values, lengths)
+
+
+def lowest(ctx, batch, count):
+    num = lengths_of(batch)
+    if count is None:
+        count = num - 1
+    return window(ctx, batch, np.zeros_like(num), slice_index(count, num))
+
+
+def highest(ctx, batch, count):
+    num = lengths_of(batch)
+    if count is None:
+        count = num - 1
+    return window(ctx, batch, slice_index(-count, num), num)
+
+
+def middle(ctx, batch, count):
+    num = lengths_of(batch)
+
+    if count is None:
+        count = np.where(num > 2, num - 2, 1)
+    else:
+        count = np.where(count <= 0, count + num, count)
+
+    num_remove = num - count
+    upper = num_remove // 2
+    lower = num_remove - upper
+
+    # the two slice deletions happen one after the other
+    start = slice_index(lower, num)
+    stop = slice_index(-upper, num - start)
+    return window(ctx, batch, start, start + stop)
+
+
+def vectorize_selection(node, select):
+    if len(node.original_operands) > 2:
+        return None
+
+    operand = vectorize_node(node.original_operands[0])
+    if operand.kind not in (LIST, ROLL):
+        return None
+
+    function = operand.function
+    count = None
+    if len(node.original_operands) == 2:
+        count = vectorize_scalar(node.original_operands[1])
+
+    def selection(ctx):
+        batch = function(ctx)
+        return select(ctx, batch, None if count is None else count(ctx))
+
+    return Compiled(operand.kind, selection, operand.element)
+
+
+@vectorizes(Lowest)
+def vectorize_lowest(node):
+    return vectorize_selection(node, lowest)
+
+
+@vectorizes(Highest)
+def vectorize_highest(node):
+    return vectorize_selection(node, highest)
+
+
+@vectorizes(Middle)
+def vectorize_middle(node):
+    return vectorize_selection(node, middle)
+
+
+def as_rows(batch):
+    """Treats scalar batches as lists of one value"""
+    if batch.values.ndim == 1:
+        return Batch(batch.values[:, None])
+    return batch
+
+
+@vectorizes(Extend)
+def vectorize_extend(node):
+    compiled = operands(node)
+    if not is_numeric(*compiled):
+        return None
+
+    functions = [c.function for c in compiled]
+
+    def extend(ctx):
+        batches = [as_rows(f(ctx)) for f in functions]
+        values = np.concatenate([b.values for b in batches], axis=1)
+        mask = np.concatenate([valid(b) for b in batches], axis=1)
+        return compact(values, mask)
+
+    return Compiled(LIST, extend, None)
+
+
+@vectorizes(Array)
+def vectorize_array(node):
+    compiled = operands(node)
+    if not is_numeric(*compiled):
+        return None
+
+    functions = [c.function for c in compiled]
+
+    def array(ctx):
+        return Batch(np.stack([row_sums(f(ctx)) for f in functions], axis=1))
+
+    return Compiled(LIST, array, None)
+
+
+@vectorizes(Negate)
+def vectorize_negate(node):
+    (operand,) = operands(node)
+    if not is_numeric(operand):
+        return None
+
+    function = operand.function
+
+    def negate(ctx):
+        batch = function(ctx)
+        return Batch(-batch.values, batch.lengths)
+
+    kind = SCALAR if operand.kind is SCALAR else LIST
+    return Compiled(kind, negate, None)
+
+
+@vectorizes(AddEvenSubOdd)
+def vectorize_add_even_sub_odd(node):
+    (operand,) = operands(node)
+    if not is_numeric(operand):
+        return None
+
+    function = operand.function
+
+    def add_even_sub_odd(ctx):
+        batch = function(ctx)
+        values = batch.values
+        return Batch(np.where(values % 2, -values, values), batch.lengths)
+
+    return Compiled(operand.kind, add_even_sub_odd, operand.element)
+
+
+@vectorizes(Successes, SuccessFail)
+def vectorize_successes(node):
+    if len(node.original_operands) != 2:
+        return None
+
+    operand = vectorize_node(node.original_operands[0])
+    thresh = vectorize_scalar(node.original_operands[1])
+    function = operand.function
+    counting_fails = isinstance(node, SuccessFail)
+
+    if operand.kind is ROLL:
+        bounds = static_bounds(operand.element)
+        if bounds is None:
+            return None
+        fail_level, max_value = bounds
+        msg = "Success threshold higher than roll result."
+        if counting_fails:
+            msg = "Success threshold higher than maximum roll result."
+    elif operand.kind in (SCALAR, LIST):
+        fail_level, max_value, msg = 1, None, None
+    else:
+        return None
+
+    def successes(ctx):
+        batch = as_rows(function(ctx))
+        t = thresh(ctx)[:, None]
+
+        if max_value is not None and (t > max_value).any():
+            raise node.fatal(msg)
+
+        mask = valid(batch)
+        result = ((batch.values >= t) & mask).sum(axis=1)
+
+        if counting_fails:
+            result -= ((batch.values < t) & (batch.values <= fail_level) & mask).sum(axis=1)
+
+        return Batch(result)
+
+    return Compiled(SCALAR, successes, None)
+
+
+@vectorizes(Again)
+def vectorize_again(node):
+    if len(node.original_operands) > 2:
+        return None
+
+    operand = vectorize_node(node.original_operands[0])
+    if not is_numeric(operand):
+        return None
+
+    if len(node.original_operands) == 1:
+        bounds = static_bounds(operand.element) if operand.kind is ROLL else None
+        if bounds is None:
+            return None
+        target = lambda ctx: np.full(ctx.n, bounds[1])  # noqa: E731
+    else:
+        target = vectorize_scalar(node.original_operands[1])
+
+    function = operand.function
+
+    def again(ctx):
+        batch = as_rows(function(ctx))
+        values, mask = batch.values, valid(batch)
+        repeat = (values == target(ctx)[:, None]) & mask
+
+        # each value is followed by its repeat, if any
+        values = np.repeat(values, 2, axis=1)
+        mask = np.stack((mask, repeat), axis=2).reshape(values.shape)
+        return compact(values, mask)
+
+    kind = ROLL if operand.kind is ROLL else LIST
+    return Compiled(kind, again, operand.element)
+
+
+def roll_bounds(node):
+    """Vectorizes the roll operand of a dice operator, returning it and its
+    random element's bounds, or (None, None) if they aren't plain integers"""
+    if len(node.original_operands) > 2:
+        return None, None
+
+    operand = vectorize_node(node.original_operands[0])
+    bounds = static_bounds(operand.element)
+
+    if operand.kind is not ROLL or bounds is None:
+        return None, None
+
+    return operand, bounds
+
+
+def threshold(node, default):
+    if len(node.original_operands) == 1:
+        return lambda ctx: np.full(ctx.n, default)
+    return vectorize_scalar(node.original_operands[1])
+
+
+@vectorizes(Explode)
+def vectorize_explode(node):
+    operand, bounds = roll_bounds(node)
+    if operand is None or isinstance(operand.element, WildDice):
+        return None
+
+    min_value, max_value = bounds
+    if min_value == max_value:
+        return None
+
+    thresh = threshold(node, max_value)
+    function = operand.function
+    element = operand.element
+    orig_thresh = node.original_operands[-1]
+
+    def explode(ctx):
+        batch = function(ctx)
+        t = thresh(ctx)
+
+        if (t <= min_value).any():
+            offset = orig_thresh.location - node.location
+            msg = (
+                "Refusing to explode with threshold less than or equal to "
+                "the lowest possible roll."
+            )
+
+            if type(orig_thresh) is not Integer:
+                msg += " (%s evaluated to %s)" % (orig_thresh, t[t <= min_value][0])
+
+            raise node.fatal(msg, offset=offset)
+
+        rolled, mask = batch.values, valid(batch)
+        values, masks = [rolled], [mask]
+        explosions = 0
+
+        while mask.any():
+            explosions += 1
+
+            if explosions >= MAX_EXPLOSIONS:
+                raise node.fatal("Too many explosions!")
+
+            num_rerolls = ((rolled >= t[:, None]) & mask).sum(axis=1)
+            width = int(num_rerolls.max())
+            if width > ctx.max_dice:
+                raise element.fatal("Too many dice! (max is %i)" % ctx.max_dice)
+
+            rolled = ctx.rng.integers(min_value, max_value + 1, size=(ctx.n, width))
+            mask = np.arange(width) < num_rerolls[:, None]
+            values.append(rolled)
+            masks.append(mask)
+
+        return compact(np.concatenate(values, axis=1), np.concatenate(masks, axis=1))
+
+    return Compiled(ROLL, explode, element)
+
+
+@vectorizes(Reroll, ForceReroll)
+def vectorize_reroll(node):
+    operand, bounds = roll_bounds(node)
+    if operand is None:
+        return None
+
+    min_value, max_value = bounds
+    thresh = threshold(node, min_value)
+    function = operand.function
+    forced = isinstance(node, ForceReroll)
+
+    def reroll(ctx):
+        batch = function(ctx)
+        t = thresh(ctx)[:, None]
+        values = batch.values
+        rerolled = values <= t
+
+        if ctx.force_extreme is DiceExtreme.EXTREME_MIN:
+            new = min_value
+        elif ctx.force_extreme is DiceExtreme.EXTREME_MAX:
+            new = max_value
+        else:
+            low = np.minimum(max_value, t + 1) if forced else min_value
+            new = ctx.rng.integers(low, max_value + 1, size=values.shape)
+
+        return Batch(np.where(rerolled, new, values), batch.lengths)
+
+    return Compiled(ROLL, reroll, operand.element)
+
+
+def to_array(batch):
+    """Converts a batch to its result: a plain array, a masked array for
+    lists of varying length, or a structured (value, delta) array for
+    comparisons"""
+    values = batch.values
+
+    if batch.deltas is not None:
+        result = np.empty(values.shape, dtype=[("value", bool), ("delta", np.int64)])
+        result["value"], result["delta"] = values, batch.deltas
+        values = result
+
+    if batch.lengths is None:
+        return values
+    return np.ma.masked_array(values, mask=~valid(batch))
+
+
+def roll_many(elements, n, rng=None, force_extreme=None, max_dice=MAX_ROLL_DICE,
+              variables=None):
+    """Rolls parsed elements n times, returning an array of outcomes for each.
+    rng is a numpy.random.Generator, or a seed for one."""
+    ctx = Context(n, rng=rng, force_extreme=force_extreme, max_dice=max_dice,
+                  variables=variables)
+    return single([to_array(vectorize_node(e).function(ctx)) for e in elements])
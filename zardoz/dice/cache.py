@@ -0,0 +1,193 @@
+"""A bounded LRU cache of parsed dice expressions"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from collections import OrderedDict, namedtuple
+import re
+import threading
+
+from .constants import PARSE_CACHE_SIZE
+from .optimize import optimize as optimize_elements
+from .packed import pack, unpack
+
+CacheInfo = namedtuple("CacheInfo", "hits misses evictions currsize maxsize")
+
+_WHITESPACE = re.compile(r"\s+")
+_PERCENTILE = re.compile(r"([dwu])\s*%(?!\s*\d)")
+_VARIABLE = re.compile(r"\$[^\W\d]\w*")
+_VARIABLE_END = re.compile(r"\$[^\W\d]\w*$")
+
+
+def _char_class(char):
+    if char.isdigit():
+        return "digit"
+    elif char.isalpha():
+        return "alpha"
+    return "symbol"
+
+
+def _normalize(text):
+    return _PERCENTILE.sub(r"\g<1>100", text.lower())
+
+
+def canonicalize(string):
+    """Returns a normalized form of a dice expression, for use as a cache key.
+
+    Letters are lowercased, whitespace is dropped wherever it cannot change
+    how the expression tokenizes (it is kept as a single space between two
+    digits, two letters or two symbols, e.g. "1 0" or "< ="), and percentile
+    dice are spelled out ("d%" becomes "d100"). The names of variables are
+    case-sensitive, and are left as they are."""
+
+    string = string.strip()
+    if "$" in string:
+        parts, pos = [], 0
+        for match in _VARIABLE.finditer(string):
+            parts.append(_normalize(string[pos:match.start()]))
+            parts.append(match.group())
+            pos = match.end()
+        parts.append(_normalize(string[pos:]))
+        string = "".join(parts)
+    else:
+        string = _normalize(string)
+
+    def replace(match):
+        start, end = match.span()
+        before, after = string[start - 1], string[end]
+        if _char_class(before) == _char_class(after) and before not in "()" \
+           and after not in "()":
+            return " "
+        # A name would run on into what follows it
+        elif before == "$" or (
+            (after.isalnum() or after == "_") and _VARIABLE_END.search(string, 0, start)
+        ):
+            return " "
+        return ""
+
+    return _WHITESPACE.sub(replace, string)
+
+
+def _walk(elements):
+    """Yields the nodes of parsed trees, depth first"""
+    stack = list(reversed(elements))
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(getattr(node, "original_operands", ())))
+
+
+class ParseCache(object):
+    """Caches parsed expressions by their canonical form.
+
+    Evaluation records its results in a Trace rather than on the elements, so
+    every lookup of an expression returns the same tree, which may be
+    evaluated any number of times, concurrently. The optimized copy of each
+    tree is kept alongside it once it's asked for."""
+
+    def __init__(self, parse, maxsize=PARSE_CACHE_SIZE):
+        self.parse = parse
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._optimized = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, string, parse=None, optimize=False):
+        key = canonicalize(string)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if entry is None:
+            # Parse the string as given, so that error locations refer to the
+            # user's own input rather than to the canonical form. Later hits
+            # with other spellings get their errors moved by relocate().
+            entry = list((parse or self.parse)(string))
+
+            with self._lock:
+                self.misses += 1
+                if self.maxsize > 0:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    self._evict()
+
+        if optimize:
+            with self._lock:
+                optimized = self._optimized.get(key)
+
+            if optimized is None:
+                optimized = optimize_elements(entry)
+                with self._lock:
+                    if key in self._entries:
+                        self._optimized[key] = optimized
+            return list(optimized)
+
+        return list(entry)
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            key, _ = self._entries.popitem(last=False)
+            self._optimized.pop(key, None)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, string):
+        return canonicalize(string) in self._entries
+
+    def info(self):
+        """Returns the hit, miss and eviction counters of the cache"""
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions,
+                len(self._entries), self.maxsize
+            )
+
+    def clear(self):
+        """Empties the cache and resets its counters"""
+        with self._lock:
+            self._entries.clear()
+            self._optimized.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def relocate(self, exc, string, parse=None):
+        """Returns an exception raised while evaluating a cached tree, moved
+        from the string the tree was parsed from onto string, another
+        spelling of it. Both are parsed again to find where it was raised,
+        as trees of the same shape; exc is returned as it is if they can't
+        be matched up."""
+        if exc.pstr == string or canonicalize(exc.pstr) != canonicalize(string):
+            return exc
+
+        parse = parse or self.parse
+        try:
+            trees = list(parse(exc.pstr)), list(parse(string))
+        except Exception:
+            return exc
+
+        for old, new in zip(*map(_walk, trees)):
+            if getattr(old, "location", None) == exc.loc and hasattr(new, "location"):
+                return type(exc)(string, new.location, exc.msg)
+        return exc
+
+    def dump(self):
+        """Returns the cached expressions as packed trees, by canonical form,
+        least recently used first"""
+        with self._lock:
+            entries = list(self._entries.items())
+        return [(key, pack(entry)) for key, entry in entries]
+
+    def load(self, packed):
+        """Adds expressions returned by dump() to the cache, without parsing
+        them again"""
+        entries = [(key, unpack(p)) for key, p in packed]
+        with self._lock:
+            for key, entry in entries:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._optimized.pop(key, None)
+            self._evict()
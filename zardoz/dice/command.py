@@ -49,11 +49,12 @@ def main(argv=None):
         if verbose:
             print("Result: ", end="")
 
-        print(str(roll.evaluate_cached(**kwargs)))
+        trace = dice.elements.Trace()
+        print(str(roll.evaluate_cached(trace=trace, **kwargs)))
 
         if verbose:
             print("Breakdown:")
-            print(dice.utilities.verbose_print(roll, **kwargs))
+            print(dice.utilities.verbose_print(roll, trace))
     except DiceBaseException as e:
         print("Whoops! Something went wrong:")
         print(e.pretty_print())
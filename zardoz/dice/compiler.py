@@ -0,0 +1,757 @@
+"""
+Compiles parsed dice expressions into nested closures
+
+Evaluating a tree allocates Integer, IntegerList, Roll and Comparison objects
+at every node, and copies parse attributes onto each of them. A compiled
+expression instead works on plain ints and lists: each node is lowered once
+into a closure, chosen by the kind of value its operands produce (see
+SCALAR, LIST, ROLL and COMPARISONS).
+
+Anything the compiler doesn't handle natively, such as dice operators on
+rolls with nested dice for sides, or expressions that can only raise an
+error, falls back to evaluating a fresh copy of that subtree.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from collections import namedtuple
+import operator
+import random
+
+from .constants import MAX_EXPLOSIONS, MAX_ROLL_DICE, DiceExtreme, ValueKind
+from .elements import (
+    Add,
+    AddEvenSubOdd,
+    Again,
+    Array,
+    Comparison,
+    ComparisonList,
+    ComparisonOperator,
+    Dice,
+    Div,
+    Element,
+    Explode,
+    Extend,
+    ForceReroll,
+    Highest,
+    Integer,
+    IntegerList,
+    Lowest,
+    Middle,
+    Modulo,
+    Mul,
+    Negate,
+    Reroll,
+    Sort,
+    Sub,
+    SuccessFail,
+    Successes,
+    Total,
+    Trace,
+    Variable,
+    WildDice,
+    unfolded,
+)
+from .exceptions import DiceBaseException
+from .rng import geometric
+from .utilities import (
+    exploded_order,
+    highest_window,
+    lowest_window,
+    middle_window,
+    select_window,
+    single,
+)
+
+# The kinds of plain values produced by compiled nodes. ROLL values are plain
+# lists, like LIST values, but come from a known random element; COMPARISONS
+# values are lists of (value, delta) pairs.
+SCALAR, LIST, ROLL, COMPARISONS = (
+    ValueKind.SCALAR, ValueKind.LIST, ValueKind.ROLL, ValueKind.COMPARISONS
+)
+
+Compiled = namedtuple("Compiled", "kind function element")
+Compiled.__doc__ = """A compiled node: the kind of value it produces, a function
+of a Context returning that value, and for ROLL values whose random element has
+integer bounds, that element."""
+
+COMPILERS = {}
+
+
+class Context(object):
+    """The options a compiled expression is evaluated with"""
+
+    __slots__ = ("random", "force_extreme", "max_dice", "limits", "variables")
+
+    def __init__(self, random=random, force_extreme=None, max_dice=MAX_ROLL_DICE,
+                 limits=None, variables=None, **kwargs):
+        self.random = random
+        self.force_extreme = force_extreme
+        self.max_dice = max_dice
+        self.limits = limits
+        self.variables = variables
+
+    def kwargs(self):
+        return {
+            "random": self.random,
+            "force_extreme": self.force_extreme,
+            "max_dice": self.max_dice,
+            "limits": self.limits,
+            "variables": self.variables,
+        }
+
+
+def compiles(*classes):
+    """Registers a compiler for the given element classes"""
+
+    def register(func):
+        for cls in classes:
+            COMPILERS[cls] = func
+        return func
+
+    return register
+
+
+def to_plain(value):
+    """Converts an evaluated element to the equivalent plain value"""
+    if isinstance(value, int):
+        return int(value)
+    elif isinstance(value, ComparisonList):
+        return list(zip(map(bool, value.values), value.deltas))
+
+    return [
+        (x.value, x.delta) if isinstance(x, Comparison) else int(x)
+        for x in value
+    ]
+
+
+def fallback(node):
+    """Compiles a node by evaluating it through the tree on every call"""
+
+    def function(ctx):
+        trace = Trace(keep_intermediates=False)
+        return to_plain(node.evaluate_cached(trace=trace, **ctx.kwargs()))
+
+    return Compiled(None, function, None)
+
+
+def compile_node(node):
+    """Lowers an element into a Compiled closure"""
+    if not isinstance(node, Element):
+        value = int(node)
+        return Compiled(SCALAR, lambda ctx: value, None)
+
+    for cls in type(node).__mro__:
+        if cls in COMPILERS:
+            compiled = COMPILERS[cls](node)
+            if compiled is not None:
+                return compiled
+            break
+
+    return fallback(node)
+
+
+def compile_scalar(node):
+    """Compiles a node whose value is coerced to an Integer, like the
+    operands of IntegerOperator"""
+    return as_scalar(compile_node(node))
+
+
+def as_scalar(compiled):
+    function = compiled.function
+
+    if compiled.kind is SCALAR:
+        return function
+    elif compiled.kind in (LIST, ROLL):
+        return lambda ctx: sum(function(ctx))
+
+    def coerce(ctx):
+        value = function(ctx)
+        return value if isinstance(value, int) else int(IntegerList(value))
+
+    return coerce
+
+
+def is_numeric(*compiled):
+    """Whether compiled nodes all produce scalars or lists of integers"""
+    return all(c.kind in (SCALAR, LIST, ROLL) for c in compiled)
+
+
+def static_bounds(element):
+    """Returns the (min, max) of a random element if both are integers"""
+    if element is None:
+        return None
+
+    bounds = element.min_value, element.max_value
+    if all(isinstance(b, int) for b in bounds):
+        return int(bounds[0]), int(bounds[1])
+    return None
+
+
+@compiles(Integer)
+def compile_integer(node):
+    value = int(node)
+    return Compiled(SCALAR, lambda ctx: value, None)
+
+
+@compiles(Variable)
+def compile_variable(node):
+    return Compiled(SCALAR, lambda ctx: int(node.evaluate(variables=ctx.variables)), None)
+
+
+@compiles(Dice)
+def compile_dice(node):
+    amount = compile_scalar(node.amount)
+    min_value = compile_scalar(node.min_value)
+    max_value = compile_scalar(node.max_value)
+    wild = isinstance(node, WildDice)
+
+    def roll(ctx):
+        n = amount(ctx)
+        low = min_value(ctx)
+        high = max_value(ctx)
+
+        if n > ctx.max_dice:
+            raise node.fatal("Too many dice! (max is %i)" % ctx.max_dice)
+        elif n < 0:
+            msg = "Cannot roll less than zero dice!"
+            orig_amount = unfolded(node.amount)
+            if not isinstance(orig_amount, int):
+                msg += " (%s evaluated to %s)" % (orig_amount, n)
+            raise node.fatal(msg)
+        elif ctx.force_extreme is DiceExtreme.EXTREME_MIN:
+            return [low] * n
+        elif ctx.force_extreme is DiceExtreme.EXTREME_MAX:
+            return [high] * n
+        elif wild:
+            try:
+                rolled = roll_wild(n, low, high, ctx.random)
+            except ValueError as e:
+                raise node.fatal(e.args[0])
+            if ctx.limits is not None:
+                ctx.limits.roll(node, len(rolled))
+            return rolled
+        elif n and low > high:
+            raise node.fatal(
+                "Roll must have a valid range (got %s - %s, "
+                "which evaluated to %i - %i). Are you trying to "
+                "use a fudge roll as the sides?"
+                % (unfolded(node.min_value), unfolded(node.max_value), low, high)
+            )
+
+        if ctx.limits is not None:
+            ctx.limits.roll(node, n)
+
+        randint = ctx.random.randint
+        return [randint(low, high) for i in range(n)]
+
+    return Compiled(ROLL, roll, node if static_bounds(node) else None)
+
+
+def roll_wild(amount, min_value, max_value, rnd):
+    """Mirrors WildRoll.roll on plain values"""
+    if amount == 0:
+        return []
+
+    rolls = [rnd.randint(min_value, max_value) for i in range(amount)]
+
+    if min_value == max_value:
+        return rolls
+
+    while rolls[-1] == max_value:
+        if len(rolls) - amount >= MAX_EXPLOSIONS:
+            raise ValueError("Too many explosions!")
+        rolls.append(rnd.randint(min_value, max_value))
+
+    if len(rolls) == amount and rolls[-1] == min_value:
+        rolls[-1] = 0
+        rolls[rolls.index(max(rolls))] = 0
+
+        if rnd.randint(min_value, max_value) == min_value:
+            return [0] * amount
+
+    return rolls
+
+
+def operands(node):
+    return [compile_node(o) for o in node.original_operands]
+
+
+def pairwise(functions, step):
+    """Folds a function over the values of several compiled operands, the
+    way Operator.evaluate does for operators with more than two"""
+    first, rest = functions[0], functions[1:]
+
+    if len(rest) == 1:
+        second = rest[0]
+        return lambda ctx: step(first(ctx), second(ctx))
+
+    def fold(ctx):
+        value = first(ctx)
+        for function in rest:
+            value = step(value, function(ctx))
+        return value
+
+    return fold
+
+
+def division_by_zero(node, offset_index):
+    """Builds the error Operator.evaluate raises for a zero divisor"""
+    zero_op = unfolded(node.original_operands[offset_index])
+    offset = zero_op.location - node.location
+    msg = "Division by zero"
+
+    if not isinstance(zero_op, int):
+        msg += " (%s evaluated to 0)" % zero_op
+
+    return node.fatal(msg, offset=offset)
+
+
+ARITHMETIC = {
+    Add: operator.add,
+    Sub: operator.sub,
+    Mul: operator.mul,
+    Div: operator.floordiv,
+    Modulo: operator.mod,
+}
+
+
+@compiles(*ARITHMETIC)
+def compile_arithmetic(node):
+    left = compile_node(node.original_operands[0])
+    rights = node.original_operands[1:]
+    func = ARITHMETIC[type(node)]
+    checks_zero = func in (operator.floordiv, operator.mod)
+
+    # Operator.evaluate locates a zero divisor among all the evaluated
+    # operands, which is only straightforward to mirror for a single one
+    if not is_numeric(left) or checks_zero and len(rights) > 1:
+        return None
+
+    if left.kind is SCALAR:
+        kind, step = SCALAR, func
+    else:
+        kind = LIST
+
+        def step(values, scalar):
+            return [func(x, scalar) for x in values]
+
+    function = pairwise([left.function] + [compile_scalar(o) for o in rights], step)
+
+    if checks_zero:
+        unchecked = function
+
+        def function(ctx):
+            try:
+                return unchecked(ctx)
+            except ZeroDivisionError:
+                raise division_by_zero(node, 1)
+
+    return Compiled(kind, function, None)
+
+
+@compiles(ComparisonOperator)
+def compile_comparison(node):
+    if len(node.original_operands) != 2:
+        return None
+
+    left, right = operands(node)
+    if not is_numeric(left, right):
+        return None
+
+    impl = node._impl
+    left_fn, right_fn = left.function, right.function
+
+    if left.kind is not SCALAR and right.kind is not SCALAR:
+
+        def function(ctx):
+            lhs, rhs = left_fn(ctx), right_fn(ctx)
+            if len(lhs) != len(rhs):
+                raise TypeError("Element-wise comparison requires lists of equal length")
+            return [impl(l, r) for l, r in zip(lhs, rhs)]
+
+    elif left.kind is not SCALAR:
+
+        def function(ctx):
+            lhs, rhs = left_fn(ctx), right_fn(ctx)
+            return [impl(l, rhs) for l in lhs]
+
+    elif right.kind is not SCALAR:
+
+        def function(ctx):
+            lhs, rhs = left_fn(ctx), right_fn(ctx)
+            return [impl(lhs, r) for r in rhs]
+
+    else:
+
+        def function(ctx):
+            return [impl(left_fn(ctx), right_fn(ctx))]
+
+    return Compiled(COMPARISONS, function, None)
+
+
+@compiles(Total)
+def compile_total(node):
+    if len(node.original_operands) != 1:
+        return None
+
+    (operand,) = operands(node)
+    function = operand.function
+
+    if operand.kind is SCALAR:
+        return Compiled(SCALAR, function, None)
+    elif operand.kind in (LIST, ROLL):
+        return Compiled(SCALAR, lambda ctx: sum(function(ctx)), None)
+    return None
+
+
+@compiles(Sort)
+def compile_sort(node):
+    if len(node.original_operands) != 1:
+        return None
+
+    (operand,) = operands(node)
+    if operand.kind not in (LIST, ROLL):
+        return None
+
+    function = operand.function
+    return Compiled(operand.kind, lambda ctx: sorted(function(ctx)), operand.element)
+
+
+def compile_selection(node, window):
+    """Compiles Highest, Lowest and Middle, given the window of ranks they
+    keep"""
+    if len(node.original_operands) > 2:
+        return None
+
+    operand = compile_node(node.original_operands[0])
+    if operand.kind not in (LIST, ROLL):
+        return None
+
+    function = operand.function
+    count = None
+    if len(node.original_operands) == 2:
+        count = compile_scalar(node.original_operands[1])
+
+    def selection(ctx):
+        values = function(ctx)
+        n = None if count is None else count(ctx)
+        start, stop = window(len(values), n)
+        return select_window(values, start, stop)
+
+    return Compiled(operand.kind, selection, operand.element)
+
+
+@compiles(Lowest)
+def compile_lowest(node):
+    return compile_selection(node, lowest_window)
+
+
+@compiles(Highest)
+def compile_highest(node):
+    return compile_selection(node, highest_window)
+
+
+@compiles(Middle)
+def compile_middle(node):
+    return compile_selection(node, middle_window)
+
+
+@compiles(Extend)
+def compile_extend(node):
+    compiled = operands(node)
+    if not is_numeric(*compiled):
+        return None
+
+    parts = [(c.kind is SCALAR, c.function) for c in compiled]
+
+    def extend(ctx):
+        ret = []
+        for is_scalar, function in parts:
+            if is_scalar:
+                ret.append(function(ctx))
+            else:
+                ret.extend(function(ctx))
+        return ret
+
+    return Compiled(LIST, extend, None)
+
+
+@compiles(Array)
+def compile_array(node):
+    # Array leaves operands it can't sum as they are, so lists of comparisons
+    # are left to the tree
+    compiled = operands(node)
+    if not is_numeric(*compiled):
+        return None
+
+    functions = [as_scalar(c) for c in compiled]
+    return Compiled(LIST, lambda ctx: [f(ctx) for f in functions], None)
+
+
+@compiles(Negate)
+def compile_negate(node):
+    (operand,) = operands(node)
+    function = operand.function
+
+    if operand.kind is SCALAR:
+        return Compiled(SCALAR, lambda ctx: -function(ctx), None)
+    elif operand.kind in (LIST, ROLL):
+        return Compiled(LIST, lambda ctx: [-x for x in function(ctx)], None)
+    return None
+
+
+@compiles(AddEvenSubOdd)
+def compile_add_even_sub_odd(node):
+    (operand,) = operands(node)
+    function = operand.function
+
+    if operand.kind is SCALAR:
+        return Compiled(SCALAR, lambda ctx: add_even_sub_odd(function(ctx)), None)
+    elif operand.kind in (LIST, ROLL):
+        return Compiled(
+            operand.kind,
+            lambda ctx: [add_even_sub_odd(x) for x in function(ctx)],
+            operand.element,
+        )
+    return None
+
+
+def add_even_sub_odd(x):
+    return -x if x % 2 else x
+
+
+def threshold(node, default):
+    """Compiles the optional right-hand threshold of a dice operator"""
+    if len(node.original_operands) == 1:
+        return lambda ctx: default
+    return compile_scalar(node.original_operands[1])
+
+
+@compiles(Successes, SuccessFail)
+def compile_successes(node):
+    if len(node.original_operands) != 2:
+        return None
+
+    operand = compile_node(node.original_operands[0])
+    thresh = compile_scalar(node.original_operands[1])
+    function = operand.function
+    counting_fails = isinstance(node, SuccessFail)
+
+    if operand.kind is ROLL:
+        bounds = static_bounds(operand.element)
+        if bounds is None:
+            return None
+        fail_level, max_value = bounds
+        msg = "Success threshold higher than roll result."
+        if counting_fails:
+            msg = "Success threshold higher than maximum roll result."
+    elif operand.kind in (SCALAR, LIST):
+        fail_level, max_value, msg = 1, None, None
+    else:
+        return None
+
+    is_scalar = operand.kind is SCALAR
+
+    def successes(ctx):
+        values = function(ctx)
+        t = thresh(ctx)
+
+        if is_scalar:
+            values = (values,)
+        elif max_value is not None and t > max_value:
+            raise node.fatal(msg)
+
+        if not counting_fails:
+            return sum(x >= t for x in values)
+
+        result = 0
+        for x in values:
+            if x >= t:
+                result += 1
+            elif x <= fail_level:
+                result -= 1
+        return result
+
+    return Compiled(SCALAR, successes, None)
+
+
+@compiles(Again)
+def compile_again(node):
+    if len(node.original_operands) > 2:
+        return None
+
+    operand = compile_node(node.original_operands[0])
+    if not is_numeric(operand):
+        return None
+
+    if len(node.original_operands) == 1:
+        bounds = static_bounds(operand.element) if operand.kind is ROLL else None
+        if bounds is None:
+            return None
+        target = threshold(node, bounds[1])
+    else:
+        target = compile_scalar(node.original_operands[1])
+
+    function = operand.function
+    is_scalar = operand.kind is SCALAR
+
+    def again(ctx):
+        values = function(ctx)
+        if is_scalar:
+            values = [values]
+        t = target(ctx)
+
+        ret = []
+        for x in values:
+            ret.append(x)
+            if x == t:
+                ret.append(x)
+        return ret
+
+    kind = ROLL if operand.kind is ROLL else LIST
+    return Compiled(kind, again, operand.element)
+
+
+def roll_bounds(node):
+    """Compiles the roll operand of a dice operator, returning the compiled
+    operand and its random element's bounds, or (None, None) if they aren't
+    plain integers"""
+    if len(node.original_operands) > 2:
+        return None, None
+
+    operand = compile_node(node.original_operands[0])
+    bounds = static_bounds(operand.element)
+
+    if operand.kind is not ROLL or bounds is None:
+        return None, None
+
+    return operand, bounds
+
+
+@compiles(Explode)
+def compile_explode(node):
+    operand, bounds = roll_bounds(node)
+    if operand is None or isinstance(operand.element, WildDice):
+        return None
+
+    min_value, max_value = bounds
+    if min_value == max_value:
+        return None
+
+    thresh = threshold(node, max_value)
+    function = operand.function
+    element = operand.element
+    orig_thresh = unfolded(node.original_operands[-1])
+
+    def explode(ctx):
+        rolled = function(ctx)
+        t = thresh(ctx)
+
+        if t <= min_value:
+            offset = orig_thresh.location - node.location
+            msg = (
+                "Refusing to explode with threshold less than or equal to "
+                "the lowest possible roll."
+            )
+
+            if type(orig_thresh) is not Integer:
+                msg += " (%s evaluated to %s)" % (orig_thresh, t)
+
+            raise node.fatal(msg, offset=offset)
+
+        # Like Explode, extra dice ignore force_extreme: each die that explodes
+        # adds a chain of dice of geometric length
+        rnd = ctx.random
+        hits = sum(x >= t for x in rolled)
+        chains = []
+        if hits:
+            chance = (t - min_value) / float(max_value - min_value + 1)
+            chains = geometric(hits, chance, rnd)
+
+        rounds = (max(chains) + 1) if chains else int(bool(rolled))
+        if hits > ctx.max_dice:
+            raise element.fatal("Too many dice! (max is %i)" % ctx.max_dice)
+        if ctx.limits is not None:
+            ctx.limits.step(node, min(rounds, MAX_EXPLOSIONS - 1))
+            ctx.limits.roll(element, sum(min(n, MAX_EXPLOSIONS - 1) for n in chains))
+        if rounds >= MAX_EXPLOSIONS:
+            raise node.fatal("Too many explosions!")
+
+        randint = rnd.randint
+        hit_faces = [randint(t, max_value) for i in range(sum(chains) - hits)]
+        miss_faces = [randint(min_value, t - 1) for i in range(hits)]
+
+        result = list(rolled)
+        result.extend(exploded_order(chains, hit_faces, miss_faces))
+        return result
+
+    return Compiled(ROLL, explode, element)
+
+
+@compiles(Reroll, ForceReroll)
+def compile_reroll(node):
+    operand, bounds = roll_bounds(node)
+    if operand is None:
+        return None
+
+    min_value, max_value = bounds
+    thresh = threshold(node, min_value)
+    function = operand.function
+    forced = isinstance(node, ForceReroll)
+
+    def reroll(ctx):
+        values = function(ctx)
+        t = thresh(ctx)
+
+        if ctx.force_extreme is DiceExtreme.EXTREME_MIN:
+            return [min_value if x <= t else x for x in values]
+        elif ctx.force_extreme is DiceExtreme.EXTREME_MAX:
+            return [max_value if x <= t else x for x in values]
+
+        if ctx.limits is not None:
+            ctx.limits.roll(operand.element, sum(x <= t for x in values))
+
+        low = min(max_value, t + 1) if forced else min_value
+        randint = ctx.random.randint
+        return [randint(low, max_value) if x <= t else x for x in values]
+
+    return Compiled(ROLL, reroll, operand.element)
+
+
+class CompiledExpression(object):
+    """A dice expression lowered into closures, which can be rolled
+    repeatedly. Calling it returns plain ints and lists, like roll() but
+    without the element objects; comparisons give (value, delta) pairs.
+
+    Calling it with breakdown=True evaluates the tree instead, and returns
+    the rich result along with the Trace of the evaluation, for use with
+    utilities.verbose_print."""
+
+    def __init__(self, string, elements):
+        self.string = string
+        self.elements = elements
+        self.compiled = [compile_node(e) for e in elements]
+        self.functions = [c.function for c in self.compiled]
+        # Moves errors onto string, if elements were parsed from elsewhere
+        self.relocate = None
+
+    @property
+    def kinds(self):
+        return [c.kind for c in self.compiled]
+
+    def __call__(self, breakdown=False, **kwargs):
+        try:
+            if breakdown:
+                trace = Trace.evaluate(self.elements, **kwargs)
+                return single(trace.results), trace
+
+            ctx = Context(**kwargs)
+            return single([function(ctx) for function in self.functions])
+        except DiceBaseException as e:
+            if self.relocate is None:
+                raise
+            raise self.relocate(e) from None
+
+    def __repr__(self):
+        return "CompiledExpression(%r)" % self.string
@@ -4,6 +4,28 @@ class DiceExtreme(object):
     EXTREME_MAX = "MAX"
 
 
+# The kinds of value an element can evaluate to, see optimize.py
+class ValueKind(object):
+    SCALAR = "scalar"
+    LIST = "list"
+    ROLL = "roll"
+    COMPARISONS = "comparisons"
+
+
 MAX_ROLL_DICE = 2 ** 10
 MAX_EXPLOSIONS = 2 ** 8
 VERBOSE_INDENT = 2
+PARSE_CACHE_SIZE = 2 ** 8
+RNG_BLOCK_SIZE = 2 ** 12
+POOL_SIDES_RATIO = 4
+# Default limits on the worst case of an expression, see cost.py
+MAX_COST_DICE = 2 ** 16
+MAX_COST_LENGTH = 2 ** 16
+MAX_COST_OUTPUT = 2 ** 16
+# Default limits on one evaluation, see limits.py
+MAX_EVAL_STEPS = 2 ** 20
+MAX_EVAL_DICE = 2 ** 20
+EVAL_TIMEOUT = 1.0
+# Exact distributions of selections from larger pools are refused: this is
+# faces * amount ** 2 / 2 * the width of the statistic, see probability.py
+MAX_SELECTION_WORK = 2 ** 27
@@ -0,0 +1,342 @@
+"""
+Estimates the worst-case cost of evaluating parsed dice expressions
+
+The limits checked during evaluation, like max_dice, only apply once an
+element's operands have been evaluated, and don't cover the dice rolled by
+explosions or the values added by concatenation and Again. Here the whole tree
+is walked before anything is rolled, with interval arithmetic: each node
+is estimated to a Cost, holding the range its values can take and how large
+it can grow, which its parent uses in turn.
+
+Costs are worst cases, and most rolls come nowhere near them: an explosion
+is counted as if every die explodes until MAX_EXPLOSIONS is reached.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from collections import namedtuple
+import operator
+
+from .constants import (
+    MAX_COST_DICE,
+    MAX_COST_LENGTH,
+    MAX_COST_OUTPUT,
+    MAX_EXPLOSIONS,
+    MAX_ROLL_DICE,
+    POOL_SIDES_RATIO,
+)
+from .elements import (
+    Add,
+    AddEvenSubOdd,
+    Again,
+    Array,
+    ComparisonOperator,
+    Dice,
+    Div,
+    Explode,
+    Extend,
+    ForceReroll,
+    Highest,
+    Lowest,
+    Middle,
+    Modulo,
+    Mul,
+    Negate,
+    Operator,
+    Reroll,
+    Sort,
+    Sub,
+    SuccessFail,
+    Successes,
+    Total,
+    Variable,
+    WildDice,
+)
+
+Cost = namedtuple("Cost", "low high length dice largest")
+Cost.__doc__ = """The worst case of evaluating an element: the lowest and highest
+of its values, the most values it can hold (None for scalars), the most dice
+rolled to evaluate it, and the most values held by any list on the way."""
+
+Budget = namedtuple("Budget", "dice length output")
+Budget.__doc__ = """Limits on the worst case of an expression: the dice rolled,
+the values held by any one list, and the values in its results."""
+
+DEFAULT_BUDGET = Budget(MAX_COST_DICE, MAX_COST_LENGTH, MAX_COST_OUTPUT)
+
+ESTIMATORS = {}
+
+
+def estimates(*classes):
+    """Registers an estimator for the given element classes"""
+
+    def register(func):
+        for cls in classes:
+            ESTIMATORS[cls] = func
+        return func
+
+    return register
+
+
+def estimate(node, budget=None, **kwargs):
+    """Returns the Cost of an element, raising a DiceFatalException located at
+    the first element to go over the budget if one is given"""
+    if isinstance(node, Variable):
+        value = int(node.evaluate(**kwargs))
+        return Cost(value, value, None, 0, 0)
+    elif not isinstance(node, (Dice, Operator)):
+        value = int(node)
+        return Cost(value, value, None, 0, 0)
+
+    for cls in type(node).__mro__:
+        if cls in ESTIMATORS:
+            cost = ESTIMATORS[cls](node, budget=budget, **kwargs)
+            break
+    else:
+        cost = estimate_operator(node, budget=budget, **kwargs)
+
+    if budget is not None:
+        if cost.dice > budget.dice:
+            raise node.fatal(
+                "Too many dice! (up to %i could be rolled, max is %i)"
+                % (cost.dice, budget.dice)
+            )
+        elif cost.largest > budget.length:
+            raise node.fatal(
+                "List too long! (up to %i values, max is %i)"
+                % (cost.largest, budget.length)
+            )
+
+    return cost
+
+
+def estimate_operands(node, **kwargs):
+    return [estimate(o, **kwargs) for o in node.original_operands]
+
+
+def scalar(cost):
+    """Returns the range of a value coerced to an Integer: the total of a list"""
+    if cost.length is None:
+        return cost.low, cost.high
+    return (
+        min(0, cost.length * cost.low),
+        max(0, cost.length * cost.high),
+    )
+
+
+def span(func, left, right):
+    """Returns the range of func over two ranges, from their corners"""
+    values = [func(l, r) for l in left for r in right]
+    return min(values), max(values)
+
+
+def combined(costs, low, high, length=None, dice=0):
+    """Builds the Cost of an element from those of its operands"""
+    largest = max([c.largest for c in costs] + [length or 0])
+    return Cost(low, high, length, sum(c.dice for c in costs) + dice, largest)
+
+
+def hull(costs):
+    """Returns the range of the values of all of costs, as scalars"""
+    ranges = [scalar(c) for c in costs]
+    return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+
+@estimates(Dice)
+def estimate_dice(node, max_dice=MAX_ROLL_DICE, max_pool_dice=None, **kwargs):
+    amount, min_value, max_value = [
+        estimate(o, max_dice=max_dice, max_pool_dice=max_pool_dice, **kwargs)
+        for o in (node.amount, node.min_value, node.max_value)
+    ]
+    low, high = scalar(min_value)[0], scalar(max_value)[1]
+    most = max(0, scalar(amount)[1])
+    faces = max(1, high - low + 1)
+
+    # Evaluation refuses more than max_dice, unless the roll is counted
+    if max_pool_dice and most > max_dice and most >= POOL_SIDES_RATIO * faces:
+        length = dice = faces
+    else:
+        length = dice = min(most, max_dice)
+
+    if isinstance(node, WildDice):
+        # The last die rerolls for as long as it rolls its maximum, and
+        # failures zero dice
+        low = min(0, low)
+        dice += MAX_EXPLOSIONS
+        length += MAX_EXPLOSIONS
+
+    return combined([amount, min_value, max_value], low, high, length, dice)
+
+
+ARITHMETIC = {
+    Add: operator.add,
+    Sub: operator.sub,
+    Mul: operator.mul,
+}
+
+
+@estimates(*ARITHMETIC)
+def estimate_arithmetic(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    low, high = costs[0].low, costs[0].high
+
+    for cost in costs[1:]:
+        low, high = span(ARITHMETIC[type(node)], (low, high), scalar(cost))
+
+    return combined(costs, low, high, costs[0].length)
+
+
+def divisors(low, high):
+    """Returns the non-zero divisors at the corners of a range"""
+    candidates = {low, high} | {d for d in (-1, 1) if low <= d <= high}
+    return [d for d in candidates if d] or [1]
+
+
+@estimates(Div)
+def estimate_div(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    low, high = costs[0].low, costs[0].high
+
+    for cost in costs[1:]:
+        low, high = span(operator.floordiv, (low, high), divisors(*scalar(cost)))
+
+    return combined(costs, low, high, costs[0].length)
+
+
+@estimates(Modulo)
+def estimate_modulo(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    low, high = costs[0].low, costs[0].high
+
+    for cost in costs[1:]:
+        div_low, div_high = scalar(cost)
+        low, high = min(0, div_low + 1), max(0, div_high - 1)
+
+    return combined(costs, low, high, costs[0].length)
+
+
+@estimates(Negate)
+def estimate_negate(node, **kwargs):
+    cost, = costs = estimate_operands(node, **kwargs)
+    return combined(costs, -cost.high, -cost.low, cost.length)
+
+
+@estimates(AddEvenSubOdd)
+def estimate_add_even_sub_odd(node, **kwargs):
+    cost, = costs = estimate_operands(node, **kwargs)
+    most = max(abs(cost.low), abs(cost.high))
+    return combined(costs, -most, most, cost.length)
+
+
+@estimates(ComparisonOperator)
+def estimate_comparison(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    length = max(c.length or 1 for c in costs)
+    return combined(costs, 0, 1, length)
+
+
+@estimates(Total)
+def estimate_total(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    return combined(costs, *hull(costs))
+
+
+@estimates(Successes, SuccessFail)
+def estimate_successes(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    length = costs[0].length or 1
+    return combined(costs, -length, length)
+
+
+@estimates(Sort, Highest, Lowest, Middle, Reroll, ForceReroll)
+def estimate_selection(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    cost = costs[0]
+    dice = 0
+
+    if isinstance(node, (Reroll, ForceReroll)):
+        # Each die is rerolled at most once per threshold
+        dice = (cost.length or 0) * applications(node)
+
+    return combined(costs, cost.low, cost.high, cost.length, dice)
+
+
+def applications(node):
+    """Returns how many times an operator is applied to its left operand:
+    once for each operand after the first"""
+    return max(1, len(node.original_operands) - 1)
+
+
+@estimates(Explode)
+def estimate_explode(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    cost = costs[0]
+    length = cost.length or 0
+
+    for i in range(applications(node)):
+        length *= MAX_EXPLOSIONS
+
+    rolled = length - (cost.length or 0)
+    return combined(costs, cost.low, cost.high, length, rolled)
+
+
+@estimates(Again)
+def estimate_again(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    cost = costs[0]
+    length = (cost.length or 1) * 2 ** applications(node)
+    return combined(costs, cost.low, cost.high, length)
+
+
+@estimates(Array)
+def estimate_array(node, **kwargs):
+    costs = estimate_operands(node, **kwargs)
+    return combined(costs, *hull(costs), length=len(costs))
+
+
+@estimates(Extend)
+def estimate_operator(node, **kwargs):
+    """Estimates an operator whose result holds the values of all of its
+    operands, which is the worst case of any operator"""
+    costs = estimate_operands(node, **kwargs)
+    low = min(c.low for c in costs)
+    high = max(c.high for c in costs)
+    return combined(costs, low, high, sum(c.length or 1 for c in costs))
+
+
+def analyze(elements, max_dice=MAX_ROLL_DICE, **kwargs):
+    """Returns the Cost of each of the parsed elements of an expression.
+    Takes the max_dice and max_pool_dice arguments of evaluation."""
+    return [estimate(e, max_dice=max_dice, **kwargs) for e in elements]
+
+
+def check(elements, budget=DEFAULT_BUDGET, **kwargs):
+    """Raises a DiceFatalException if evaluating the parsed elements of an
+    expression could go over the budget, and otherwise returns their Costs"""
+    costs = analyze(elements, budget=budget, **kwargs)
+    output = sum(c.length or 1 for c in costs)
+
+    if output > budget.output:
+        raise elements[0].fatal(
+            "Result too large! (up to %i values, max is %i)"
+            % (output, budget.output)
+        )
+
+    return costs
+
+
+def support(elements, **kwargs):
+    """Returns the most work computing the exact distribution of any element
+    of the parsed elements could take: the width of the range of its values
+    times the dice rolled for it. Takes the arguments of analyze."""
+    work = 0
+    nodes = list(elements)
+    while nodes:
+        node = nodes.pop()
+        if not isinstance(node, (Dice, Operator)):
+            continue
+        cost = estimate(node, **kwargs)
+        low, high = scalar(cost)
+        work = max(work, (high - low + 1) * max(cost.dice, 1))
+        nodes.extend(getattr(node, "original_operands", ()))
+    return work
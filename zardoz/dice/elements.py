@@ -4,17 +4,40 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 import random
 import operator
+import re
+from array import array
+from collections import namedtuple
+from inspect import CO_VARARGS
+from itertools import repeat
 from pyparsing import ParseFatalException
-from copy import copy
-
-from .constants import MAX_EXPLOSIONS, MAX_ROLL_DICE, DiceExtreme
+from copy import copy, deepcopy
+
+from .constants import (
+    MAX_EXPLOSIONS,
+    MAX_ROLL_DICE,
+    POOL_SIDES_RATIO,
+    DiceExtreme,
+    ValueKind,
+)
 from .exceptions import DiceFatalException
-from .utilities import classname, add_even_sub_odd, dice_switch
-
-from pdb import set_trace
+from .rng import geometric, multinomial
+from .utilities import (
+    add_even_sub_odd,
+    classname,
+    dice_switch,
+    exploded_order,
+    highest_window,
+    lowest_window,
+    middle_window,
+    select_window,
+)
 
 
 class Element(object):
+    # Results are kept in slots where their base class allows; parsed elements
+    # have a __dict__ for their parse attributes
+    __slots__ = ()
+
     @classmethod
     def parse(cls, string, location, tokens):
         try:
@@ -43,7 +66,6 @@ class Element(object):
     @staticmethod
     def evaluate_object(obj, cls=None, cache=False, **kwargs):
         """Evaluates elements, and coerces objects to a class if needed"""
-        old_obj = obj
         if isinstance(obj, Element):
             if cache:
                 obj = obj.evaluate_cached(**kwargs)
@@ -53,24 +75,120 @@ class Element(object):
         if cls is not None and type(obj) != cls:
             obj = cls(obj)
 
-        for attr in ("string", "location", "tokens"):
-            if hasattr(old_obj, attr):
-                setattr(obj, attr, getattr(old_obj, attr))
-
+        # Results don't carry the location of the element they came from,
+        # see Trace.source
         return obj
 
-    def evaluate_cached(self, **kwargs):
-        """Wraps evaluate(), caching results"""
-        if not hasattr(self, "result"):
-            self.result = self.evaluate(cache=True, **kwargs)
+    def evaluate_cached(self, trace=None, **kwargs):
+        """Wraps evaluate(), recording results in a Trace so that an element
+        reached twice in one evaluation gives the same result both times.
+        Without a trace, each call starts a new evaluation."""
+        if trace is None:
+            trace = Trace()
+
+        try:
+            return trace[self]
+        except KeyError:
+            kwargs.pop("cache", None)
+            result = self.evaluate(cache=True, trace=trace, **kwargs)
+            trace.record(self, result)
+            return result
+
+
+class Trace(object):
+    """The results of one evaluation of a parsed tree.
+
+    Evaluation never writes to the elements of the tree, so a tree can be
+    cached and evaluated from several threads at once; the result of each
+    element is recorded here instead.
+
+    With keep_intermediates=False, operators may modify the results of other
+    operators in place rather than copying them, so only the results of random
+    elements and of the top-level elements can be relied on afterwards."""
 
-        return self.result
+    def __init__(self, keep_intermediates=True):
+        self.keep_intermediates = keep_intermediates
+        self.elements = []
+        self.results = []
+        self._results = {}
+        self._sources = None
+
+    @classmethod
+    def evaluate(cls, elements, keep_intermediates=True, **kwargs):
+        """Evaluates each of the top-level elements of a parsed expression"""
+        trace = cls(keep_intermediates)
+        for element in elements:
+            trace.elements.append(element)
+            trace.results.append(element.evaluate_cached(trace=trace, **kwargs))
+        return trace
+
+    def record(self, element, result):
+        # Keeping the element alive keeps its id from being reused
+        self._results[id(element)] = (element, result)
+        self._sources = None
+
+    def source(self, result, default=None):
+        """Returns the element a result was evaluated from, whose location
+        is where the result came from in the expression"""
+        if self._sources is None:
+            self._sources = {}
+            for element, value in self._results.values():
+                self._sources.setdefault(id(value), element)
+        return self._sources.get(id(result), default)
+
+    def get(self, element, default=None):
+        try:
+            return self[element]
+        except KeyError:
+            return default
+
+    def rolls(self):
+        """Returns the random elements evaluated and their rolls, in the
+        order they were rolled"""
+        return [
+            (element, result)
+            for element, result in self._results.values()
+            if isinstance(element, RandomElement)
+        ]
+
+    def __getitem__(self, element):
+        return self._results[id(element)][1]
+
+    def __contains__(self, element):
+        return id(element) in self._results
+
+    def __len__(self):
+        return len(self._results)
+
+    def __repr__(self):
+        return "Trace(%s)" % ", ".join(
+            "%s -> %s" % (e, r) for e, r in zip(self.elements, self.results)
+        )
 
 
 class Integer(int, Element):
     """A wrapper around the int class"""
 
-    pass
+    kind = ValueKind.SCALAR
+
+
+class Folded(Integer):
+    """The value of a subtree without dice, computed once when the expression
+    was optimized. The subtree is kept as original, to describe it in error
+    messages."""
+
+    def __new__(cls, value, original):
+        self = super(Folded, cls).__new__(cls, value)
+        self.original = original
+        return self
+
+    def __getnewargs__(self):
+        return int(self), self.original
+
+
+def unfolded(operand):
+    """Returns an operand as it was parsed, before any folding"""
+    return getattr(operand, "original", operand)
 
 
 class String(str, Element):
@@ -79,21 +197,163 @@ class String(str, Element):
     pass
 
 
-class Comparison(Element):
+class Variable(Element):
+    """A placeholder for an integer, written $name, bound when the expression
+    is evaluated to the value of name in the variables keyword argument. An
+    expression with variables is parsed once, whatever their values."""
 
-    def __init__(self, left, right, delta, value, operator):
-        self.left = left
-        self.right = right
-        self.delta = delta
-        self.value = value
-        self.operator = operator
+    # Names are identifiers; a name runs on for as long as it can
+    NAME = re.compile(r"[^\W\d]\w*")
+    kind = ValueKind.SCALAR
+
+    def __init__(self, name):
+        self.name = name
+
+    @classmethod
+    def parse(cls, string, location, tokens):
+        # The token is the whole of "$name"
+        return cls(tokens[0][1:]).set_parse_attributes(string, location, tokens)
+
+    def evaluate(self, variables=None, **kwargs):
+        try:
+            value = (variables or {})[self.name]
+        except KeyError:
+            raise self.fatal("Undefined variable: $%s" % self.name)
+
+        if not isinstance(value, int):
+            raise self.fatal("Non-integer variable: $%s" % self.name)
+        return Integer(value)
+
+    def __repr__(self):
+        return "$%s" % self.name
+
+
+class Comparison(namedtuple("Comparison", "left right delta value operator"), Element):
+    """The result of comparing two integers: whether the comparison held, as
+    value, and by how much it held or missed, as delta"""
+
+    __slots__ = ()
 
     def __repr__(self):
         return f'<Comparison: {self.left} {self.operator} {self.right} -> {self.value}, {self.delta}>'
 
 
-class IntegerList(list, Element):
-    "Augments the standard list with an __int__ operator"
+class ComparisonList(Element):
+    """The results of comparing integers element-wise, kept as arrays of the
+    compared values, whether each comparison held and by how much, rather
+    than as a Comparison per value. Indexing and iteration give Comparisons."""
+
+    __slots__ = ("left", "right", "values", "deltas", "operator")
+
+    def __init__(self, left, right, values, deltas, operator):
+        self.left = int_array(left)
+        self.right = int_array(right)
+        self.values = array("b", values)
+        self.deltas = int_array(deltas)
+        self.operator = operator
+
+    @property
+    def successes(self):
+        return sum(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ComparisonList(
+                self.left[index], self.right[index], self.values[index],
+                self.deltas[index], self.operator,
+            )
+        return Comparison(
+            self.left[index], self.right[index], self.deltas[index],
+            bool(self.values[index]), self.operator,
+        )
+
+    def __iter__(self):
+        return map(
+            Comparison, self.left, self.right, self.deltas,
+            map(bool, self.values), repeat(self.operator),
+        )
+
+    def __repr__(self):
+        return "[%s]" % ", ".join(map(repr, self))
+
+
+def int_array(values):
+    """Returns a sequence of integers in an array of 64-bit integers, or in a
+    plain list if they don't all fit in one"""
+    # An array would copy the empty buffer of a wide list
+    if isinstance(values, WideValues):
+        return values.tolist()
+    try:
+        return array("q", values)
+    except OverflowError:
+        return list(values)
+
+
+def _rebuild_list(cls, values):
+    """Unpickles an IntegerList, which can't be rebuilt by calling its class"""
+    ret = cls.__new__(cls)
+    ret.extend(values)
+    return ret
+
+
+def slot_values(obj):
+    """Returns the attributes set in the slots of an object"""
+    values = {}
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            if name not in values and hasattr(obj, name):
+                values[name] = getattr(obj, name)
+    return values
+
+
+class IntegerList(array, Element):
+    """A list of integers kept in an array of machine integers, rather than
+    as a list of int objects. Augments the array with an __int__ operator,
+    and with the parts of the list interface that elements rely on.
+
+    A list given a value that doesn't fit in 64 bits is widened: it becomes
+    an instance of the wide twin of its class, which keeps its values in a
+    plain list instead, see WideValues."""
+
+    __slots__ = ("sum", "wide_values")
+
+    def __new__(cls, *args, **kwargs):
+        # Subclasses take other arguments, so the values are added in __init__
+        return array.__new__(cls, "q")
+
+    def __init__(self, values=()):
+        # Extending an array from a wide list would copy its empty buffer
+        if isinstance(values, WideValues):
+            self.widen(values)
+            return
+        try:
+            self.extend(values)
+        except OverflowError:
+            self.widen(values)
+
+    def widen(self, values):
+        """Replaces the values with values, a sequence, kept in a plain list"""
+        array.__delitem__(self, slice(None))
+        self.__class__ = widened(type(self))
+        self.wide_values = list(values)
+
+    def assign(self, values):
+        """Replaces the values with values, a sequence, widening the list if
+        they don't fit in it"""
+        try:
+            self[:] = values if type(values) is array else array("q", values)
+        except OverflowError:
+            self.widen(values)
+
+    def state_slots(self):
+        """The slots kept when the list is copied or pickled, apart from its
+        values"""
+        slots = slot_values(self)
+        slots.pop("wide_values", None)
+        return slots
 
     def __str__(self):
         ret = "[%s]" % ", ".join(map(str, self))
@@ -101,11 +361,65 @@ class IntegerList(list, Element):
             ret += " -> %i" % self
         return ret
 
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, list):
+            return self.tolist() == other
+        elif isinstance(other, WideValues):
+            return self.tolist() == other.tolist()
+        return array.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __reduce_ex__(self, protocol):
+        state = getattr(self, "__dict__", None) or None
+        slots = self.state_slots()
+        if slots:
+            state = state, slots
+        return _rebuild_list, (type(self), self.tolist()), state
+
+    # array's own copies lose the subclass and its attributes
+    def __copy__(self):
+        ret = _rebuild_list(type(self), self)
+        for name, value in self.state_slots().items():
+            setattr(ret, name, value)
+        if hasattr(self, "__dict__"):
+            ret.__dict__.update(self.__dict__)
+        return ret
+
+    def __deepcopy__(self, memo):
+        ret = _rebuild_list(type(self), self)
+        for name, value in self.state_slots().items():
+            setattr(ret, name, deepcopy(value, memo))
+        if hasattr(self, "__dict__"):
+            ret.__dict__.update(deepcopy(self.__dict__, memo))
+        return ret
+
+    def sort(self, key=None, reverse=False):
+        self.assign(sorted(self, key=key, reverse=reverse))
+
     def copy(self):
         return type(self)(self)
 
     def clear(self):
-        self[:] = []
+        del self[:]
+
+    def apply(self, function, scalar, inplace=False):
+        """Returns function(x, scalar) for each value x, in one pass over the
+        array. With inplace=True this list is reused for the result."""
+        try:
+            values = array("q", map(function, self, repeat(scalar, len(self))))
+        except OverflowError:
+            values = list(map(function, self, repeat(scalar, len(self))))
+        if not inplace:
+            return IntegerList(values)
+        self.assign(values)
+        return self
 
     def __int__(self):
         ret = sum(self)
@@ -113,11 +427,107 @@ class IntegerList(list, Element):
         return ret
 
 
+class WideValues(object):
+    """Keeps the values of an IntegerList in a plain list rather than in its
+    array, for values that don't fit in 64 bits. The wide twin of each
+    IntegerList class puts this ahead of the class, see widened, so that its
+    instances are still instances of the class."""
+
+    __slots__ = ()
+
+    def __new__(cls, *args, **kwargs):
+        self = array.__new__(cls, "q")
+        self.wide_values = []
+        return self
+
+    def __len__(self):
+        return len(self.wide_values)
+
+    def __iter__(self):
+        return iter(self.wide_values)
+
+    def __reversed__(self):
+        return reversed(self.wide_values)
+
+    def __contains__(self, value):
+        return value in self.wide_values
+
+    def __getitem__(self, index):
+        return self.wide_values[index]
+
+    def __setitem__(self, index, value):
+        self.wide_values[index] = value
+
+    def __delitem__(self, index):
+        del self.wide_values[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, array)):
+            return self.wide_values == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def append(self, value):
+        self.wide_values.append(value)
+
+    def extend(self, values):
+        self.wide_values.extend(values)
+
+    def insert(self, index, value):
+        self.wide_values.insert(index, value)
+
+    def pop(self, index=-1):
+        return self.wide_values.pop(index)
+
+    def remove(self, value):
+        self.wide_values.remove(value)
+
+    def index(self, value, *args):
+        return self.wide_values.index(value, *args)
+
+    def count(self, value):
+        return self.wide_values.count(value)
+
+    def reverse(self):
+        self.wide_values.reverse()
+
+    def tolist(self):
+        return list(self.wide_values)
+
+    def widen(self, values):
+        self.wide_values = list(values)
+
+    def assign(self, values):
+        self.wide_values[:] = values
+
+
+_wide_classes = {}
+
+
+def widened(cls):
+    """Returns the wide twin of an IntegerList class, which keeps its values
+    in a plain list"""
+    if issubclass(cls, WideValues):
+        return cls
+    wide = _wide_classes.get(cls)
+    if wide is None:
+        wide = type(
+            "Wide" + cls.__name__,
+            (WideValues, cls),
+            {"__slots__": (), "__module__": cls.__module__},
+        )
+        _wide_classes[cls] = wide
+    return wide
+
+
 class Roll(IntegerList):
     """Represents a randomized result from a random element"""
 
+    __slots__ = ("random_element", "force_extreme")
+
     @classmethod
-    def roll_single(cls, min_value, max_value, **kwargs):
+    def bounds(cls, min_value, max_value, **kwargs):
         integer_min = cls.evaluate_object(min_value, Integer, **kwargs)
         integer_max = cls.evaluate_object(max_value, Integer, **kwargs)
 
@@ -126,8 +536,13 @@ class Roll(IntegerList):
                 "Roll must have a valid range (got %s - %s, "
                 "which evaluated to %i - %i). Are you trying to "
                 "use a fudge roll as the sides?"
-                % (min_value, max_value, integer_min, integer_max)
+                % (unfolded(min_value), unfolded(max_value), integer_min, integer_max)
             )
+        return integer_min, integer_max
+
+    @classmethod
+    def roll_single(cls, min_value, max_value, **kwargs):
+        integer_min, integer_max = cls.bounds(min_value, max_value, **kwargs)
         rnd_engine = kwargs.get("random", random)
         return rnd_engine.randint(integer_min, integer_max)
 
@@ -141,8 +556,17 @@ class Roll(IntegerList):
             raise ValueError("Too many dice! (max is %i)" % max_dice)
         elif amount < 0:
             raise ValueError("Cannot roll less than zero dice!")
+        elif amount == 0:
+            return []
+
+        # Coerce the bounds once, rather than once per die
+        integer_min, integer_max = cls.bounds(min_value, max_value, **kwargs)
+        rnd_engine = kwargs.get("random", random)
+        if hasattr(rnd_engine, "randints"):
+            return rnd_engine.randints(integer_min, integer_max, amount)
 
-        return [cls.roll_single(min_value, max_value, **kwargs) for i in range(amount)]
+        randint = rnd_engine.randint
+        return [randint(integer_min, integer_max) for i in range(amount)]
 
     def do_roll_single(self, min_value=None, max_value=None, **kwargs):
         element = self.random_element
@@ -157,6 +581,11 @@ class Roll(IntegerList):
 
         if max_value is None:
             max_value = element.max_value
+
+        limits = kwargs.get("limits")
+        if limits is not None:
+            limits.roll(element, 1)
+
         try:
             return self.roll_single(min_value, max_value, **kwargs)
         except ValueError as e:
@@ -173,19 +602,29 @@ class Roll(IntegerList):
             max_value = element.max_value
 
         try:
-            return self.roll(amount, min_value, max_value, **kwargs)
+            rolled = self.roll(amount, min_value, max_value, **kwargs)
         except ValueError as e:
             exc = self.random_element.fatal(e.args[0])
             exc.__cause__ = None
             raise exc
 
+        limits = kwargs.get("limits")
+        if limits is not None:
+            limits.roll(element, len(rolled))
+        return rolled
+
     def __init__(self, element, rolled=None, **kwargs):
         self.random_element = element
         self.force_extreme = kwargs.get("force_extreme")
 
-        amount = self.evaluate_object(element.amount, Integer, **kwargs)
-        min_value = self.evaluate_object(element.min_value, Integer, **kwargs)
-        max_value = self.evaluate_object(element.max_value, Integer, **kwargs)
+        # Optimized dice with integer operands have them precomputed
+        bounds = getattr(element, "bounds", None)
+        if bounds is not None:
+            amount, min_value, max_value = bounds
+        else:
+            amount = self.evaluate_object(element.amount, Integer, **kwargs)
+            min_value = self.evaluate_object(element.min_value, Integer, **kwargs)
+            max_value = self.evaluate_object(element.max_value, Integer, **kwargs)
 
         if rolled is None:
             max_dice = kwargs.get("max_dice", MAX_ROLL_DICE)
@@ -197,9 +636,10 @@ class Roll(IntegerList):
                 raise exc
             elif amount < 0:
                 msg = "Cannot roll less than zero dice!"
+                orig_amount = unfolded(element.amount)
 
-                if not isinstance(element.amount, int):
-                    msg += " (%s evaluated to %s)" % (element.amount, amount)
+                if not isinstance(orig_amount, int):
+                    msg += " (%s evaluated to %s)" % (orig_amount, amount)
 
                 exc = self.random_element.fatal(msg)
                 exc.__cause__ = None
@@ -209,6 +649,8 @@ class Roll(IntegerList):
                 rolled = [min_value] * amount
             elif self.force_extreme is DiceExtreme.EXTREME_MAX:
                 rolled = [max_value] * amount
+            elif bounds is not None:
+                rolled = self.do_roll(amount, min_value, max_value, **kwargs)
             else:
                 rolled = self.do_roll(**kwargs)
 
@@ -228,6 +670,8 @@ class Roll(IntegerList):
 class WildRoll(Roll):
     """Represents a roll of wild dice"""
 
+    __slots__ = ()
+
     @classmethod
     def roll(cls, amount, min_value, max_value, **kwargs):
         amount = cls.evaluate_object(amount, Integer, **kwargs)
@@ -244,6 +688,8 @@ class WildRoll(Roll):
             return rolls  # Continue as if dice were normal
 
         while rolls[-1] == max_value:
+            if len(rolls) - amount >= MAX_EXPLOSIONS:
+                raise ValueError("Too many explosions!")
             rolls.append(rnd_engine.randint(min_value, max_value))
 
         if len(rolls) == amount and rolls[-1] == min_value:  # failure
@@ -259,15 +705,221 @@ class WildRoll(Roll):
 class ExplodedRoll(Roll):
     """Represents an exploded roll"""
 
+    __slots__ = ()
+
     def __init__(self, original, rolled, **kwargs):
         super(ExplodedRoll, self).__init__(original, rolled=rolled, **kwargs)
 
 
+# The wide twins are defined here, so that they can be pickled
+WideIntegerList = widened(IntegerList)
+WideRoll = widened(Roll)
+WideWildRoll = widened(WildRoll)
+WideExplodedRoll = widened(ExplodedRoll)
+
+
+class CountedList(Element):
+    """A list of integers kept as the number of times each value occurs, in
+    ascending order of value. Operators work on the counts, so that a pool of
+    far more dice than sides costs O(sides) rather than O(dice)."""
+
+    __slots__ = ("values", "counts")
+
+    def __init__(self, values=(), counts=()):
+        merged = {}
+        for value, count in zip(values, counts):
+            if count:
+                merged[value] = merged.get(value, 0) + count
+
+        self.values = sorted(merged)
+        self.counts = [merged[value] for value in self.values]
+
+    def with_counts(self, values, counts):
+        """Returns a list of the same kind with the given counts"""
+        return CountedList(values, counts)
+
+    def copy(self):
+        return self.with_counts(self.values, self.counts)
+
+    def items(self):
+        return zip(self.values, self.counts)
+
+    def count(self, predicate):
+        """Returns the number of values for which predicate is true"""
+        return sum(count for value, count in self.items() if predicate(value))
+
+    def map(self, func):
+        return CountedList([func(value) for value in self.values], self.counts)
+
+    def filter(self, predicate):
+        return self.with_counts(
+            self.values, [c if predicate(v) else 0 for v, c in self.items()]
+        )
+
+    def merged(self, other):
+        return self.with_counts(
+            self.values + other.values, self.counts + other.counts
+        )
+
+    def keep(self, start, stop):
+        """Keeps the values from position start to stop in sorted order"""
+        values, counts, position = [], [], 0
+
+        for value, count in self.items():
+            low, high = max(start, position), min(stop, position + count)
+            if high > low:
+                values.append(value)
+                counts.append(high - low)
+            position += count
+
+        return self.with_counts(values, counts)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __iter__(self):
+        for value, count in self.items():
+            for i in range(count):
+                yield value
+
+    def __int__(self):
+        return sum(value * count for value, count in self.items())
+
+    def __str__(self):
+        return "{%s}" % ", ".join("%i: %i" % item for item in self.items())
+
+    def __repr__(self):
+        return "{0}({1})".format(classname(self), self)
+
+
+class CountedRoll(CountedList):
+    """Represents a roll of far more dice than sides, as counts of each face.
+
+    Rolls are counted, rather than listed, when the max_pool_dice keyword
+    argument is set and the roll would otherwise be refused for having too
+    many dice."""
+
+    __slots__ = ("random_element", "force_extreme")
+
+    @classmethod
+    def counts_element(cls, element, **kwargs):
+        max_pool_dice = kwargs.get("max_pool_dice")
+        if not max_pool_dice:
+            return False
+
+        amount = cls.evaluate_object(element.amount, Integer, **kwargs)
+        if amount <= kwargs.get("max_dice", MAX_ROLL_DICE):
+            return False
+
+        min_value = cls.evaluate_object(element.min_value, Integer, **kwargs)
+        max_value = cls.evaluate_object(element.max_value, Integer, **kwargs)
+        return amount >= POOL_SIDES_RATIO * (max_value - min_value + 1)
+
+    def __init__(self, element, values=None, counts=None, **kwargs):
+        self.random_element = element
+        self.force_extreme = kwargs.get("force_extreme")
+
+        if counts is None:
+            amount = self.evaluate_object(element.amount, Integer, **kwargs)
+            max_pool_dice = kwargs.get("max_pool_dice", 0)
+
+            if amount > max_pool_dice:
+                msg = "Too many dice! (max is %i)" % max_pool_dice
+                exc = self.random_element.fatal(msg)
+                exc.__cause__ = None
+                raise exc
+
+            values, counts = self.roll(amount, **kwargs)
+
+        super(CountedRoll, self).__init__(values, counts)
+
+    def roll(self, amount, min_value=None, max_value=None, **kwargs):
+        """Returns the faces and their counts for amount new dice"""
+        element = self.random_element
+        if min_value is None:
+            min_value = element.min_value
+        if max_value is None:
+            max_value = element.max_value
+
+        try:
+            min_value, max_value = Roll.bounds(min_value, max_value, **kwargs)
+        except ValueError as e:
+            exc = element.fatal(e.args[0])
+            exc.__cause__ = None
+            raise exc
+
+        if self.force_extreme is DiceExtreme.EXTREME_MIN:
+            return [min_value], [amount]
+        elif self.force_extreme is DiceExtreme.EXTREME_MAX:
+            return [max_value], [amount]
+
+        # Drawing the counts costs about one die per face
+        limits = kwargs.get("limits")
+        if limits is not None:
+            limits.roll(element, max_value - min_value + 1)
+
+        counts = multinomial(
+            amount, max_value - min_value + 1, kwargs.get("random", random)
+        )
+        return list(range(min_value, max_value + 1)), counts
+
+    def do_roll(self, amount, min_value=None, **kwargs):
+        """Rolls amount more of the same dice"""
+        values, counts = self.roll(amount, min_value, **kwargs)
+        return self.with_counts(values, counts)
+
+    def with_counts(self, values, counts):
+        return CountedRoll(
+            self.random_element, values, counts, force_extreme=self.force_extreme
+        )
+
+    def __repr__(self):
+        return "{0}({1}, random_element={2!r})".format(
+            classname(self), self, self.random_element
+        )
+
+
+class CountedComparisons(Element):
+    """The comparisons of each value of a CountedList, and how many times
+    each occurs"""
+
+    __slots__ = ("comparisons", "counts")
+
+    def __init__(self, comparisons, counts):
+        self.comparisons = comparisons
+        self.counts = counts
+
+    def items(self):
+        return zip(self.comparisons, self.counts)
+
+    @property
+    def successes(self):
+        return sum(count for comparison, count in self.items() if comparison.value)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __iter__(self):
+        for comparison, count in self.items():
+            for i in range(count):
+                yield comparison
+
+    def __str__(self):
+        return "%i of %i succeeded" % (self.successes, len(self))
+
+    def __repr__(self):
+        return "{0}({1})".format(
+            classname(self),
+            ", ".join("%r: %i" % (c, n) for c, n in self.items()),
+        )
+
+
 class RandomElement(Element):
     """Represents a set of elements with a random numerical result"""
 
     DICE_MAP = {}
     SEPARATOR = None
+    kind = ValueKind.ROLL
 
     @classmethod
     def register_dice(cls, new_cls):
@@ -342,6 +994,8 @@ class RandomElement(Element):
         )
 
     def evaluate(self, **kwargs):
+        if CountedRoll.counts_element(self, **kwargs):
+            return CountedRoll(self, **kwargs)
         return Roll(self, **kwargs)
 
 
@@ -397,8 +1051,52 @@ class FudgeDice(Dice):
         return "{}({})".format(classname(self), p)
 
 
+_arities = {}
+
+
+def arity(method, keywords=()):
+    """Returns the number of operands a method of an operator takes, or None if
+    it takes any number. Arguments in keywords are passed by name, so aren't
+    counted."""
+    code = method.__code__
+    try:
+        return _arities[code, keywords]
+    except KeyError:
+        pass
+
+    if code.co_flags & CO_VARARGS:
+        count = None
+    else:
+        names = code.co_varnames[1 : code.co_argcount]
+        count = len([n for n in names if n not in keywords])
+
+    _arities[code, keywords] = count
+    return count
+
+
+def elementwise_kind(kinds):
+    """Operators applied to each value give a scalar for a scalar, and a list
+    for any list"""
+    if kinds[0] == ValueKind.SCALAR:
+        return ValueKind.SCALAR
+    elif kinds[0] in (ValueKind.LIST, ValueKind.ROLL):
+        return ValueKind.LIST
+
+
+def list_kind(kinds):
+    """Operators picking from a list give a list of the same kind"""
+    if kinds[0] in (ValueKind.LIST, ValueKind.ROLL):
+        return kinds[0]
+
+
 class Operator(Element):
     PASS_KWARGS = ()
+    # The kind of value the operator evaluates to, and the name of the method
+    # evaluating it. Optimized trees have them set from the kinds of their
+    # operands; otherwise the function, which takes anything, is used.
+    kind = None
+    output_kind = None
+    kernel = "function"
 
     def __init__(self, *operands):
         self.operands = self.original_operands = operands
@@ -411,17 +1109,39 @@ class Operator(Element):
     def __getnewargs__(self):
         return self.original_operands
 
+    def result_kind(self, kinds):
+        """Returns the kind of value the operator evaluates to, given the kinds
+        of its operands, or None if it isn't known before evaluation"""
+        return self.output_kind
+
+    def select_kernel(self, kinds):
+        """Returns the name of the method to evaluate operands of the given
+        kinds with"""
+        return "function"
+
     def preprocess_operands(self, *operands, **kwargs):
         def eval_wrapper(operand):
             return self.evaluate_object(operand, **kwargs)
 
         return [eval_wrapper(o) for o in operands]
 
+    @staticmethod
+    def owns_result(operand, trace=None, **kwargs):
+        """Whether the result of an operand is used by this operator alone, so
+        may be modified in place. Results of random elements are kept for
+        display, and other results only when the trace keeps intermediates."""
+        return (
+            isinstance(operand, Operator)
+            and trace is not None
+            and not trace.keep_intermediates
+        )
+
     def evaluate(self, **kwargs):
-        if not kwargs.get("cache", False):
-            self.operands = self.original_operands
+        operands = self.preprocess_operands(*self.original_operands, **kwargs)
 
-        self.operands = self.preprocess_operands(*self.operands, **kwargs)
+        limits = kwargs.get("limits")
+        if limits is not None:
+            limits.step(self)
 
         function_kw = {}
 
@@ -429,16 +1149,34 @@ class Operator(Element):
             if k in kwargs:
                 function_kw[k] = kwargs[k]
 
+        if "rhs" in self.PASS_KWARGS:
+            function_kw["rhs"] = self.original_operands[-1]
+        if "inplace" in self.PASS_KWARGS:
+            function_kw["inplace"] = self.owns_result(
+                self.original_operands[0], **kwargs
+            )
+
+        kernel = getattr(self, self.kernel)
+        # With two operands, a kernel taking fewer would fail either way
+        count = len(operands)
+        if count > 2:
+            count = arity(kernel, self.PASS_KWARGS)
+
         try:
-            try:
-                self.rhs_index = -1
-                value = self.function(*self.operands)
-            except TypeError:
-                value = self.operands[0]
+            if count is None or len(operands) <= count:
+                value = kernel(*operands, **function_kw)
+            else:
+                # More operands than the kernel takes: apply it to each in turn
+                value = operands[0]
 
-                for i, o in enumerate(self.operands[1:]):
-                    self.rhs_index = i
-                    value = self.function(value, o)
+                for i, o in enumerate(operands[1:]):
+                    if "rhs" in self.PASS_KWARGS:
+                        function_kw["rhs"] = self.original_operands[i + 1]
+                    value = kernel(value, o, **function_kw)
+
+                    # Later steps work on this operator's own result
+                    if "inplace" in self.PASS_KWARGS:
+                        function_kw["inplace"] = True
 
             if hasattr(self.__class__, "output_cls"):
                 return self.evaluate_object(value, self.output_cls, **kwargs)
@@ -446,8 +1184,8 @@ class Operator(Element):
             return value
 
         except ZeroDivisionError:
-            zero = self.operands[1:].index(0) + 1
-            zero_op = self.original_operands[zero]
+            zero = operands[1:].index(0) + 1
+            zero_op = unfolded(self.original_operands[zero])
             offset = zero_op.location - self.location
             msg = "Division by zero"
 
@@ -481,182 +1219,193 @@ class RHSIntegerOperator(IntegerOperator):
         return ret
 
 
-class Div(RHSIntegerOperator):
-    
-    def function(self, left, scalar):
-        try:
-            left = IntegerList(left)
-            scalar = int(scalar)
-
-            for i, x in enumerate(left):
-                left[i] = x // scalar
-
-            return left
-        except TypeError as e:
-            return Integer(perator.floordiv(left, scalar))
+class ElementwiseOperator(RHSIntegerOperator):
+    """Applies a function of two integers to a scalar, or to each value of a
+    list. Lists owned by the operator are reused for the result."""
 
+    PASS_KWARGS = ("inplace",)
+    elementwise = None
 
-class Mul(RHSIntegerOperator):
+    result_kind = staticmethod(elementwise_kind)
 
-    def function(self, left, scalar):
-        try:
-            left = IntegerList(left)
-            scalar = int(scalar)
+    def select_kernel(self, kinds):
+        if all(k == ValueKind.SCALAR for k in kinds):
+            return "scalar_function"
+        return "function"
 
-            for i, x in enumerate(left):
-                left[i] = x * scalar
+    def scalar_function(self, left, scalar, inplace=False):
+        return Integer(self.elementwise(left, scalar))
 
-            return left
-        except TypeError as e:
-            return Integer(operator.mul(left, scalar))
+    def function(self, left, scalar, inplace=False):
+        scalar = int(scalar)
 
+        if isinstance(left, CountedList):
+            return left.map(lambda x: self.elementwise(x, scalar))
+        elif isinstance(left, IntegerList):
+            # Rolls are copied, as their type and values are kept for display
+            inplace = inplace and type(left) is IntegerList
+            return left.apply(self.elementwise, scalar, inplace)
 
-class Sub(RHSIntegerOperator):
-    
-    def function(self, left, scalar):
-        try:
-            left = IntegerList(left)
-            scalar = int(scalar)
-
-            for i, x in enumerate(left):
-                left[i] = x - scalar
+        return Integer(self.elementwise(left, scalar))
 
-            return left
-        except TypeError as e:
-            return Integer(operator.sub(left, scalar))
 
+class Div(ElementwiseOperator):
+    elementwise = staticmethod(operator.floordiv)
 
-class Add(RHSIntegerOperator):
 
-    def function(self, left, scalar):
-        try:
-            left = IntegerList(left)
-            scalar = int(scalar)
+class Mul(ElementwiseOperator):
+    elementwise = staticmethod(operator.mul)
 
-            for i, x in enumerate(left):
-                left[i] = x + scalar
 
-            return left
-        except TypeError as e:
-            return Integer(operator.add(left, scalar))
+class Sub(ElementwiseOperator):
+    elementwise = staticmethod(operator.sub)
 
 
-class Modulo(RHSIntegerOperator):
-    
-    def function(self, left, scalar):
-        try:
-            left = IntegerList(left)
-            scalar = int(scalar)
+class Add(ElementwiseOperator):
+    elementwise = staticmethod(operator.add)
 
-            for i, x in enumerate(left):
-                left[i] = x % scalar
 
-            return left
-        except TypeError as e:
-            return Integer(operator.mod(left, scalar))
+class Modulo(ElementwiseOperator):
+    elementwise = staticmethod(operator.mod)
 
 
 class ComparisonOperator(Operator):
 
     token = ''
+    relation = None
+    # Strict comparisons miss by one more, and hold by one less
+    strict = False
+    output_kind = ValueKind.COMPARISONS
+
+    def select_kernel(self, kinds):
+        if all(k == ValueKind.SCALAR for k in kinds):
+            return "scalar_function"
+        return "function"
 
     def _impl(self, left, right):
-        raise NotImplementedError()
+        result = self.relation(left, right)
+        delta = abs(right - left)
+        if self.strict:
+            delta += 1 if not result else -1
+        return result, delta
+
+    def compare(self, left, right):
+        """Compares two sequences of integers of the same length element-wise,
+        with a single pass over the arrays for each of the value and delta"""
+        left, right = int_array(left), int_array(right)
+        values = array("b", map(self.relation, left, right))
+        deltas = list(map(abs, map(operator.sub, right, left)))
+
+        if self.strict:
+            deltas = list(map(operator.add, deltas, map((1, -1).__getitem__, values)))
+
+        return ComparisonList(left, right, values, deltas, self.token)
+
+    def scalar_function(self, left, right):
+        return self.compare((left,), (right,))
 
     def function(self, left, right):
+        if isinstance(left, CountedList) or isinstance(right, CountedList):
+            counted = self.counted_function(left, right)
+            if counted is not None:
+                return counted
+            left, right = self.expand(left), self.expand(right)
+
         if isinstance(left, IntegerList) and \
            isinstance(right, IntegerList):
 
             if len(left) != len(right):
                 raise TypeError('Element-wise comparison requires lists of equal length')
-            
-            result = []
-            for l, r in zip(left, right):
-                value, delta = self._impl(l, r)
-                result.append(Comparison(l, r, delta, value, self.token))
-            return result
+            return self.compare(left, right)
 
         elif isinstance(left, IntegerList):
-            result = []
-            for i in left:
-                value, delta = self._impl(i, right)
-                result.append(Comparison(i, right, delta, value, self.token))
-            return result
+            return self.compare(left, [right] * len(left))
         elif isinstance(right, IntegerList):
-            result = []
-            for i in right:
-                value, delta = self._impl(left, i)
-                result.append(Comparison(left, i, delta, value, self.token))
-            return result
+            return self.compare([left] * len(right), right)
         else:
-            value, delta = self._impl(left, right)
-            return [Comparison(left, right, delta, value, self.token)]
+            return self.compare((left,), (right,))
+
+    def counted_function(self, left, right):
+        """Compares each distinct value of a CountedList with a scalar"""
+        if isinstance(left, CountedList) and not isinstance(right, (IntegerList, CountedList)):
+            comparisons = self.compare(left.values, [right] * len(left.values))
+            return CountedComparisons(comparisons, left.counts)
+        elif isinstance(right, CountedList) and not isinstance(left, (IntegerList, CountedList)):
+            comparisons = self.compare([left] * len(right.values), right.values)
+            return CountedComparisons(comparisons, right.counts)
+
+    @staticmethod
+    def expand(operand):
+        """Element-wise comparisons need the values of a CountedList in turn"""
+        if isinstance(operand, CountedList):
+            return IntegerList(operand)
+        return operand
 
 
 class Equals(ComparisonOperator):
 
     token = '=='
-
-    def _impl(self, left, right):
-        result = left == right
-        delta = abs(right - left)
-        return result, delta
+    relation = staticmethod(operator.eq)
 
 
 class LessThan(ComparisonOperator):
 
     token = '<'
-
-    def _impl(self, left, right):
-        result = left < right
-        delta = abs(right - left) + (1 if not result else -1)
-        return result, delta
+    relation = staticmethod(operator.lt)
+    strict = True
 
 
 class LessThanEqual(ComparisonOperator):
 
     token = '<='
-
-    def _impl(self, left, right):
-        result = left <= right
-        delta = abs(right - left)
-        return result, delta
+    relation = staticmethod(operator.le)
 
 
 class GreaterThan(ComparisonOperator):
 
     token = '>'
-
-    def _impl(self, left, right):
-        result = left > right
-        delta = abs(right - left) + (1 if not result else -1)
-        return result, delta
+    relation = staticmethod(operator.gt)
+    strict = True
 
 
 class GreaterThanEqual(ComparisonOperator):
 
     token = '>='
-
-    def _impl(self, left, right):
-        result = left >= right
-        delta = abs(left - right)
-        return result, delta
+    relation = staticmethod(operator.ge)
 
 
 class AddEvenSubOdd(Operator):
     function = add_even_sub_odd
+    result_kind = staticmethod(elementwise_kind)
 
 
 class Total(Operator):
     output_cls = Integer
-    function = sum
+    output_kind = ValueKind.SCALAR
+
+    def select_kernel(self, kinds):
+        if kinds == [ValueKind.SCALAR]:
+            return "scalar_function"
+        return "function"
+
+    def scalar_function(self, value):
+        return value
+
+    def function(self, *args):
+        if len(args) == 1 and isinstance(args[0], CountedList):
+            return int(args[0])
+        elif len(args) == 1 and isinstance(args[0], int):
+            return args[0]
+        return sum(*args)
 
 
 class Successes(RHSIntegerOperator):
+    output_kind = ValueKind.SCALAR
+
     def function(self, iterable, thresh):
-        if not isinstance(iterable, IntegerList):
+        if not isinstance(iterable, (IntegerList, CountedList)):
             iterable = (iterable,)
-        elif isinstance(iterable, Roll):
+        elif isinstance(iterable, (Roll, CountedRoll)):
             max_value = iterable.random_element.max_value
 
             if isinstance(max_value, RandomElement):
@@ -668,15 +1417,20 @@ class Successes(RHSIntegerOperator):
             if thresh > iterable.random_element.max_value:
                 raise self.fatal("Success threshold higher than roll result.")
 
+        if isinstance(iterable, CountedList):
+            return iterable.count(lambda x: x >= thresh)
+
         return sum(x >= thresh for x in iterable)
 
 
 class SuccessFail(RHSIntegerOperator):
+    output_kind = ValueKind.SCALAR
+
     def function(self, iterable, thresh):
         result = 0
-        if not isinstance(iterable, IntegerList):
+        if not isinstance(iterable, (IntegerList, CountedList)):
             iterable = (iterable,)
-        elif isinstance(iterable, Roll):
+        elif isinstance(iterable, (Roll, CountedRoll)):
             max_value = iterable.random_element.max_value
 
             if isinstance(max_value, RandomElement):
@@ -690,11 +1444,16 @@ class SuccessFail(RHSIntegerOperator):
                     "Success threshold higher than maximum roll " "result."
                 )
 
-        if isinstance(iterable, Roll):
+        if isinstance(iterable, (Roll, CountedRoll)):
             fail_level = iterable.random_element.min_value
         else:
             fail_level = 1
 
+        if isinstance(iterable, CountedList):
+            return iterable.count(lambda x: x >= thresh) - iterable.count(
+                lambda x: x < thresh and x <= fail_level
+            )
+
         for x in iterable:
             if x >= thresh:
                 result += 1
@@ -705,17 +1464,22 @@ class SuccessFail(RHSIntegerOperator):
 
 
 class Again(RHSIntegerOperator):
+    output_kind = ValueKind.LIST
+
     def function(self, lhs, rhs=None):
 
-        if not isinstance(lhs, IntegerList):
+        if not isinstance(lhs, (IntegerList, CountedList)):
             lhs = IntegerList([lhs])
 
         if rhs is None:
-            if not isinstance(lhs, Roll):
+            if not isinstance(lhs, (Roll, CountedRoll)):
                 raise self.fatal("%s is not a random element" % lhs)
 
             rhs = lhs.random_element.max_value
 
+        if isinstance(lhs, CountedList):
+            return lhs.merged(lhs.filter(lambda x: x == rhs))
+
         ret = lhs.copy()
         ret.clear()
 
@@ -729,7 +1493,11 @@ class Again(RHSIntegerOperator):
 
 
 class Sort(Operator):
+    output_kind = ValueKind.LIST
+
     def function(self, iterable):
+        if isinstance(iterable, CountedList):
+            return iterable.copy()
         if not isinstance(iterable, IntegerList):
             raise self.fatal("Cannot sort %s!" % iterable)
 
@@ -739,105 +1507,94 @@ class Sort(Operator):
 
 
 class Extend(Operator):
+    output_kind = ValueKind.LIST
+
     def function(self, *args):
-        ret = IntegerList()
+        ret = []
         for x in args:
-            try:
-                ret.extend(x)
-            except TypeError:
+            if isinstance(x, int):
                 ret.append(x)
+            else:
+                ret.extend(x)
 
-        return ret
+        return IntegerList(ret)
 
 
 class Array(Operator):
+    output_kind = ValueKind.LIST
+
     def function(self, *args):
-        print('Array')
-        ret = IntegerList()
+        ret = []
 
         for x in args:
-            try:
+            if isinstance(x, CountedList):
+                x = int(x)
+            elif not isinstance(x, int):
                 x = sum(x)
-            except TypeError:
-                pass
             ret.append(x)
 
-        return ret
-
-
-# TODO: stable removal instead of sort -> slice -> shuffle
-class Lowest(RHSIntegerOperator):
-    PASS_KWARGS = ("random",)
-
-    def function(self, iterable, n=None, **kwargs):
-        if not isinstance(iterable, IntegerList):
-            raise self.fatal("Can't take the lowest values of a scalar!")
+        return IntegerList(ret)
 
-        if n is None:
-            n = len(iterable) - 1
 
-        iterable = iterable.copy()
-        iterable.sort()
-        iterable[n:] = []
-        kwargs.get("random", random).shuffle(iterable)
-        return iterable
+class Selection(RHSIntegerOperator):
+    """Keeps some of the values of a list by rank, in the order they came in.
+    window gives the ranks kept, lowest first, given the length of the list
+    and the operand, see utilities.lowest_window."""
 
+    result_kind = staticmethod(list_kind)
+    window = None
+    description = None
 
-class Highest(RHSIntegerOperator):
-    PASS_KWARGS = ("random",)
-
-    def function(self, iterable, n=None, **kwargs):
-        if not isinstance(iterable, IntegerList):
-            raise self.fatal("Can't take the highest values of a scalar!")
+    def function(self, iterable, n=None):
+        if not isinstance(iterable, (IntegerList, CountedList)):
+            raise self.fatal("Can't take the %s values of a scalar!" % self.description)
 
-        if n is None:
-            n = len(iterable) - 1
+        start, stop = self.window(len(iterable), n)
 
-        iterable = iterable.copy()
-        iterable.sort()
-        iterable[:-n] = []
-        kwargs.get("random", random).shuffle(iterable)
-        return iterable
+        # Counted values are already in order of rank
+        if isinstance(iterable, CountedList):
+            return iterable.keep(start, stop)
 
+        result = iterable.copy()
+        result.assign(select_window(iterable, start, stop))
+        return result
 
-class Middle(RHSIntegerOperator):
-    PASS_KWARGS = ("random",)
 
-    def function(self, iterable, n=None, **kwargs):
-        if not isinstance(iterable, IntegerList):
-            raise self.fatal("Can't take the middle values of a scalar!")
+class Lowest(Selection):
+    window = staticmethod(lowest_window)
+    description = "lowest"
 
-        num = len(iterable)
 
-        if n is None:
-            n = (num - 2) if num > 2 else 1
-        elif n <= 0:
-            n += num
+class Highest(Selection):
+    window = staticmethod(highest_window)
+    description = "highest"
 
-        num_remove = num - n
-        upper = num_remove // 2
-        lower = num_remove - upper
 
-        iterable = iterable.copy()
-        iterable.sort()
-        iterable[:lower], iterable[-upper:] = [], []
-        kwargs.get("random", random).shuffle(iterable)
-        return iterable
+class Middle(Selection):
+    window = staticmethod(middle_window)
+    description = "middle"
 
 
 class Explode(RHSIntegerOperator):
-    def function(self, roll, thresh=None):
-        if not isinstance(roll, Roll):
+    PASS_KWARGS = ("random", "limits", "max_dice", "rhs")
+    output_kind = ValueKind.ROLL
+
+    def function(self, roll, thresh=None, rhs=None, **kwargs):
+        if not isinstance(roll, (Roll, CountedRoll)):
             raise self.fatal("Cannot explode {0}".format(roll))
         elif thresh is None:
             thresh = roll.random_element.max_value
 
+            # Dice with rolled sides have no highest face to explode on
+            if isinstance(thresh, RandomElement):
+                return roll
+
         if roll.random_element.min_value == roll.random_element.max_value:
             raise self.fatal("Cannot explode a roll of one-sided dice.")
 
         elif thresh <= roll.random_element.min_value:
             offset = 0
-            orig_thresh = self.original_operands[self.rhs_index]
+            orig_thresh = unfolded(rhs)
 
             if thresh is not None:
                 offset = orig_thresh.location - self.location
@@ -852,8 +1609,62 @@ class Explode(RHSIntegerOperator):
 
             raise self.fatal(msg, offset=offset)
 
-        explosions = 0
+        element = roll.random_element
+        bounds = element.min_value, element.max_value
+
+        # Counted rolls, wild dice and dice with rolled sides explode one
+        # round at a time
+        if (
+            isinstance(roll, (CountedRoll, WildRoll))
+            or not isinstance(bounds[0], int)
+            or not isinstance(bounds[1], int)
+        ):
+            return self.explode_rounds(roll, thresh, **kwargs)
+
+        # Each die that explodes adds a chain of dice, which ends at the first
+        # that doesn't explode again, so its length is geometric
+        min_value, max_value = bounds
+        rnd_engine = kwargs.get("random", random)
+        hits = sum(x >= thresh for x in roll)
+        chains = []
+        if hits:
+            chance = (thresh - min_value) / float(max_value - min_value + 1)
+            chains = geometric(hits, chance, rnd_engine)
+
+        # The rounds of the loop in explode_rounds, including the last, which
+        # adds nothing
+        rounds = (max(chains) + 1) if chains else int(bool(roll))
+        max_dice = kwargs.get("max_dice", MAX_ROLL_DICE)
+        if hits > max_dice:
+            raise element.fatal("Too many dice! (max is %i)" % max_dice)
+
+        # Charged for the rounds before running out of explosions
+        limits = kwargs.get("limits")
+        if limits is not None:
+            limits.step(self, min(rounds, MAX_EXPLOSIONS - 1))
+            limits.roll(element, sum(min(n, MAX_EXPLOSIONS - 1) for n in chains))
+        if rounds >= MAX_EXPLOSIONS:
+            raise self.fatal("Too many explosions!")
+
         result = list(roll)
+        if hits:
+            # The faces of the dice that explode again, then of the last of
+            # each chain, drawn in one batch each
+            num_hits = sum(chains) - hits
+            hit_faces = Roll.roll(
+                num_hits, thresh, max_value, random=rnd_engine, max_dice=num_hits
+            )
+            miss_faces = Roll.roll(hits, min_value, thresh - 1, random=rnd_engine)
+            result.extend(exploded_order(chains, hit_faces, miss_faces))
+
+        return ExplodedRoll(element, rolled=result)
+
+    def explode_rounds(self, roll, thresh, **kwargs):
+        """Explodes a roll by rolling again for each die that exploded in the
+        last round, until none do"""
+        explosions = 0
+        limits = kwargs.get("limits")
+        result = roll if isinstance(roll, CountedRoll) else list(roll)
         rerolled = roll
 
         while rerolled:
@@ -861,17 +1672,30 @@ class Explode(RHSIntegerOperator):
 
             if explosions >= MAX_EXPLOSIONS:
                 raise self.fatal("Too many explosions!")
+            if limits is not None:
+                limits.step(self)
+
+            if isinstance(roll, CountedRoll):
+                num_rerolls = rerolled.count(lambda x: x >= thresh)
+                rerolled = roll.do_roll(num_rerolls, **kwargs)
+                result = result.merged(rerolled)
+            else:
+                num_rerolls = sum(x >= thresh for x in rerolled)
+                rerolled = roll.do_roll(num_rerolls, **kwargs)
+                result.extend(rerolled)
 
-            num_rerolls = sum(x >= thresh for x in rerolled)
-            rerolled = roll.do_roll(num_rerolls)
-            result.extend(rerolled)
+        if isinstance(roll, CountedRoll):
+            return result
 
         return ExplodedRoll(roll.random_element, rolled=result)
 
 
 class Reroll(RHSIntegerOperator):
-    def function(self, roll, thresh=None):
-        if not isinstance(roll, Roll):
+    PASS_KWARGS = ("random", "limits")
+    output_kind = ValueKind.ROLL
+
+    def function(self, roll, thresh=None, **kwargs):
+        if not isinstance(roll, (Roll, CountedRoll)):
             raise self.fatal("Cannot reroll {0}".format(roll))
 
         elem = roll.random_element
@@ -885,18 +1709,20 @@ class Reroll(RHSIntegerOperator):
         if thresh is None:
             thresh = elem.min_value
 
-        roll = Roll(elem, rolled=roll, force_extreme=roll.force_extreme)
+        if isinstance(roll, CountedRoll):
+            rerolled = roll.do_roll(roll.count(lambda x: x <= thresh), **kwargs)
+            return roll.filter(lambda x: x > thresh).merged(rerolled)
 
-        for i, x in enumerate(roll):
-            if x <= thresh:
-                roll[i] = roll.do_roll_single()
-
-        return roll
+        rolled = [roll.do_roll_single(**kwargs) if x <= thresh else x for x in roll]
+        return Roll(elem, rolled=rolled, force_extreme=roll.force_extreme)
 
 
 class ForceReroll(RHSIntegerOperator):
-    def function(self, roll, thresh=None, force_min=False):
-        if not isinstance(roll, Roll):
+    PASS_KWARGS = ("random", "limits")
+    output_kind = ValueKind.ROLL
+
+    def function(self, roll, thresh=None, force_min=False, **kwargs):
+        if not isinstance(roll, (Roll, CountedRoll)):
             raise self.fatal("Cannot reroll {0}".format(roll))
 
         elem = roll.random_element
@@ -912,13 +1738,17 @@ class ForceReroll(RHSIntegerOperator):
 
         max_min = min((elem.max_value, thresh + 1))
 
-        roll = Roll(elem, rolled=roll, force_extreme=roll.force_extreme)
-
-        for i, x in enumerate(roll):
-            if x <= thresh:
-                roll[i] = roll.do_roll_single(min_value=max_min)
+        if isinstance(roll, CountedRoll):
+            rerolled = roll.do_roll(
+                roll.count(lambda x: x <= thresh), min_value=max_min, **kwargs
+            )
+            return roll.filter(lambda x: x > thresh).merged(rerolled)
 
-        return roll
+        rolled = [
+            roll.do_roll_single(min_value=max_min, **kwargs) if x <= thresh else x
+            for x in roll
+        ]
+        return Roll(elem, rolled=rolled, force_extreme=roll.force_extreme)
 
 
 class Identity(Operator):
@@ -928,6 +1758,9 @@ class Identity(Operator):
 
 
 class Negate(Operator):
+    PASS_KWARGS = ("inplace",)
+    result_kind = staticmethod(elementwise_kind)
+
     def __new__(cls, x):
         if isinstance(x, int):
             # Passthrough to prevent Negate() clutter
@@ -935,11 +1768,20 @@ class Negate(Operator):
 
         return super(Negate, cls).__new__(cls)
 
-    def function(self, operand):
-        operand = IntegerList(operand)
+    def select_kernel(self, kinds):
+        if kinds == [ValueKind.SCALAR]:
+            return "scalar_function"
+        return "function"
 
-        for i, x in enumerate(operand):
-            operand[i] = -x
+    def scalar_function(self, operand, inplace=False):
+        return Integer(-operand)
 
-        return operand
+    def function(self, operand, inplace=False):
+        if isinstance(operand, CountedList):
+            return operand.map(operator.neg)
+        if not isinstance(operand, IntegerList):
+            return Integer(-operand)
+
+        inplace = inplace and type(operand) is IntegerList
+        return operand.apply(operator.mul, -1, inplace)
 
@@ -31,3 +31,9 @@ class DiceException(DiceBaseException, ParseException):
 
 class DiceFatalException(DiceBaseException, ParseFatalException):
     pass
+
+
+class DiceLimitException(DiceException):
+    """Raised when an evaluation goes over the limits it was given"""
+
+    pass
@@ -1,19 +1,27 @@
 """
 Dice notation grammar
 
+The grammar is built the first time it's used, by get_expression() or by
+reading the expression attribute of this module, and then kept for the life
+of the process. Processes forked after that share it, so a worker pool that
+builds it before starting its workers pays for it once.
+
 PyParsing is patched to make it easier to work with, by removing features
-that get in the way of development and debugging. See the dice.utilities
-module for more information.
+that get in the way of development and debugging, just before the grammar is
+built. See the dice.utilities module for more information.
 """
 
 from __future__ import absolute_import, print_function, unicode_literals
 
+import threading
+
 from pyparsing import (
     CaselessLiteral,
     Forward,
     Literal,
     OneOrMore,
     Or,
+    Regex,
     StringStart,
     StringEnd,
     Suppress,
@@ -51,12 +59,11 @@ from .elements import (
     SuccessFail,
     RandomElement,
     Again,
+    Variable,
 )
 
 from .utilities import patch_pyparsing, wrap_string
 
-patch_pyparsing()
-
 
 def operatorPrecedence(base, operators):
     """
@@ -119,62 +126,97 @@ def operatorPrecedence(base, operators):
     return expression
 
 
-# An integer value
-integer = Word(nums)
-integer.setParseAction(Integer.parse)
-integer.setName("integer")
+def build():
+    """Builds the grammar, returning its parts by name: the expression, and
+    the integer it's built on"""
+    patch_pyparsing()
 
-dice_separators = RandomElement.DICE_MAP.keys()
-dice_element = Or(
-    wrap_string(CaselessLiteral, x, suppress=False) for x in dice_separators
-)
-special = wrap_string(Literal, "%", suppress=False) | wrap_string(
-    CaselessLiteral, "f", suppress=False
-)
+    # An integer value
+    integer = Word(nums)
+    integer.setParseAction(Integer.parse)
+    integer.setName("integer")
 
-# An expression in dice notation
-expression = (
-    StringStart()
-    + operatorPrecedence(
-        integer,
-        [
-            (dice_element, 2, opAssoc.LEFT, RandomElement.parse, special),
-            (dice_element, 1, opAssoc.RIGHT, RandomElement.parse_unary, special),
-            (wrap_string(CaselessLiteral, "x"), 2, opAssoc.LEFT, Explode.parse),
-            (wrap_string(CaselessLiteral, "x"), 1, opAssoc.LEFT, Explode.parse),
-            (wrap_string(CaselessLiteral, "rr"), 2, opAssoc.LEFT, ForceReroll.parse),
-            (wrap_string(CaselessLiteral, "rr"), 1, opAssoc.LEFT, ForceReroll.parse),
-            (wrap_string(CaselessLiteral, "r"), 2, opAssoc.LEFT, Reroll.parse),
-            (wrap_string(CaselessLiteral, "r"), 1, opAssoc.LEFT, Reroll.parse),
-            (wrap_string(Word, "^hH", exact=1), 2, opAssoc.LEFT, Highest.parse),
-            (wrap_string(Word, "^hH", exact=1), 1, opAssoc.LEFT, Highest.parse),
-            (wrap_string(Word, "vlL", exact=1), 2, opAssoc.LEFT, Lowest.parse),
-            (wrap_string(Word, "vlL", exact=1), 1, opAssoc.LEFT, Lowest.parse),
-            (wrap_string(Word, "oOmM", exact=1), 2, opAssoc.LEFT, Middle.parse),
-            (wrap_string(Word, "oOmM", exact=1), 1, opAssoc.LEFT, Middle.parse),
-            (wrap_string(CaselessLiteral, "a"), 2, opAssoc.LEFT, Again.parse),
-            (wrap_string(CaselessLiteral, "a"), 1, opAssoc.LEFT, Again.parse),
-            (wrap_string(CaselessLiteral, "e"), 2, opAssoc.LEFT, Successes.parse),
-            (wrap_string(CaselessLiteral, "f"), 2, opAssoc.LEFT, SuccessFail.parse),
-            (wrap_string(CaselessLiteral, "t"), 1, opAssoc.LEFT, Total.parse),
-            (wrap_string(CaselessLiteral, "s"), 1, opAssoc.LEFT, Sort.parse),
-            (wrap_string(Literal, "+-"), 1, opAssoc.RIGHT, AddEvenSubOdd.parse),
-            (wrap_string(Literal, "+"), 1, opAssoc.RIGHT, Identity.parse),
-            (wrap_string(Literal, "-"), 1, opAssoc.RIGHT, Negate.parse),
-            (wrap_string(Literal, "%"), 2, opAssoc.LEFT, Modulo.parse),
-            (wrap_string(Literal, "/"), 2, opAssoc.LEFT, Div.parse),
-            (wrap_string(Literal, "*"), 2, opAssoc.LEFT, Mul.parse),
-            (wrap_string(Literal, "-"), 2, opAssoc.LEFT, Sub.parse),
-            (wrap_string(Literal, "+"), 2, opAssoc.LEFT, Add.parse),
-            (wrap_string(Literal, ","), 2, opAssoc.LEFT, Array.parse),
-            (wrap_string(Literal, "|"), 2, opAssoc.LEFT, Extend.parse),
-            (wrap_string(Literal, "<"), 2, opAssoc.LEFT, LessThan.parse),
-            (wrap_string(Literal, "<="), 2, opAssoc.LEFT, LessThanEqual.parse),
-            (wrap_string(Literal, ">"), 2, opAssoc.LEFT, GreaterThan.parse),
-            (wrap_string(Literal, ">="), 2, opAssoc.LEFT, GreaterThanEqual.parse),
-            (wrap_string(Literal, '=='), 2, opAssoc.LEFT, Equals.parse),
-        ],
+    # A variable, bound when the expression is evaluated
+    variable = Regex(r"\$" + Variable.NAME.pattern)
+    variable.setParseAction(Variable.parse)
+    variable.setName("variable")
+
+    dice_separators = RandomElement.DICE_MAP.keys()
+    dice_element = Or(
+        wrap_string(CaselessLiteral, x, suppress=False) for x in dice_separators
     )
-    + StringEnd()
-)
-expression.setName("expression")
+    special = wrap_string(Literal, "%", suppress=False) | wrap_string(
+        CaselessLiteral, "f", suppress=False
+    )
+
+    # An expression in dice notation
+    expression = (
+        StringStart()
+        + operatorPrecedence(
+            integer | variable,
+            [
+                (dice_element, 2, opAssoc.LEFT, RandomElement.parse, special),
+                (dice_element, 1, opAssoc.RIGHT, RandomElement.parse_unary, special),
+                (wrap_string(CaselessLiteral, "x"), 2, opAssoc.LEFT, Explode.parse),
+                (wrap_string(CaselessLiteral, "x"), 1, opAssoc.LEFT, Explode.parse),
+                (wrap_string(CaselessLiteral, "rr"), 2, opAssoc.LEFT, ForceReroll.parse),
+                (wrap_string(CaselessLiteral, "rr"), 1, opAssoc.LEFT, ForceReroll.parse),
+                (wrap_string(CaselessLiteral, "r"), 2, opAssoc.LEFT, Reroll.parse),
+                (wrap_string(CaselessLiteral, "r"), 1, opAssoc.LEFT, Reroll.parse),
+                (wrap_string(Word, "^hH", exact=1), 2, opAssoc.LEFT, Highest.parse),
+                (wrap_string(Word, "^hH", exact=1), 1, opAssoc.LEFT, Highest.parse),
+                (wrap_string(Word, "vlL", exact=1), 2, opAssoc.LEFT, Lowest.parse),
+                (wrap_string(Word, "vlL", exact=1), 1, opAssoc.LEFT, Lowest.parse),
+                (wrap_string(Word, "oOmM", exact=1), 2, opAssoc.LEFT, Middle.parse),
+                (wrap_string(Word, "oOmM", exact=1), 1, opAssoc.LEFT, Middle.parse),
+                (wrap_string(CaselessLiteral, "a"), 2, opAssoc.LEFT, Again.parse),
+                (wrap_string(CaselessLiteral, "a"), 1, opAssoc.LEFT, Again.parse),
+                (wrap_string(CaselessLiteral, "e"), 2, opAssoc.LEFT, Successes.parse),
+                (wrap_string(CaselessLiteral, "f"), 2, opAssoc.LEFT, SuccessFail.parse),
+                (wrap_string(CaselessLiteral, "t"), 1, opAssoc.LEFT, Total.parse),
+                (wrap_string(CaselessLiteral, "s"), 1, opAssoc.LEFT, Sort.parse),
+                (wrap_string(Literal, "+-"), 1, opAssoc.RIGHT, AddEvenSubOdd.parse),
+                (wrap_string(Literal, "+"), 1, opAssoc.RIGHT, Identity.parse),
+                (wrap_string(Literal, "-"), 1, opAssoc.RIGHT, Negate.parse),
+                (wrap_string(Literal, "%"), 2, opAssoc.LEFT, Modulo.parse),
+                (wrap_string(Literal, "/"), 2, opAssoc.LEFT, Div.parse),
+                (wrap_string(Literal, "*"), 2, opAssoc.LEFT, Mul.parse),
+                (wrap_string(Literal, "-"), 2, opAssoc.LEFT, Sub.parse),
+                (wrap_string(Literal, "+"), 2, opAssoc.LEFT, Add.parse),
+                (wrap_string(Literal, ","), 2, opAssoc.LEFT, Array.parse),
+                (wrap_string(Literal, "|"), 2, opAssoc.LEFT, Extend.parse),
+                (wrap_string(Literal, "<"), 2, opAssoc.LEFT, LessThan.parse),
+                (wrap_string(Literal, "<="), 2, opAssoc.LEFT, LessThanEqual.parse),
+                (wrap_string(Literal, ">"), 2, opAssoc.LEFT, GreaterThan.parse),
+                (wrap_string(Literal, ">="), 2, opAssoc.LEFT, GreaterThanEqual.parse),
+                (wrap_string(Literal, '=='), 2, opAssoc.LEFT, Equals.parse),
+            ],
+        )
+        + StringEnd()
+    )
+    expression.setName("expression")
+
+    return {"expression": expression, "integer": integer}
+
+
+_built = {}
+_lock = threading.Lock()
+
+
+def get_expression():
+    """Returns the grammar of a dice expression, building it on first use"""
+    return _get("expression")
+
+
+def _get(name):
+    if not _built:
+        with _lock:
+            if not _built:
+                _built.update(build())
+    return _built[name]
+
+
+def __getattr__(name):
+    if name in ("expression", "integer"):
+        return _get(name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,68 @@
+"""
+Limits on the work done by a single evaluation of a dice expression
+
+A Limits is passed to evaluation as the limits keyword argument, which every
+element hands on to the elements it evaluates. Rolls charge it for the dice
+they draw, and operators for each step they take; once either count goes
+over its limit, or the deadline has passed, evaluation stops with a
+DiceLimitException located at the element that was charged last.
+
+The check is cooperative: time spent between two charges isn't interrupted,
+so the deadline can be overrun by at most one step.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import time
+
+from .constants import EVAL_TIMEOUT, MAX_EVAL_DICE, MAX_EVAL_STEPS
+from .exceptions import DiceLimitException
+
+
+class Limits(object):
+    """Counts the dice drawn and the steps taken by one evaluation. The clock
+    starts when the Limits is made, so each evaluation needs a new one; a
+    limit of None is not checked."""
+
+    def __init__(self, max_steps=MAX_EVAL_STEPS, max_rolled=MAX_EVAL_DICE,
+                 timeout=EVAL_TIMEOUT, clock=time.monotonic):
+        self.max_steps = max_steps
+        self.max_rolled = max_rolled
+        self.timeout = timeout
+        self.clock = clock
+        self.steps = 0
+        self.rolled = 0
+        self.deadline = None if timeout is None else clock() + timeout
+
+    def step(self, element, steps=1):
+        """Charges for steps taken by element"""
+        self.steps += steps
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise self.exceeded(element, "Too many steps! (max is %i)" % self.max_steps)
+        self.check(element)
+
+    def roll(self, element, dice):
+        """Charges for dice drawn by element"""
+        self.rolled += dice
+        if self.max_rolled is not None and self.rolled > self.max_rolled:
+            raise self.exceeded(
+                element, "Too many dice rolled! (max is %i)" % self.max_rolled
+            )
+        self.check(element)
+
+    def check(self, element):
+        if self.deadline is not None and self.clock() > self.deadline:
+            raise self.exceeded(
+                element, "Took too long! (max is %gs)" % self.timeout
+            )
+
+    @staticmethod
+    def exceeded(element, description):
+        exc = element.fatal(description, cls=DiceLimitException)
+        exc.__cause__ = None
+        return exc
+
+    def __repr__(self):
+        return "Limits(steps=%i/%s, rolled=%i/%s, timeout=%s)" % (
+            self.steps, self.max_steps, self.rolled, self.max_rolled, self.timeout
+        )
@@ -0,0 +1,122 @@
+"""
+Partial evaluation of parsed dice expressions
+
+Every roll of an expression evaluates its whole tree, including the parts that
+can't change from one roll to the next: in "3d6 + 2*4 - 1", only the dice are
+random, but the multiplication and subtraction are worked out on every roll.
+optimize() builds a copy of a tree in which:
+
+- each operator whose operands hold no dice, and whose value is an integer,
+  is replaced by a Folded integer holding that value;
+- each node is marked with whether it's random, as its random attribute;
+- dice whose amount and sides are integers get them as bounds, so rolling
+  them doesn't evaluate and coerce their operands again;
+- each operator is given the kind of value it evaluates to, where that can
+  be told from the kinds of its operands (see constants.ValueKind), and the
+  kernel specialized for those kinds, so evaluating it goes straight to the
+  right method instead of checking types on every roll.
+
+Subtrees that raise an error when evaluated are left as they are, so the
+error is raised, from the same place, when the expression is rolled. This
+includes those holding variables, which are only bound when it's rolled.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from copy import copy
+
+from .constants import ValueKind
+from .elements import Dice, Folded, Integer, Operator, RandomElement, Trace
+
+
+def is_random(node):
+    """Whether evaluating a node rolls any dice"""
+    if isinstance(node, RandomElement):
+        return True
+    elif isinstance(node, Operator):
+        marked = getattr(node, "random", None)
+        if marked is not None:
+            return marked
+        return any(is_random(o) for o in node.original_operands)
+    return False
+
+
+def kind_of(node):
+    """The kind of value a node evaluates to, or None if it isn't known"""
+    if isinstance(node, int):
+        return ValueKind.SCALAR
+    return getattr(node, "kind", None)
+
+
+def dice_bounds(node):
+    """Returns the amount, lowest and highest side of dice, if they are all
+    valid integers"""
+    operands = node.amount, node.min_value, node.max_value
+    if not all(isinstance(o, int) for o in operands):
+        return None
+
+    amount, min_value, max_value = [Integer(o) for o in operands]
+    if amount < 0 or min_value > max_value:
+        return None
+    return amount, min_value, max_value
+
+
+def fold(node, original):
+    """Evaluates a node without dice once, returning its value as a Folded
+    integer standing in for the original node, or the node itself if it
+    can't be folded"""
+    try:
+        value = node.evaluate_cached(trace=Trace(keep_intermediates=False))
+    # Errors are left to be raised when the expression is rolled
+    except Exception:
+        return node
+
+    if type(value) not in (int, Integer):
+        return node
+
+    folded = Folded(value, original)
+    if hasattr(node, "string"):
+        folded.set_parse_attributes(node.string, node.location, node.tokens)
+    return folded
+
+
+def optimize_node(node, memo):
+    # Elements reached from more than one parent stay shared
+    if id(node) in memo:
+        return memo[id(node)]
+
+    if isinstance(node, Dice):
+        new = copy(node)
+        new.amount, new.min_value, new.max_value = [
+            optimize_node(o, memo) for o in (node.amount, node.min_value, node.max_value)
+        ]
+        new.original_operands = (new.amount, new.max_value)
+        new.bounds = dice_bounds(new)
+        new.random = True
+    elif isinstance(node, Operator):
+        operands = [optimize_node(o, memo) for o in node.original_operands]
+        new = type(node)(*operands)
+        if hasattr(node, "string"):
+            new.set_parse_attributes(node.string, node.location, node.tokens)
+
+        if isinstance(new, Operator):
+            new.random = any(is_random(o) for o in operands)
+            if not new.random:
+                new = fold(new, node)
+
+        if isinstance(new, Operator):
+            kinds = [kind_of(o) for o in operands]
+            new.kind = new.result_kind(kinds)
+            new.kernel = new.select_kernel(kinds)
+    else:
+        new = node
+
+    memo[id(node)] = new
+    return new
+
+
+def optimize(elements):
+    """Returns an optimized copy of the top-level elements of a parsed
+    expression. The elements themselves are left unchanged."""
+    memo = {}
+    return [optimize_node(e, memo) for e in elements]
@@ -0,0 +1,190 @@
+"""
+A compact form of parsed dice expressions, for sending to other processes
+or storing between runs without parsing again
+
+Parsed elements hold the pyparsing tokens they were built from, which makes
+them slow and bulky to pickle. A Packed expression holds the source string
+and two flat arrays instead: the code, which lists the elements of the tree
+in postfix order, and the spans, which give the location in the source of
+each element listed.
+
+In the code, each integer literal is INTEGER followed by its value. Each
+other element is its opcode, one of the positions in OPCODES offset by
+FIRST_ELEMENT, followed by the number of operands it takes from the stack.
+An element reached through more than one parent is listed once, and then
+referred to by REFERENCE followed by its index in the spans. Integers too
+large for the code are kept in the constants instead, as CONSTANT followed
+by their index there, as are the names of variables: a Variable is listed
+like an element taking its name as its one operand.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from array import array
+from collections import namedtuple
+
+from .elements import (
+    Add,
+    AddEvenSubOdd,
+    Again,
+    Array,
+    Dice,
+    Div,
+    Equals,
+    Explode,
+    Extend,
+    ForceReroll,
+    FudgeDice,
+    GreaterThan,
+    GreaterThanEqual,
+    Highest,
+    Integer,
+    LessThan,
+    LessThanEqual,
+    Lowest,
+    Middle,
+    Modulo,
+    Mul,
+    Negate,
+    Operator,
+    Reroll,
+    Sort,
+    Sub,
+    SuccessFail,
+    Successes,
+    Total,
+    Variable,
+    WildDice,
+)
+
+# Bumped whenever the meaning of the code changes
+FORMAT_VERSION = 1
+
+INTEGER, CONSTANT, REFERENCE, FIRST_ELEMENT = range(4)
+NO_SPAN = -1
+# The code and spans are arrays of 32-bit integers
+TYPECODE = "i"
+MAX_IMMEDIATE = 2 ** 31 - 1
+
+# New elements go at the end, so that stored code keeps its meaning
+OPCODES = (
+    Dice, WildDice, FudgeDice,
+    Add, Sub, Mul, Div, Modulo, Negate, AddEvenSubOdd,
+    Equals, LessThan, LessThanEqual, GreaterThan, GreaterThanEqual,
+    Total, Successes, SuccessFail, Again, Sort, Extend, Array,
+    Lowest, Highest, Middle, Explode, Reroll, ForceReroll,
+    Variable,
+)
+OPCODE_OF = {cls: i + FIRST_ELEMENT for i, cls in enumerate(OPCODES)}
+
+
+class Packed(namedtuple("Packed", "version source code spans constants")):
+    """A parsed dice expression, as the source it was parsed from, its code
+    and spans, and the integers too large for the code."""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        # Pickled as raw bytes, without the array constructor for each array
+        return (
+            _rebuild_packed,
+            (self.version, self.source, self.code.tobytes(),
+             self.spans.tobytes(), self.constants),
+        )
+
+
+def _rebuild_packed(version, source, code, spans, constants):
+    return Packed(
+        version, source, array(TYPECODE, code), array(TYPECODE, spans), constants
+    )
+
+
+def pack(elements, source=None):
+    """Packs the top-level elements of a parsed expression. The source is
+    taken from the elements unless it is given."""
+    code, spans, constants = array(TYPECODE), array(TYPECODE), []
+    seen = {}
+
+    def emit(node):
+        if isinstance(node, (Dice, Operator)) and id(node) in seen:
+            code.extend((REFERENCE, seen[id(node)]))
+            return
+
+        if isinstance(node, Dice):
+            operands = (node.amount, node.max_value, node.min_value)
+        elif isinstance(node, Operator):
+            operands = node.original_operands
+        elif isinstance(node, Variable):
+            # The name is its one operand, kept in the constants
+            code.extend((CONSTANT, len(constants), OPCODE_OF[Variable], 1))
+            constants.append(node.name)
+            spans.extend((NO_SPAN, node.location if hasattr(node, "location") else NO_SPAN))
+            return
+        elif isinstance(node, int):
+            operands = None
+        else:
+            raise TypeError("Cannot pack %r" % (node,))
+
+        if operands is None:
+            if -MAX_IMMEDIATE <= node <= MAX_IMMEDIATE:
+                code.extend((INTEGER, node))
+            else:
+                code.extend((CONSTANT, len(constants)))
+                constants.append(int(node))
+        else:
+            for operand in operands:
+                emit(operand)
+            code.extend((OPCODE_OF[type(node)], len(operands)))
+            seen[id(node)] = len(spans)
+
+        # Plain ints, like the amount of "d6", weren't parsed from anywhere
+        spans.append(node.location if hasattr(node, "location") else NO_SPAN)
+
+    for element in elements:
+        emit(element)
+        if source is None and hasattr(element, "string"):
+            source = element.string
+
+    return Packed(FORMAT_VERSION, source, code, spans, tuple(constants))
+
+
+def unpack(packed):
+    """Rebuilds the top-level elements of a packed expression"""
+    if packed.version != FORMAT_VERSION:
+        raise ValueError(
+            "Cannot unpack format %s (expected %s)" % (packed.version, FORMAT_VERSION)
+        )
+
+    code, spans, source = packed.code, packed.spans, packed.source
+    stack, nodes = [], []
+    i = 0
+
+    while i < len(code):
+        opcode, arg = code[i], code[i + 1]
+        i += 2
+
+        if opcode == REFERENCE:
+            stack.append(nodes[arg])
+            continue
+        elif opcode == INTEGER or opcode == CONSTANT:
+            value = arg if opcode == INTEGER else packed.constants[arg]
+            node = value if spans[len(nodes)] == NO_SPAN else Integer(value)
+        else:
+            cls = OPCODES[opcode - FIRST_ELEMENT]
+            operands = stack[len(stack) - arg:]
+            del stack[len(stack) - arg:]
+
+            if issubclass(cls, Dice):
+                # FudgeDice take their sides in one operand, but a negated
+                # roll can have any range
+                node = cls.__new__(cls)
+                Dice.__init__(node, operands[0], operands[1], operands[2])
+            else:
+                node = cls(*operands)
+
+        if spans[len(nodes)] != NO_SPAN:
+            node.set_parse_attributes(source, spans[len(nodes)], None)
+        nodes.append(node)
+        stack.append(node)
+
+    return stack
@@ -0,0 +1,368 @@
+"""
+A hand-written precedence-climbing parser for dice notation
+
+This builds exactly the same trees as grammar.expression, and calls the same
+parse actions with the same locations, so fatal errors raised while parsing
+are identical. It is much faster than the pyparsing grammar, which has to
+descend through every precedence level for each integer literal; here an
+operand is parsed directly, and operators are looked up by their first
+character.
+
+The operator table mirrors the one in grammar.py, and must be kept in sync
+with it; tests/test_parser.py checks both parsers against a shared corpus.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from .elements import (
+    Integer,
+    String,
+    Successes,
+    Mul,
+    Div,
+    Modulo,
+    Sub,
+    Add,
+    Identity,
+    AddEvenSubOdd,
+    Equals,
+    LessThan,
+    LessThanEqual,
+    GreaterThan,
+    GreaterThanEqual,
+    Total,
+    Sort,
+    Lowest,
+    Middle,
+    Highest,
+    Array,
+    Extend,
+    Explode,
+    Reroll,
+    ForceReroll,
+    Negate,
+    SuccessFail,
+    RandomElement,
+    Again,
+    Variable,
+)
+from .exceptions import DiceException
+
+WHITESPACE = " \n\t\r"
+DIGITS = "0123456789"
+
+PREFIX, POSTFIX, BINARY = "prefix", "postfix", "binary"
+
+
+def caseless(*literals):
+    """Literals matched regardless of case, producing the given spelling"""
+    return [(literal, True) for literal in literals]
+
+
+def exact(*literals):
+    """Literals matched exactly, producing the matched text"""
+    return [(literal, False) for literal in literals]
+
+
+DICE_SEPARATORS = caseless(*RandomElement.DICE_MAP.keys())
+SPECIAL = exact("%") + caseless("f")
+
+# (literals, kind, action, keep operator tokens, special right-hand side),
+# from the tightest binding level to the loosest. This is the same table as
+# the one given to grammar.operatorPrecedence.
+OPERATORS = [
+    (DICE_SEPARATORS, BINARY, RandomElement.parse, True, SPECIAL),
+    (DICE_SEPARATORS, PREFIX, RandomElement.parse_unary, True, SPECIAL),
+    (caseless("x"), BINARY, Explode.parse, False, None),
+    (caseless("x"), POSTFIX, Explode.parse, False, None),
+    (caseless("rr"), BINARY, ForceReroll.parse, False, None),
+    (caseless("rr"), POSTFIX, ForceReroll.parse, False, None),
+    (caseless("r"), BINARY, Reroll.parse, False, None),
+    (caseless("r"), POSTFIX, Reroll.parse, False, None),
+    (exact(*"^hH"), BINARY, Highest.parse, False, None),
+    (exact(*"^hH"), POSTFIX, Highest.parse, False, None),
+    (exact(*"vlL"), BINARY, Lowest.parse, False, None),
+    (exact(*"vlL"), POSTFIX, Lowest.parse, False, None),
+    (exact(*"oOmM"), BINARY, Middle.parse, False, None),
+    (exact(*"oOmM"), POSTFIX, Middle.parse, False, None),
+    (caseless("a"), BINARY, Again.parse, False, None),
+    (caseless("a"), POSTFIX, Again.parse, False, None),
+    (caseless("e"), BINARY, Successes.parse, False, None),
+    (caseless("f"), BINARY, SuccessFail.parse, False, None),
+    (caseless("t"), POSTFIX, Total.parse, False, None),
+    (caseless("s"), POSTFIX, Sort.parse, False, None),
+    (exact("+-"), PREFIX, AddEvenSubOdd.parse, False, None),
+    (exact("+"), PREFIX, Identity.parse, False, None),
+    (exact("-"), PREFIX, Negate.parse, False, None),
+    (exact("%"), BINARY, Modulo.parse, False, None),
+    (exact("/"), BINARY, Div.parse, False, None),
+    (exact("*"), BINARY, Mul.parse, False, None),
+    (exact("-"), BINARY, Sub.parse, False, None),
+    (exact("+"), BINARY, Add.parse, False, None),
+    (exact(","), BINARY, Array.parse, False, None),
+    (exact("|"), BINARY, Extend.parse, False, None),
+    (exact("<"), BINARY, LessThan.parse, False, None),
+    (exact("<="), BINARY, LessThanEqual.parse, False, None),
+    (exact(">"), BINARY, GreaterThan.parse, False, None),
+    (exact(">="), BINARY, GreaterThanEqual.parse, False, None),
+    (exact("=="), BINARY, Equals.parse, False, None),
+]
+LOOSEST = len(OPERATORS) - 1
+PRIMARY = -1
+
+
+class Operator(object):
+    """One level of the operator table"""
+
+    def __init__(self, level, literals, kind, action, keep, special):
+        self.level = level
+        self.literals = literals
+        self.kind = kind
+        self.action = action
+        self.keep = keep
+        self.special = special
+
+    def __repr__(self):
+        return "Operator(%i, %s, %s)" % (self.level, self.kind, self.literals)
+
+
+def _index_operators(operators):
+    """Maps the first character of each operator to the levels it can start,
+    ordered from the tightest binding to the loosest"""
+    prefix, infix = {}, {}
+
+    for level, (literals, kind, action, keep, special) in enumerate(operators):
+        op = Operator(level, literals, kind, action, keep, special)
+        index = prefix if kind is PREFIX else infix
+
+        for literal, is_caseless in literals:
+            chars = {literal[0]}
+            if is_caseless:
+                chars |= {literal[0].lower(), literal[0].upper()}
+            for char in chars:
+                entries = index.setdefault(char, [])
+                if op not in entries:
+                    entries.append(op)
+
+    # prefix operators are tried from the loosest level down, like the nested
+    # alternatives built by operatorPrecedence
+    for entries in prefix.values():
+        entries.reverse()
+
+    return prefix, infix
+
+
+PREFIX_INDEX, INFIX_INDEX = _index_operators(OPERATORS)
+
+
+class NoMatch(Exception):
+    """Raised internally when the input doesn't match at some position"""
+
+    def __init__(self, location, description):
+        super(NoMatch, self).__init__(location, description)
+        self.location = location
+        self.description = description
+
+
+class Parser(object):
+    """Parses a single dice expression string"""
+
+    def __init__(self, string):
+        self.string = string
+        self.length = len(string)
+        self.pos = 0
+        self.furthest = NoMatch(0, "Expected an expression")
+
+    def fail(self, location, description):
+        if location >= self.furthest.location:
+            self.furthest = NoMatch(location, description)
+        return self.furthest
+
+    def skip(self, pos):
+        string, length = self.string, self.length
+        while pos < length and string[pos] in WHITESPACE:
+            pos += 1
+        return pos
+
+    def match(self, pos, literals):
+        """Returns (token, end) for the first literal matching at pos"""
+        string = self.string
+
+        for literal, is_caseless in literals:
+            end = pos + len(literal)
+            text = string[pos:end]
+
+            if is_caseless:
+                if text.lower() == literal:
+                    return literal, end
+            elif text == literal:
+                return text, end
+
+        return None, pos
+
+    def string_token(self, text, location):
+        return String.parse(self.string, location, [text])
+
+    def parse(self):
+        node, _ = self.expression(LOOSEST)
+        pos = self.skip(self.pos)
+
+        if pos != self.length:
+            raise self.fail(pos, "Expected end of text")
+
+        return [node]
+
+    def expression(self, max_level):
+        """Parses an expression using operators up to max_level, returning
+        the resulting node and the level of its outermost operator"""
+        start = self.skip(self.pos)
+        node, level = self.operand(start, max_level)
+
+        while True:
+            pos = self.skip(self.pos)
+            if pos >= self.length:
+                break
+
+            applied = None
+            for op in INFIX_INDEX.get(self.string[pos], ()):
+                if op.level <= level:
+                    continue
+                elif op.level > max_level:
+                    break
+
+                if op.kind is POSTFIX:
+                    applied = self.postfix(op, node, start, pos)
+                else:
+                    applied = self.binary(op, node, start, pos)
+
+                if applied is not None:
+                    node, level = applied, op.level
+                    break
+
+            if applied is None:
+                break
+
+        return node, level
+
+    def operand(self, start, max_level):
+        """Parses a prefix operator expression or a primary"""
+        for op in PREFIX_INDEX.get(self.string[start:start + 1], ()):
+            if op.level > max_level:
+                continue
+
+            token, pos = self.match(start, op.literals)
+            if token is None:
+                continue
+
+            try:
+                self.pos = pos
+                rhs = self.rhs(op, op.level)
+            except NoMatch:
+                continue
+
+            tokens = [rhs]
+            if op.keep:
+                tokens.insert(0, self.string_token(token, start))
+
+            return op.action(self.string, start, tokens), op.level
+
+        return self.primary(start), PRIMARY
+
+    def primary(self, start):
+        string = self.string
+
+        if string[start:start + 1] == "(":
+            self.pos = start + 1
+            node, _ = self.expression(LOOSEST)
+            pos = self.skip(self.pos)
+
+            if string[pos:pos + 1] != ")":
+                raise self.fail(pos, 'Expected ")"')
+
+            self.pos = pos + 1
+            return node
+
+        if string[start:start + 1] == "$":
+            match = Variable.NAME.match(string, start + 1)
+            if match is None:
+                raise self.fail(start, "Expected an expression")
+
+            self.pos = match.end()
+            return Variable.parse(string, start, [string[start:self.pos]])
+
+        pos = start
+        while pos < self.length and string[pos] in DIGITS:
+            pos += 1
+
+        if pos == start:
+            raise self.fail(start, "Expected an expression")
+
+        self.pos = pos
+        return Integer.parse(string, start, [string[start:pos]])
+
+    def rhs(self, op, level):
+        """Parses the operand following an operator at the given level,
+        falling back to the operator's special right-hand sides"""
+        begin = self.pos
+        try:
+            if op.kind is PREFIX:
+                return self.expression(level)[0]
+            return self.expression(level - 1)[0]
+        except NoMatch:
+            if op.special is None:
+                raise
+
+            start = self.skip(begin)
+            token, pos = self.match(start, op.special)
+            if token is None:
+                raise
+
+            self.pos = pos
+            return self.string_token(token, start)
+
+    def postfix(self, op, node, start, pos):
+        token, end = self.match(pos, op.literals)
+        if token is None:
+            return None
+
+        while token is not None:
+            self.pos = end
+            token, end = self.match(self.skip(end), op.literals)
+
+        return op.action(self.string, start, [node])
+
+    def binary(self, op, node, start, pos):
+        tokens = [node]
+        token, end = self.match(pos, op.literals)
+
+        while token is not None:
+            try:
+                self.pos = end
+                rhs = self.rhs(op, op.level)
+            except NoMatch:
+                self.pos = pos
+                break
+
+            if op.keep:
+                tokens.append(self.string_token(token, pos))
+            tokens.append(rhs)
+
+            pos = self.skip(self.pos)
+            token, end = self.match(pos, op.literals)
+
+        if len(tokens) == 1:
+            return None
+
+        self.pos = pos
+        return op.action(self.string, start, tokens)
+
+
+def parse(string):
+    """Parses a dice expression, returning a list of its top-level elements"""
+    parser = Parser(string)
+    try:
+        return parser.parse()
+    except NoMatch as e:
+        exc = DiceException(string, e.location, e.description)
+        exc.__cause__ = None
+        raise exc
@@ -0,0 +1,848 @@
+"""
+Computes exact probability distributions of dice expressions
+
+Instead of rolling, each node is evaluated to the distribution of its value.
+Scalars become a Distribution, a probability mass function over a range of
+integers. Lists of dice become pools, which know how to compute the
+distribution of any sum over their elements: the total of a pool, or its
+number of successes, is such a sum. Sums over independent dice use repeated
+doubling, with FFT convolution for large supports, and order statistics for
+Highest, Lowest and Middle are computed face by face.
+
+Different parts of an expression are rolled independently, so their
+distributions can be combined freely. Lists are summarised by their total,
+which is what they are coerced to by the operators that take integers.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import operator
+
+import numpy as np
+
+from .batch import COMPARATORS
+from .compiler import division_by_zero
+from .constants import MAX_EXPLOSIONS, MAX_ROLL_DICE, MAX_SELECTION_WORK
+from .elements import (
+    Add,
+    AddEvenSubOdd,
+    Array,
+    Dice,
+    Div,
+    Element,
+    Explode,
+    Extend,
+    ForceReroll,
+    Highest,
+    Integer,
+    Lowest,
+    Middle,
+    Modulo,
+    Mul,
+    Negate,
+    Reroll,
+    Sort,
+    Sub,
+    SuccessFail,
+    Successes,
+    Total,
+    Variable,
+    WildDice,
+)
+from .utilities import classname, highest_window, lowest_window, middle_window, single
+
+# Convolutions of supports larger than this use the FFT
+FFT_SIZE = 2 ** 22
+
+# The probability below which the chain of explosions of a die is cut short
+EXPLOSION_EPSILON = 1e-18
+
+CALCULATORS = {}
+
+
+class NotSupported(Exception):
+    """Raised when part of an expression has no exact calculation"""
+
+
+class Distribution(object):
+    """The probability mass function of an integer outcome, where pmf[i] is
+    the probability of offset + i"""
+
+    def __init__(self, pmf, offset=0):
+        pmf = np.asarray(pmf, dtype=float)
+        nonzero = np.flatnonzero(pmf)
+
+        if len(nonzero):
+            offset += nonzero[0]
+            pmf = pmf[nonzero[0]:nonzero[-1] + 1]
+        else:
+            offset, pmf = 0, pmf[:0]
+
+        self.pmf = pmf
+        self.offset = int(offset)
+
+    @classmethod
+    def constant(cls, value):
+        return cls([1.0], value)
+
+    @classmethod
+    def uniform(cls, low, high):
+        return cls(np.full(high - low + 1, 1.0 / (high - low + 1)), low)
+
+    @property
+    def support(self):
+        return np.arange(self.offset, self.offset + len(self.pmf))
+
+    @property
+    def min(self):
+        return self.offset
+
+    @property
+    def max(self):
+        return self.offset + len(self.pmf) - 1
+
+    @property
+    def mean(self):
+        return float(np.dot(self.support, self.pmf))
+
+    @property
+    def variance(self):
+        return float(np.dot((self.support - self.mean) ** 2, self.pmf))
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+    def is_constant(self):
+        return len(self.pmf) == 1
+
+    def probability(self, value):
+        """Returns the probability of the given outcome"""
+        index = value - self.offset
+        return float(self.pmf[index]) if 0 <= index < len(self.pmf) else 0.0
+
+    def percentile(self, q):
+        """Returns the smallest outcome at or above the q-th percentile"""
+        cdf = np.cumsum(self.pmf)
+        index = np.searchsorted(cdf, q / 100.0 * cdf[-1] - 1e-12)
+        return self.offset + int(min(index, len(cdf) - 1))
+
+    def items(self):
+        """Yields the outcomes with non-zero probability, and their
+        probabilities"""
+        for value, p in zip(self.support, self.pmf):
+            if p:
+                yield int(value), float(p)
+
+    def total_probability(self):
+        return float(self.pmf.sum())
+
+    def normalized(self):
+        return Distribution(self.pmf / self.pmf.sum(), self.offset)
+
+    def map(self, func):
+        """Returns the distribution of func(outcome), where func works on
+        arrays of outcomes"""
+        if not len(self.pmf):
+            return self
+
+        values = np.asarray(func(self.support), dtype=np.int64)
+        low = values.min()
+        return Distribution(np.bincount(values - low, weights=self.pmf), low)
+
+    def combine(self, other, func):
+        """Returns the distribution of func(a, b) for independent a and b"""
+        if not len(self.pmf) or not len(other.pmf):
+            return Distribution([])
+
+        values = func(self.support[:, None], other.support[None, :])
+        values = np.asarray(values, dtype=np.int64).ravel()
+        weights = np.outer(self.pmf, other.pmf).ravel()
+        low = values.min()
+        return Distribution(np.bincount(values - low, weights=weights), low)
+
+    def __add__(self, other):
+        """The distribution of the sum of independent outcomes"""
+        return Distribution(convolve(self.pmf, other.pmf), self.offset + other.offset)
+
+    def __neg__(self):
+        return Distribution(self.pmf[::-1], -self.max)
+
+    def __sub__(self, other):
+        return self + -other
+
+    def power(self, n):
+        """The distribution of the sum of n independent outcomes"""
+        result, base = Distribution.constant(0), self
+
+        while n:
+            if n & 1:
+                result += base
+            n >>= 1
+            if n:
+                base += base
+
+        return result
+
+    def __repr__(self):
+        if len(self.pmf) > 8:
+            return "Distribution(%i..%i, mean=%.4g)" % (self.min, self.max, self.mean)
+        return "Distribution({%s})" % ", ".join(
+            "%i: %.4g" % item for item in self.items()
+        )
+
+
+class ComparisonDistribution(object):
+    """The distribution of a comparison of two independent outcomes: the
+    probability that it succeeds, and the distribution of its margin"""
+
+    def __init__(self, left, right, impl, token):
+        self.left = left
+        self.right = right
+        self.token = token
+
+        values, deltas = impl(left.support[:, None], right.support[None, :])
+        weights = np.outer(left.pmf, right.pmf)
+
+        self.probability = float(weights[values].sum())
+        deltas = deltas.ravel()
+        self.deltas = Distribution(
+            np.bincount(deltas - deltas.min(), weights=weights.ravel()), deltas.min()
+        )
+
+    @property
+    def margin(self):
+        """The expected margin of the comparison"""
+        return self.deltas.mean
+
+    def __repr__(self):
+        return "ComparisonDistribution(%s %s %s, probability=%.4g, margin=%.4g)" % (
+            self.left, self.token, self.right, self.probability, self.margin
+        )
+
+
+def convolve(a, b):
+    if not len(a) or not len(b):
+        return a[:0]
+    elif len(a) * len(b) <= FFT_SIZE or min(len(a), len(b)) < 64:
+        return np.convolve(a, b)
+
+    size = len(a) + len(b) - 1
+    result = np.fft.irfft(np.fft.rfft(a, size) * np.fft.rfft(b, size), size)
+    # FFT rounding leaves noise around zero, well below meaningful tails
+    result[result < 1e-16 * result.max()] = 0
+    return result
+
+
+def mixture(weighted):
+    """Mixes distributions, given (weight, distribution) pairs"""
+    weighted = [(w, d) for w, d in weighted if len(d.pmf)]
+    if not weighted:
+        return Distribution([])
+
+    low = min(d.min for w, d in weighted)
+    high = max(d.max for w, d in weighted)
+    pmf = np.zeros(high - low + 1)
+
+    for weight, dist in weighted:
+        start = dist.offset - low
+        pmf[start:start + len(dist.pmf)] += weight * dist.pmf
+
+    return Distribution(pmf, low)
+
+
+def identity(values):
+    return values
+
+
+class Pool(object):
+    """The distribution of a list of values. The bounds are those of the
+    random element the values were rolled from, for lists that are rolls."""
+
+    bounds = None
+
+    def statistic(self, func):
+        """The distribution of the sum of func over the values"""
+        raise NotImplementedError()
+
+    def total(self):
+        return self.statistic(identity)
+
+    def map(self, func, keep_bounds=False):
+        return MappedPool(self, func)
+
+    def single(self):
+        """The distribution of the value of a list that always has exactly
+        one, or None"""
+        return None
+
+    def marginals(self):
+        """The distributions of each value in the list"""
+        raise NotSupported("element-wise comparisons of %s" % self.description)
+
+    def select(self, window, count):
+        raise NotSupported("selections from %s" % self.description)
+
+    def reroll(self, thresh, forced):
+        raise NotSupported("rerolls of %s" % self.description)
+
+    def explode(self, thresh):
+        raise NotSupported("explosions of %s" % self.description)
+
+    description = "this list"
+
+
+class DicePool(Pool):
+    """A number of independent dice with the same distribution of faces"""
+
+    def __init__(self, amount, face, bounds=None):
+        self.amount = amount
+        self.face = face
+        self.bounds = bounds
+
+    def statistic(self, func):
+        return self.face.map(func).power(self.amount)
+
+    def map(self, func, keep_bounds=False):
+        return DicePool(self.amount, self.face.map(func), self.bounds if keep_bounds else None)
+
+    def single(self):
+        return self.face if self.amount == 1 else None
+
+    def marginals(self):
+        return [self.face] * self.amount
+
+    def select(self, window, count):
+        start, stop = window(self.amount, count)
+        if stop <= start:
+            return ListPool([])
+        return SelectedPool(self, start, stop)
+
+    def reroll(self, thresh, forced):
+        min_value, max_value = self.bounds
+        low = min(max_value, thresh + 1) if forced else min_value
+        face = self.face
+
+        rerolled = face.pmf[face.support <= thresh].sum()
+        kept = Distribution(np.where(face.support > thresh, face.pmf, 0), face.offset)
+        face = mixture([(1, kept), (rerolled, Distribution.uniform(low, max_value))])
+        return DicePool(self.amount, face, self.bounds)
+
+    def explode(self, thresh):
+        return ExplodedPool(self, thresh)
+
+
+class SelectedPool(Pool):
+    """The values at positions start to stop of a sorted pool of dice"""
+
+    description = "a selection of dice"
+
+    def __init__(self, pool, start, stop):
+        self.pool = pool
+        self.start = start
+        self.stop = stop
+        self.bounds = pool.bounds
+
+    def statistic(self, func):
+        # Faces are assigned in ascending order to the sorted positions,
+        # tracking the number of dice used so far, and the distribution of
+        # the statistic over those of them which are selected
+        amount, start, stop = self.pool.amount, self.start, self.stop
+        face = self.pool.face
+        values = np.asarray(func(face.support), dtype=np.int64)
+
+        count = stop - start
+        low = count * min(values.min(), 0)
+        width = count * max(values.max(), 0) - low + 1
+        faces = np.count_nonzero(face.pmf)
+        if faces * amount * (amount + 1) // 2 * width > MAX_SELECTION_WORK:
+            raise NotSupported("selections this large")
+
+        dp = np.zeros((amount + 1, width))
+        dp[0, -low] = 1
+
+        # From used dice, c more show each face, with binomial weights, and
+        # shift the statistic by its value for each of them selected
+        c = np.arange(amount + 1)
+        binomials = np.zeros((amount + 1, amount + 1))
+        binomials[:, 0] = 1
+        for n in range(1, amount + 1):
+            binomials[n, 1:] = binomials[n - 1, 1:] + binomials[n - 1, :-1]
+        columns = np.arange(width)
+        # Rows of used are done a block at a time, in arrays of at most
+        # about 2 ** 16 values: small statistics in few blocks, to save on
+        # calls, and large ones a row at a time, to save on padding
+        block = max(1, 2 ** 16 // ((amount + 1) * width))
+
+        for value, p in zip(values, face.pmf):
+            if not p:
+                continue
+
+            new = np.zeros((2 * amount + 2, width))
+            for first in range(0, amount + 1, block):
+                used = np.arange(first, min(first + block, amount + 1))
+                more = c[:amount - first + 1]
+                weights = binomials[amount - used][:, more] * p ** more
+                selected = (np.clip(used[:, None] + more, start, stop)
+                            - np.clip(used, start, stop)[:, None])
+                shifted = dp[used[:, None, None],
+                             (columns - selected[..., None] * value) % width]
+
+                # Sheared so the block's [u, c] lands on row u + c, and summed
+                k, length = len(used), len(used) + len(more) - 1
+                sheared = np.zeros((k, length + 1, width))
+                sheared[:, :len(more)] = weights[..., None] * shifted
+                sheared = sheared.reshape(-1, width)[:k * length].reshape(k, length, width)
+                new[first:first + length] += sheared.sum(axis=0)
+
+            dp = new[:amount + 1]
+
+        return Distribution(dp[amount], low)
+
+
+class ExplodedPool(Pool):
+    """A pool of dice where each die at or above a threshold adds another die,
+    making independent chains of dice"""
+
+    description = "exploded dice"
+
+    def __init__(self, pool, thresh):
+        self.pool = pool
+        self.thresh = thresh
+        self.bounds = pool.bounds
+
+    def chain(self, func):
+        """The distribution of func summed over one chain"""
+        thresh = self.thresh
+        extra = Distribution.uniform(*self.bounds)
+
+        def split(face):
+            above = face.support >= thresh
+            high = Distribution(np.where(above, face.pmf, 0), face.offset)
+            low = Distribution(np.where(above, 0, face.pmf), face.offset)
+            return high.map(func), low.map(func)
+
+        first_high, first_low = split(self.pool.face)
+        extra_high, extra_low = split(extra)
+
+        # each extra die either ends the chain below the threshold, or adds
+        # another one
+        tail, term = Distribution([]), extra_low
+        for j in range(MAX_EXPLOSIONS - 1):
+            tail = mixture([(1, tail), (1, term)])
+            term = term + extra_high
+            if term.total_probability() < EXPLOSION_EPSILON:
+                break
+
+        return mixture([(1, first_low), (1, first_high + tail)])
+
+    def statistic(self, func):
+        return self.chain(func).power(self.pool.amount)
+
+
+class MappedPool(Pool):
+    """A pool whose values have been transformed one by one"""
+
+    def __init__(self, pool, func):
+        self.pool = pool
+        self.func = func
+        self.description = pool.description
+
+    def statistic(self, func):
+        return self.pool.statistic(lambda values: func(self.func(values)))
+
+
+class MixturePool(Pool):
+    """A pool whose shape itself is random: one of several pools, chosen with
+    the given probabilities"""
+
+    def __init__(self, weighted):
+        self.weighted = weighted
+        bounds = set(pool.bounds for w, pool in weighted)
+        self.bounds = bounds.pop() if len(bounds) == 1 else None
+
+    def apply(self, method, *args):
+        return MixturePool([(w, getattr(pool, method)(*args)) for w, pool in self.weighted])
+
+    def statistic(self, func):
+        return mixture([(w, pool.statistic(func)) for w, pool in self.weighted])
+
+    def map(self, func, keep_bounds=False):
+        return self.apply("map", func, keep_bounds)
+
+    def single(self):
+        weighted = [(w, pool.single()) for w, pool in self.weighted]
+        if any(value is None for w, value in weighted):
+            return None
+        return mixture(weighted)
+
+    def marginals(self):
+        weighted = [(w, pool.marginals()) for w, pool in self.weighted]
+        if len(set(len(m) for w, m in weighted)) != 1:
+            raise NotSupported("element-wise comparisons of lists of random length")
+        return [mixture([(w, m[i]) for w, m in weighted]) for i in range(len(weighted[0][1]))]
+
+    def select(self, window, count):
+        return self.apply("select", window, count)
+
+    def reroll(self, thresh, forced):
+        return self.apply("reroll", thresh, forced)
+
+    def explode(self, thresh):
+        return self.apply("explode", thresh)
+
+
+class ListPool(Pool):
+    """Independent values and lists, one after the other"""
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def marginals(self):
+        return [m for part in self.parts for m in marginals(part)]
+
+    def statistic(self, func):
+        result = Distribution.constant(0)
+        for part in parts_statistics(self.parts, func):
+            result += part
+        return result
+
+
+def parts_statistics(parts, func):
+    for part in parts:
+        if isinstance(part, Distribution):
+            yield part.map(func)
+        else:
+            yield part.statistic(func)
+
+
+def calculates(*classes):
+    """Registers a calculation for the given element classes"""
+
+    def register(func):
+        for cls in classes:
+            CALCULATORS[cls] = func
+        return func
+
+    return register
+
+
+def calculate(node, **kwargs):
+    """Returns the distribution of an element's value: a Distribution, a Pool
+    or a list of ComparisonDistributions"""
+    if not isinstance(node, Element) or type(node) is Integer:
+        return Distribution.constant(int(node))
+
+    for cls in type(node).__mro__:
+        if cls in CALCULATORS:
+            try:
+                return CALCULATORS[cls](node, **kwargs)
+            except NotSupported as e:
+                raise node.fatal(
+                    "Exact distributions of %s are not supported." % e.args[0]
+                )
+
+    raise node.fatal("Exact distributions of %s are not supported." % classname(node))
+
+
+def calculate_scalar(node, **kwargs):
+    """Returns the distribution of an element coerced to an Integer"""
+    dist = calculate(node, **kwargs)
+
+    if isinstance(dist, Pool):
+        return dist.total()
+    elif isinstance(dist, list):
+        raise node.fatal("Cannot convert a comparison to an integer.")
+    return dist
+
+
+def calculate_pool(node, **kwargs):
+    dist = calculate(node, **kwargs)
+    if not isinstance(dist, Pool):
+        raise NotSupported("dice operators on scalars")
+    return dist
+
+
+def constant(node, **kwargs):
+    """Returns the value of an element that must not be random"""
+    dist = calculate_scalar(node, **kwargs)
+    if not dist.is_constant():
+        raise NotSupported("random thresholds and counts")
+    return dist.min
+
+
+@calculates(Variable)
+def calculate_variable(node, variables=None, **kwargs):
+    return Distribution.constant(int(node.evaluate(variables=variables)))
+
+
+@calculates(Dice)
+def calculate_dice(node, max_dice=MAX_ROLL_DICE, **kwargs):
+    if isinstance(node, WildDice):
+        raise NotSupported("wild dice")
+
+    amount = calculate_scalar(node.amount, max_dice=max_dice, **kwargs)
+    min_value = calculate_scalar(node.min_value, max_dice=max_dice, **kwargs)
+    max_value = calculate_scalar(node.max_value, max_dice=max_dice, **kwargs)
+
+    if amount.max > max_dice:
+        raise node.fatal("Too many dice! (max is %i)" % max_dice)
+    elif amount.min < 0:
+        raise node.fatal("Cannot roll less than zero dice!")
+
+    weighted = []
+    for n, p_n in amount.items():
+        for low, p_low in min_value.items():
+            for high, p_high in max_value.items():
+                if n and low > high:
+                    raise node.fatal(
+                        "Roll must have a valid range (got %s - %s, "
+                        "which evaluated to %i - %i). Are you trying to "
+                        "use a fudge roll as the sides?"
+                        % (node.min_value, node.max_value, low, high)
+                    )
+                face = Distribution.uniform(low, max(low, high))
+                weighted.append((p_n * p_low * p_high, DicePool(n, face, (low, high))))
+
+    if len(weighted) == 1:
+        return weighted[0][1]
+    return MixturePool(weighted)
+
+
+ARITHMETIC = {
+    Add: operator.add,
+    Sub: operator.sub,
+    Mul: operator.mul,
+    Div: operator.floordiv,
+    Modulo: operator.mod,
+}
+
+
+def partial(func, scalar):
+    """Applies an arithmetic operator with a constant right-hand side"""
+    return lambda values: func(values, scalar)
+
+
+@calculates(*ARITHMETIC)
+def calculate_arithmetic(node, **kwargs):
+    func = ARITHMETIC[type(node)]
+    value = calculate(node.original_operands[0], **kwargs)
+
+    if isinstance(value, list):
+        raise NotSupported("arithmetic on comparisons")
+
+    for i, operand in enumerate(node.original_operands[1:]):
+        right = calculate_scalar(operand, **kwargs)
+
+        if func in (operator.floordiv, operator.mod) and right.probability(0):
+            raise division_by_zero(node, i + 1)
+
+        if not isinstance(value, Pool):
+            value = combine(value, right, func)
+        elif right.is_constant():
+            value = value.map(partial(func, scalar=right.min))
+        elif value.single() is not None:
+            value = DicePool(1, combine(value.single(), right, func))
+        else:
+            raise NotSupported("arithmetic on lists with random values")
+
+    return value
+
+
+def combine(left, right, func):
+    if func is operator.add:
+        return left + right
+    elif func is operator.sub:
+        return left - right
+    return left.combine(right, func)
+
+
+@calculates(*COMPARATORS)
+def calculate_comparison(node, **kwargs):
+    if len(node.original_operands) != 2:
+        raise NotSupported("chained comparisons")
+
+    left, right = [calculate(o, **kwargs) for o in node.original_operands]
+    left_values, right_values = marginals(left), marginals(right)
+
+    if isinstance(left, Pool) and isinstance(right, Pool):
+        if len(left_values) != len(right_values):
+            raise TypeError("Element-wise comparison requires lists of equal length")
+    elif isinstance(left, Pool):
+        right_values = right_values * len(left_values)
+    elif isinstance(right, Pool):
+        left_values = left_values * len(right_values)
+
+    impl = COMPARATORS[type(node)]
+    return [
+        ComparisonDistribution(l, r, impl, node.token)
+        for l, r in zip(left_values, right_values)
+    ]
+
+
+def marginals(value):
+    """Returns the distribution of each value of a list, or of a scalar"""
+    if isinstance(value, list):
+        raise NotSupported("comparisons of comparisons")
+    elif isinstance(value, Distribution):
+        return [value]
+    return value.marginals()
+
+
+@calculates(Total)
+def calculate_total(node, **kwargs):
+    return calculate_scalar(node.original_operands[0], **kwargs)
+
+
+@calculates(Sort)
+def calculate_sort(node, **kwargs):
+    return calculate_pool(node.original_operands[0], **kwargs)
+
+
+SELECTIONS = {
+    Highest: highest_window,
+    Lowest: lowest_window,
+    Middle: middle_window,
+}
+
+
+@calculates(*SELECTIONS)
+def calculate_selection(node, **kwargs):
+    pool = calculate_pool(node.original_operands[0], **kwargs)
+    count = None
+    if len(node.original_operands) > 1:
+        count = constant(node.original_operands[1], **kwargs)
+    return pool.select(SELECTIONS[type(node)], count)
+
+
+@calculates(Extend)
+def calculate_extend(node, **kwargs):
+    parts = [calculate(o, **kwargs) for o in node.original_operands]
+    if any(isinstance(p, list) for p in parts):
+        raise NotSupported("lists of comparisons")
+    return ListPool(parts)
+
+
+@calculates(Array)
+def calculate_array(node, **kwargs):
+    return ListPool([calculate_scalar(o, **kwargs) for o in node.original_operands])
+
+
+@calculates(Negate)
+def calculate_negate(node, **kwargs):
+    value = calculate(node.original_operands[0], **kwargs)
+    if isinstance(value, Pool):
+        return value.map(operator.neg)
+    elif isinstance(value, list):
+        raise NotSupported("negated comparisons")
+    return -value
+
+
+def add_even_sub_odd(values):
+    return np.where(values % 2, -values, values)
+
+
+@calculates(AddEvenSubOdd)
+def calculate_add_even_sub_odd(node, **kwargs):
+    value = calculate(node.original_operands[0], **kwargs)
+    if isinstance(value, Pool):
+        return value.map(add_even_sub_odd, keep_bounds=True)
+    elif isinstance(value, list):
+        raise NotSupported("comparisons")
+    return value.map(add_even_sub_odd)
+
+
+@calculates(Successes, SuccessFail)
+def calculate_successes(node, **kwargs):
+    value = calculate(node.original_operands[0], **kwargs)
+    thresh = constant(node.original_operands[1], **kwargs)
+    fail_level = 1
+
+    if isinstance(value, list):
+        raise NotSupported("successes of comparisons")
+    elif isinstance(value, Pool) and value.bounds is not None:
+        fail_level, max_value = value.bounds
+
+        if thresh > max_value:
+            if isinstance(node, SuccessFail):
+                raise node.fatal("Success threshold higher than maximum roll result.")
+            raise node.fatal("Success threshold higher than roll result.")
+
+    if isinstance(node, SuccessFail):
+        def count(values):
+            return np.where(values >= thresh, 1, np.where(values <= fail_level, -1, 0))
+    else:
+        def count(values):
+            return (values >= thresh).astype(np.int64)
+
+    if isinstance(value, Pool):
+        return value.statistic(count)
+    return value.map(count)
+
+
+def roll_pool(node, **kwargs):
+    """Returns the pool and bounds of the roll operand of a dice operator,
+    and its threshold if it has one"""
+    pool = calculate_pool(node.original_operands[0], **kwargs)
+    if pool.bounds is None:
+        raise NotSupported("dice operators on lists")
+
+    thresh = None
+    if len(node.original_operands) == 2:
+        thresh = constant(node.original_operands[1], **kwargs)
+    elif len(node.original_operands) > 2:
+        raise NotSupported("repeated dice operators")
+
+    return pool, pool.bounds, thresh
+
+
+@calculates(Explode)
+def calculate_explode(node, **kwargs):
+    pool, (min_value, max_value), thresh = roll_pool(node, **kwargs)
+
+    if min_value == max_value:
+        raise node.fatal("Cannot explode a roll of one-sided dice.")
+    elif thresh is None:
+        thresh = max_value
+    elif thresh <= min_value:
+        orig_thresh = node.original_operands[1]
+        raise node.fatal(
+            "Refusing to explode with threshold less than or equal to "
+            "the lowest possible roll.",
+            offset=orig_thresh.location - node.location,
+        )
+
+    return pool.explode(thresh)
+
+
+@calculates(Reroll, ForceReroll)
+def calculate_reroll(node, **kwargs):
+    pool, (min_value, max_value), thresh = roll_pool(node, **kwargs)
+    if thresh is None:
+        thresh = min_value
+    return pool.reroll(thresh, isinstance(node, ForceReroll))
+
+
+def distribution(elements, max_dice=MAX_ROLL_DICE, variables=None):
+    """Returns the exact distribution of the value of each of the parsed
+    elements: a Distribution, or a ComparisonDistribution for each value
+    compared. Variables are bound from variables, as when rolling."""
+    result = []
+
+    for element in elements:
+        dist = calculate(element, max_dice=max_dice, variables=variables)
+
+        if isinstance(dist, Pool):
+            try:
+                dist = dist.total()
+            except NotSupported as e:
+                raise element.fatal(
+                    "Exact distributions of %s are not supported." % e.args[0]
+                )
+        if isinstance(dist, Distribution):
+            # Explosions are cut off at MAX_EXPLOSIONS, where rolls fail
+            dist = dist.normalized()
+
+        result.append(single(dist) if isinstance(dist, list) else dist)
+
+    return single(result)
@@ -0,0 +1,237 @@
+"""Random engines for the ``random`` keyword argument of evaluation.
+
+Anything with the ``randint`` and ``random`` methods of the random module can
+be passed as ``random=``. The engines here are random.Random subclasses that
+draw 32-bit words in blocks, from a NumPy Generator or from os.urandom, and map
+them to die faces by rejection sampling, so that every face is equally likely.
+
+They also provide ``randints(low, high, n)``, which Roll uses to draw a whole
+pool of dice in one call when the engine has it, and NumpyRandom provides
+``multinomial(n, k)`` for the face counts of CountedRoll and ``geometric(n, p)``
+for the lengths of exploding chains."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from array import array
+import math
+import os
+import random
+import weakref
+
+from .constants import RNG_BLOCK_SIZE
+
+WORD_BITS = 32
+WORD = 2 ** WORD_BITS
+
+# Below this many dice, NumpyRandom.randints draws from its buffer rather
+# than calling the generator
+NUMPY_MIN_BATCH = 16
+
+
+class BufferedRandom(random.Random):
+    """A random.Random drawing 32-bit words from blocks of block_size words.
+
+    Subclasses implement fill(n), returning a list of n uniformly distributed
+    words."""
+
+    def __init__(self, seed=None, block_size=RNG_BLOCK_SIZE):
+        self.block_size = block_size
+        self.words = []
+        super(BufferedRandom, self).__init__(seed)
+
+    def fill(self, n):
+        raise NotImplementedError("BufferedRandom subclass has no fill")
+
+    def word(self):
+        try:
+            return self.words.pop()
+        except IndexError:
+            self.words = self.fill(self.block_size)
+            return self.words.pop()
+
+    def seed(self, a=None, version=2):
+        self.words = []
+
+    def random(self):
+        """Returns a float in [0, 1) with 53 random bits"""
+        return ((self.word() >> 5) * 67108864.0 + (self.word() >> 6)) * (
+            1.0 / 9007199254740992.0
+        )
+
+    def getrandbits(self, k):
+        if k < 0:
+            raise ValueError("number of bits must be non-negative")
+
+        value, bits = 0, 0
+        while bits < k:
+            value = (value << WORD_BITS) | self.word()
+            bits += WORD_BITS
+
+        return value >> (bits - k)
+
+    def randint(self, a, b):
+        n = b - a + 1
+        if n <= 0:
+            raise ValueError("empty range for randint(%d, %d)" % (a, b))
+        elif n > WORD:
+            return a + self._randbelow(n)
+
+        # Words at or above the largest multiple of n would favour low faces
+        limit = WORD - WORD % n
+        word = self.word()
+        while word >= limit:
+            word = self.word()
+
+        return a + word % n
+
+    def randints(self, a, b, k):
+        """Returns a list of k integers in [a, b]"""
+        n = b - a + 1
+        if n <= 0:
+            raise ValueError("empty range for randints(%d, %d)" % (a, b))
+        elif n > WORD:
+            return [a + self._randbelow(n) for i in range(k)]
+
+        limit = WORD - WORD % n
+        result = []
+        append = result.append
+        words = self.words
+
+        while len(result) < k:
+            if not words:
+                words = self.words = self.fill(self.block_size)
+            word = words.pop()
+            if word < limit:
+                append(a + word % n)
+
+        return result
+
+    def getstate(self):
+        raise NotImplementedError("%s has no state to save" % type(self).__name__)
+
+    setstate = getstate
+
+
+class NumpyRandom(BufferedRandom):
+    """Draws blocks of words from a numpy.random.Generator. Seeds are
+    anything numpy.random.default_rng accepts."""
+
+    def __init__(self, seed=None, block_size=RNG_BLOCK_SIZE):
+        import numpy
+
+        self.numpy = numpy
+        super(NumpyRandom, self).__init__(seed, block_size)
+
+    def seed(self, a=None, version=2):
+        self.generator = self.numpy.random.default_rng(a)
+        self.words = []
+
+    def fill(self, n):
+        return self.generator.integers(
+            0, WORD, size=n, dtype=self.numpy.uint32
+        ).tolist()
+
+    def randints(self, a, b, k):
+        if k < NUMPY_MIN_BATCH or b - a + 1 > WORD:
+            return super(NumpyRandom, self).randints(a, b, k)
+        # Generator.integers rejects biased draws itself
+        return self.generator.integers(a, b, size=k, endpoint=True).tolist()
+
+    def multinomial(self, n, k):
+        return self.generator.multinomial(n, [1.0 / k] * k).tolist()
+
+    def geometric(self, n, p):
+        return self.generator.geometric(p, size=n).tolist()
+
+    def getstate(self):
+        return self.generator.bit_generator.state, list(self.words)
+
+    def setstate(self, state):
+        self.generator.bit_generator.state, words = state
+        self.words = list(words)
+
+
+_secure_engines = weakref.WeakSet()
+
+
+class SecureRandom(BufferedRandom):
+    """Draws blocks of words from os.urandom, which is suitable for
+    cryptographic use. Like random.SystemRandom, it can't be seeded.
+
+    Buffers are discarded in forked children, so that a parent and its
+    children never hand out the same words."""
+
+    def __init__(self, seed=None, block_size=RNG_BLOCK_SIZE):
+        super(SecureRandom, self).__init__(seed, block_size)
+        _secure_engines.add(self)
+
+    def fill(self, n):
+        words = array("I")
+        if words.itemsize != 4:  # nocover
+            words = array("L")
+        words.frombytes(os.urandom(n * words.itemsize))
+        return words.tolist()
+
+
+def _discard_secure_buffers():
+    for engine in list(_secure_engines):
+        engine.words = []
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_discard_secure_buffers)
+
+
+def multinomial(n, k, rnd_engine=random):
+    """Returns how many of n dice with k equally likely faces show each face.
+
+    Engines with a multinomial(n, k) method are used directly; for any other,
+    the counts are drawn from a NumPy generator seeded from the engine."""
+    sample = getattr(rnd_engine, "multinomial", None)
+    if sample is not None:
+        return sample(n, k)
+
+    import numpy
+
+    generator = numpy.random.default_rng(rnd_engine.getrandbits(128))
+    return generator.multinomial(n, [1.0 / k] * k).tolist()
+
+
+def geometric(n, p, rnd_engine=random):
+    """Returns n draws of how many trials it takes to get a success, when
+    each trial succeeds with probability p: at least one each.
+
+    Engines with a geometric(n, p) method are used directly; for any other,
+    each draw inverts the distribution on a uniform float from random()."""
+    sample = getattr(rnd_engine, "geometric", None)
+    if sample is not None:
+        return sample(n, p)
+    elif p >= 1:
+        return [1] * n
+
+    # P(draw > k) is (1 - p) ** k, so a draw is 1 when u < p without taking
+    # the log
+    scale = 1.0 / math.log1p(-p)
+    log = math.log
+    draws = [rnd_engine.random() for i in range(n)]
+    return [1 if u < p else 1 + int(log(1.0 - u) * scale) for u in draws]
+
+
+ENGINES = {
+    "python": random.Random,
+    "system": random.SystemRandom,
+    "numpy": NumpyRandom,
+    "secure": SecureRandom,
+}
+
+
+def engine(name, seed=None, **kwargs):
+    """Returns a new random engine of the given name from ENGINES"""
+    try:
+        cls = ENGINES[name]
+    except KeyError:
+        raise ValueError(
+            "Unknown random engine %r (expected one of %s)"
+            % (name, ", ".join(sorted(ENGINES)))
+        )
+    return cls(seed, **kwargs)
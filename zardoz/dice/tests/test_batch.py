@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+
+from pytest import importorskip, mark, raises
+
+from dice import compile, roll_many
+from dice.constants import DiceExtreme
+from dice.exceptions import DiceFatalException
+
+np = importorskip("numpy")
+
+MIN, MAX = DiceExtreme.EXTREME_MIN, DiceExtreme.EXTREME_MAX
+
+EXPRESSIONS = [
+    "20", "6d6", "4dF", "2d(1d6)", "6d6t", "3d6 + 2*4 - 1", "-(3d6)",
+    "+-(3d6)", "6d6s", "6d6a", "6d6e4", "6d6f4", "1, 2, 3", "2d6 | 3d6, 4d6",
+    "1d100 <= 45", "3d10 <= 4,5,6", "6d6rr3", "6d6r2", "4d6^3t + 8 <= 1d100",
+    "(1, 5, 3, 2)m", "(1, 5, 3, 2, 7)o(-1)", "(1, 5, 3, 2)l(-1)", "(5, 1, 2)h0",
+    "(1d4)d6", "1d6 | 0d6 | 2", "6w6",
+]
+
+
+def rows(result):
+    """Converts a batch result to lists of valid values per row"""
+    if isinstance(result, np.ma.MaskedArray):
+        mask = np.ma.getmaskarray(result)
+        return [
+            [x for x, m in zip(row, row_mask) if not m]
+            for row, row_mask in zip(result.data.tolist(), mask.tolist())
+        ]
+    return result.tolist()
+
+
+@mark.parametrize("expr", EXPRESSIONS)
+def test_matches_compiled(expr):
+    for extreme in (MIN, MAX):
+        expected = compile(expr)(force_extreme=extreme)
+        for row in rows(roll_many(expr, 3, force_extreme=extreme)):
+            if isinstance(row, list):
+                row, expected = sorted(row), sorted(expected)
+            assert row == expected
+
+
+def test_shapes():
+    assert roll_many("20", 5).shape == (5,)
+    assert roll_many("6d6", 5).shape == (5, 6)
+    assert roll_many("4d6^3", 5).shape == (5, 3)
+    assert roll_many("6d6t", 5).dtype == np.int64
+
+
+def test_seeded():
+    assert (roll_many("10d10x", 100, rng=7) == roll_many("10d10x", 100, rng=7)).all()
+    rng = np.random.default_rng(7)
+    assert roll_many("6d6", 10, rng=rng).shape == (10, 6)
+
+
+def test_ranges():
+    result = roll_many("10d6", 1000)
+    assert result.min() == 1 and result.max() == 6
+
+    result = roll_many("4dF", 1000)
+    assert result.min() == -1 and result.max() == 1
+
+    result = roll_many("6d6rr3", 1000)
+    assert result.min() == 4
+
+
+def test_explode():
+    result = roll_many("6d6x", 2000)
+    assert isinstance(result, np.ma.MaskedArray)
+
+    counts = result.count(axis=1)
+    assert counts.min() >= 6
+    assert (counts == 6 + (result >= 6).sum(axis=1)).all()
+
+    # E[1d6x] = 3.5 * 6 / 5
+    assert abs(roll_many("1d6xt", 100000, rng=0).mean() - 4.2) < 0.05
+
+
+def test_comparisons():
+    result = roll_many("1d20 >= 11", 1000, rng=0)
+    assert result.dtype.names == ("value", "delta")
+    assert result.shape == (1000, 1)
+    assert 0.4 < result["value"].mean() < 0.6
+
+    result = roll_many("3d10 <= 4,5,6", 4, force_extreme=MAX)
+    assert result["value"].tolist() == [[False, False, False]] * 4
+    assert result["delta"].tolist() == [[6, 5, 4]] * 4
+
+
+def test_selection_keeps_values():
+    result = roll_many("4d6^3", 10000, rng=0)
+    assert result.shape == (10000, 3)
+    assert abs(result.sum(axis=1).mean() - 12.24) < 0.1
+
+
+def test_errors():
+    with raises(DiceFatalException) as e:
+        roll_many("6 / (1 - 1)", 10)
+    assert e.value.loc == 5
+
+    with raises(DiceFatalException) as e:
+        roll_many("7d6", 10, max_dice=6)
+    assert e.value.msg == "Too many dice! (max is 6)"
+    assert roll_many("7d6", 10, max_dice=7).shape == (10, 7)
+
+    with raises(DiceFatalException):
+        roll_many("6d6x1", 10)
+
+    with raises(DiceFatalException):
+        roll_many("6d6e7", 10)
@@ -0,0 +1,123 @@
+from __future__ import absolute_import
+
+import pickle
+
+from dice import compile, parse_cache, roll, _parse_uncached
+from dice.cache import ParseCache, canonicalize
+from dice.elements import Roll, Trace
+from dice.exceptions import DiceFatalException
+from pytest import raises
+
+
+class TestCanonicalize(object):
+    def test_whitespace(self):
+        assert canonicalize(" 1d100  <=  45 ") == "1d100<=45"
+        assert canonicalize("4d6 ^ 3") == "4d6^3"
+
+    def test_whitespace_merges(self):
+        assert canonicalize("1 0") == "1 0"
+        assert canonicalize("6d6r r") == "6d6r r"
+        assert canonicalize("1 < = 2") == "1< =2"
+        assert canonicalize("( (1) )") == "((1))"
+
+    def test_case(self):
+        assert canonicalize("4D6H3") == "4d6h3"
+
+    def test_percentile(self):
+        assert canonicalize("d%") == "d100"
+        assert canonicalize("3D % + 5 % 2") == "3d100+5%2"
+        assert canonicalize("d%3") == "d%3"
+        assert canonicalize("d % 3") == "d%3"
+
+    def test_variables(self):
+        assert canonicalize("1D100 <= $BS") == "1d100<= $BS"
+        assert canonicalize("$BS + $bs") == "$BS+ $bs"
+        assert canonicalize("$x d6") == "$x d6"
+        assert canonicalize("$ x") == "$ x"
+
+
+class TestParseCache(object):
+    def test_counters(self):
+        cache = ParseCache(_parse_uncached, maxsize=2)
+        cache("1d6")
+        cache("1D6 ")
+        cache("2d6")
+        cache("3d6")
+
+        info = cache.info()
+        assert (info.hits, info.misses, info.evictions) == (1, 3, 1)
+        assert info.currsize == 2 and info.maxsize == 2
+        assert "1d6" not in cache and "3d6" in cache
+
+        cache.clear()
+        assert cache.info() == (0, 0, 0, 0, 2)
+
+    def test_lru_order(self):
+        cache = ParseCache(_parse_uncached, maxsize=2)
+        cache("1d6")
+        cache("2d6")
+        cache("1d6")
+        cache("3d6")
+        assert "1d6" in cache and "2d6" not in cache
+
+    def test_shared_trees(self):
+        cache = ParseCache(_parse_uncached)
+        first = cache("6d(6d6)t")[0]
+        first_trace = Trace()
+        first_result = first.evaluate_cached(trace=first_trace)
+
+        second = cache("6d(6d6)t")[0]
+        assert first is second
+        assert not hasattr(second, "result")
+        second.evaluate_cached()
+        assert first.evaluate_cached(trace=first_trace) is first_result
+
+    def test_dump_load(self):
+        cache = ParseCache(_parse_uncached)
+        cache("4d6^3t + 8")
+        cache("1d100 <= 45")
+
+        copy = ParseCache(None, maxsize=1)
+        copy.load(pickle.loads(pickle.dumps(cache.dump())))
+        assert "1d100<=45" in copy and len(copy) == 1
+        assert repr(copy("1d100 <= 45")) == repr(cache("1d100 <= 45"))
+        assert copy.info().misses == 0
+
+    def test_errors_not_cached(self):
+        cache = ParseCache(_parse_uncached)
+        with raises(Exception):
+            cache("6d")
+        assert len(cache) == 0
+
+
+def test_roll_uses_cache():
+    roll("7d7")
+    hits = parse_cache.info().hits
+    assert isinstance(roll("7 D 7"), Roll)
+    assert parse_cache.info().hits == hits + 1
+
+
+def test_cached_error_location():
+    with raises(DiceFatalException) as first:
+        roll("6d6 x (1-2)")
+    with raises(DiceFatalException) as second:
+        roll("6d6 x (1-2)")
+    assert first.value.loc == second.value.loc == 7
+
+
+def test_cached_error_relocated():
+    """Test that errors from a tree parsed from another spelling are moved
+    onto the string rolled"""
+    with raises(DiceFatalException) as first:
+        roll("6d6 x (1-2)")
+    with raises(DiceFatalException) as second:
+        roll("6D6   X   (1-2)")
+    assert first.value.loc == 7
+    assert second.value.pstr == "6D6   X   (1-2)"
+    assert second.value.loc == 11
+    assert second.value.msg == first.value.msg
+
+    compile("4 / (1 - 1)")
+    with raises(DiceFatalException) as e:
+        compile("4/(1-1)")()
+    assert (e.value.pstr, e.value.loc) == ("4/(1-1)", 3)
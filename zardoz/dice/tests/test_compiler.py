@@ -0,0 +1,146 @@
+from __future__ import absolute_import
+
+import random
+
+from pytest import mark, raises
+
+from dice import compile, roll
+from dice.compiler import LIST, ROLL, SCALAR, COMPARISONS, to_plain
+from dice.constants import DiceExtreme
+from dice.elements import Roll
+from dice.exceptions import DiceException, DiceFatalException
+
+MIN, MAX = DiceExtreme.EXTREME_MIN, DiceExtreme.EXTREME_MAX
+
+# Expressions whose compiled form draws from the random engine in the same
+# order as the tree
+SAME_DRAWS = [
+    "1337", "d6", "6d6", "6d%", "4dF", "3u6", "6w6", "2d(1d6)", "(2d6)d(2d6)",
+    "6d6t", "1d20+5", "3d6 + 2*4 - 1", "16 / 8 * 4 + 2 - 1", "-(3d6)",
+    "+-(3d6)", "6d6s", "6d6a", "6d6a4", "6d6e4", "6d6f4", "4dF e 1",
+    "(1, 2, 3) f 2", "1, 2, 3", "2d6 | 3d6, 4d6", "1d100 <= 45",
+    "3d10 <= 3d10", "3d10 <= 4,5,6", "2d6 < 3d6t", "1 >= 2", "1 == 1",
+    "(0-1)d6", "4d6^3", "6d6v2", "6d6m2", "6d6r2", "6d6rr3",
+    "4d6^3t + 8 <= 1d100",
+]
+
+
+def evaluate(expr, **kwargs):
+    try:
+        return to_plain(roll(expr, **kwargs))
+    except DiceFatalException as e:
+        return e.args
+
+
+def evaluate_compiled(expr, **kwargs):
+    try:
+        return compile(expr)(**kwargs)
+    except DiceFatalException as e:
+        return e.args
+
+
+@mark.parametrize("expr", SAME_DRAWS)
+def test_matches_tree(expr):
+    for seed in range(10):
+        tree = evaluate(expr, random=random.Random(seed))
+        assert evaluate_compiled(expr, random=random.Random(seed)) == tree
+
+    for extreme in (MIN, MAX):
+        tree = evaluate(expr, force_extreme=extreme)
+        assert evaluate_compiled(expr, force_extreme=extreme) == tree
+
+
+def test_kinds():
+    assert compile("20").kinds == [SCALAR]
+    assert compile("6d6").kinds == [ROLL]
+    assert compile("6d6x").kinds == [ROLL]
+    assert compile("6d6 + 1").kinds == [LIST]
+    assert compile("6d6t").kinds == [SCALAR]
+    assert compile("1d20 >= 15").kinds == [COMPARISONS]
+
+
+def test_plain_values():
+    result = compile("6d6")()
+    assert type(result) is list and len(result) == 6
+    assert all(type(x) is int and 1 <= x <= 6 for x in result)
+
+    assert compile("4d6^3t")(force_extreme=MAX) == 18
+    assert compile("3d10 <= 4,5,6")(force_extreme=MAX) == [
+        (False, 6), (False, 5), (False, 4),
+    ]
+
+
+def test_repeated_calls():
+    compiled = compile("3d6t")
+    results = {compiled() for i in range(500)}
+    assert results <= set(range(3, 19))
+    assert len(results) > 5
+
+
+def test_dice_operators():
+    assert compile("6d6^3")(force_extreme=MAX) == [6, 6, 6]
+    assert compile("6d6v2")(force_extreme=MIN) == [1, 1]
+    assert compile("6d6m2")(force_extreme=MIN) == [1, 1]
+    assert compile("6d6r")(force_extreme=MIN) == [1] * 6
+    assert compile("6d6rr3")(force_extreme=MAX) == [6] * 6
+
+    for i in range(50):
+        assert all(x > 3 for x in compile("6d6rr3")())
+        assert 1 <= len(compile("4d6^3")()) == 3
+
+        exploded = compile("6d6x4")()
+        assert len(exploded) == 6 + sum(x >= 4 for x in exploded)
+
+
+def test_errors():
+    with raises(DiceFatalException) as e:
+        compile("6 / (1 - 1)")()
+    assert e.value.loc == 5
+
+    with raises(DiceFatalException) as e:
+        compile("7d6")(max_dice=6)
+    assert e.value.msg == "Too many dice! (max is 6)"
+    assert len(compile("7d6")(max_dice=7)) == 7
+
+    with raises(DiceFatalException) as e:
+        compile("6d6x(0+1)")()
+    assert e.value.loc == 5
+    assert "(Add(0, 1) evaluated to 1)" in e.value.msg
+
+    with raises(DiceFatalException):
+        compile("6d6e7")()
+
+    with raises(DiceException):
+        compile("6d6 +")
+
+
+def test_fallback():
+    # nested dice as sides are evaluated through the tree
+    assert compile("6d(1d6)x").kinds == [None]
+    assert len(compile("6d(1d6)x")()) >= 6
+
+    with raises(DiceFatalException) as e:
+        compile("6d(2d6)e3")()
+    assert e.value.msg == "Nested dice in success not yet supported."
+    assert e.value.loc == 3
+
+    assert compile("(1, 2)h1")() == [2]
+
+
+def test_variables():
+    compiled = compile("($n)d6 + $m")
+    assert compiled(variables={"n": 2, "m": 3}, force_extreme=MAX) == [9, 9]
+    assert compiled(variables={"n": 1, "m": 0}, force_extreme=MIN) == [1]
+    assert compile("6d6x$k").kinds == [ROLL]
+
+    with raises(DiceFatalException) as e:
+        compiled(variables={"n": 2})
+    assert e.value.msg == "Undefined variable: $m"
+    assert e.value.loc == 9
+
+
+def test_breakdown():
+    result, trace = compile("4d6^3")(breakdown=True, force_extreme=MAX)
+    assert isinstance(result, Roll)
+    assert list(result) == [6, 6, 6]
+    assert trace[trace.elements[0]] is result
@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+
+import random
+
+from pytest import mark, raises
+
+from dice import parse_expression, roll, roll_max, roll_min
+from dice.cost import Budget, analyze, check, support
+from dice.elements import CountedList
+from dice.exceptions import DiceFatalException
+
+EXPRESSIONS = [
+    "20", "6d6", "4dF", "2d(1d6)", "6d6t", "3d6 + 2*4 - 1", "-(3d6)", "+-(3d6)",
+    "6d6s", "6d6a", "6d6e4", "6d6f4", "1, 2, 3", "2d6 | 3d6, 4d6", "1d100 <= 45",
+    "3d10 <= 4,5,6", "6d6rr3", "6d6r2", "4d6^3t + 8 <= 1d100", "(1, 5, 3, 2)m",
+    "(5, 1, 2)h0", "(1d4)d6", "1d6 | 0d6 | 2", "6w6", "4d6x", "10d6 / 3",
+    "10d6 % 4", "3d6 - 2d10", "(2d6)d(1d4)", "6d6x5t * 2", "2d6a6a6",
+]
+
+
+def values(result):
+    if isinstance(result, int):
+        return [int(result)]
+    return [x.value if hasattr(x, "value") else x for x in result]
+
+
+@mark.parametrize("expr", EXPRESSIONS)
+def test_bounds(expr):
+    """Test that evaluation stays within the estimated worst case"""
+    ast = parse_expression(expr)
+    cost, = analyze(ast)
+    rnd = random.Random(0)
+
+    for result in [roll_min(expr), roll_max(expr)] + [
+        roll(expr, random=rnd) for i in range(50)
+    ]:
+        assert all(cost.low <= x <= cost.high for x in values(result))
+        if cost.length is None:
+            assert isinstance(result, int)
+        else:
+            assert len(values(result)) <= cost.length
+
+
+def test_dice():
+    cost, = analyze(parse_expression("(64d6x)x"), max_dice=64)
+    assert cost.dice == cost.length == 64 * 256 ** 2
+
+    cost, = analyze(parse_expression("(1d100)d6 + 4d6"), max_dice=64)
+    assert cost.dice == 1 + 64 + 4 and cost.largest == 64
+
+    cost, = analyze(parse_expression("64d6 | 64d6a"))
+    assert cost.length == 192 and cost.dice == 128
+
+    # Counted rolls hold and roll one value per face
+    cost, = analyze(parse_expression("100000d10"), max_dice=64, max_pool_dice=10 ** 6)
+    assert cost.dice == cost.length == 10
+    assert isinstance(roll("100000d10", max_dice=64, max_pool_dice=10 ** 6), CountedList)
+
+
+def test_check():
+    budget = Budget(dice=2 ** 14, length=2 ** 14, output=2 ** 14)
+    assert check(parse_expression("64d6x"), budget, max_dice=64)
+
+    with raises(DiceFatalException) as e:
+        check(parse_expression("4d6 + (64d6x)x"), budget, max_dice=64)
+    assert e.value.loc == 6
+    assert e.value.msg == "Too many dice! (up to 4194304 could be rolled, max is 16384)"
+
+    with raises(DiceFatalException) as e:
+        check(parse_expression("64d6a6a6a6"), Budget(2 ** 14, 256, 1024))
+    assert e.value.msg == "List too long! (up to 512 values, max is 256)"
+
+    with raises(DiceFatalException) as e:
+        check(parse_expression("64d6 | 1d6"), Budget(2 ** 14, 2 ** 14, 64))
+    assert e.value.msg == "Result too large! (up to 65 values, max is 64)"
+
+
+def test_variables():
+    ast = parse_expression("(($n)d6x)x")
+    assert check(ast, variables={"n": 1}, max_dice=64)
+
+    with raises(DiceFatalException) as e:
+        check(ast, Budget(2 ** 14, 2 ** 14, 2 ** 14), variables={"n": 64}, max_dice=64)
+    assert e.value.msg == "Too many dice! (up to 4194304 could be rolled, max is 16384)"
+
+
+def test_support():
+    assert support(parse_expression("3d6"), max_dice=64) == 19 * 3
+    # The widest part of the expression counts, not the result
+    assert support(parse_expression("64d1000t > 5"), max_dice=64) == 64001 * 64
+    assert support(parse_expression("64d1000t * 100"), max_dice=64) == 6400001 * 64
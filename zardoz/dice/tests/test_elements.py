@@ -2,6 +2,8 @@ from __future__ import absolute_import
 
 from dice.constants import DiceExtreme
 from dice.exceptions import DiceException, DiceFatalException
+from copy import copy
+import operator
 import pickle
 from pytest import raises
 import random
@@ -17,8 +19,21 @@ from dice.elements import (
     Element,
     RandomElement,
     WildDice,
+    Trace,
+    CountedComparisons,
+    CountedRoll,
+    ComparisonList,
+    IntegerList,
+    WideIntegerList,
+    WideRoll,
+    WideValues,
+    Add,
+    Extend,
+    ForceReroll,
+    arity,
 )
-from dice import roll, roll_min, roll_max
+from dice import parse_expression, roll, roll_min, roll_max
+from dice.utilities import verbose_print
 
 
 class TestElements(object):
@@ -144,14 +159,54 @@ class TestErrors(object):
                 raise DiceException.from_other(e)
 
 
+def snapshot(element, memo=None):
+    """Returns the attributes of every element of a tree"""
+    if memo is None:
+        memo = {}
+    if isinstance(element, (tuple, list)):
+        for x in element:
+            snapshot(x, memo)
+    elif isinstance(element, Element) and id(element) not in memo:
+        memo[id(element)] = dict(getattr(element, "__dict__", {}))
+        for value in memo[id(element)].values():
+            snapshot(value, memo)
+    return memo
+
+
 class TestEvaluate(object):
+    def test_frozen(self):
+        """Test that evaluation leaves the parsed tree untouched"""
+        for expr in ("6d(6d6)t", "4d6^3 + 2", "6d6x", "6d6rr2", "1d20 >= 15",
+                     "(0-1)d6", "6 / (1 - 1)", "4dF a"):
+            ast = roll(expr, raw=True, single=False)
+            before = snapshot(ast)
+            try:
+                roll(expr)
+                Trace.evaluate(ast)
+            except DiceFatalException:
+                pass
+            assert snapshot(ast) == before
+
+    def test_threads(self):
+        """Test that a shared tree can be evaluated concurrently"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        ast = roll("10d6^8t", raw=True, single=False)
+        with ThreadPoolExecutor(8) as pool:
+            traces = list(pool.map(lambda i: Trace.evaluate(ast), range(200)))
+        for trace in traces:
+            (element, dice), = trace.rolls()
+            assert trace.results[0] == sum(sorted(dice)[-8:])
+        assert len(set(tuple(t.rolls()[0][1]) for t in traces)) > 1
+
     def test_cache(self):
         """Test that evaluation returns the same result on successive runs"""
         roll("6d(6d6)t")
         ast = Total(Dice(6, Dice(6, 6)))
-        evals = [ast.evaluate_cached() for i in range(100)]
+        trace = Trace()
+        evals = [ast.evaluate_cached(trace=trace) for i in range(100)]
         assert len(set(evals)) == 1
-        assert ast.evaluate_cached() is ast.evaluate_cached()
+        assert ast.evaluate_cached(trace=trace) is ast.evaluate_cached(trace=trace)
 
     def test_nocache(self):
         """Test that evaluation returns different result on successive runs"""
@@ -166,6 +221,135 @@ class TestEvaluate(object):
         assert roll("1d1*1d1*1d1") == 1
         assert roll("1d1/1d1/1d1") == 1
 
+    def test_arity(self):
+        """Test that operators apply their function to each operand in turn
+        only when it takes fewer operands than they have"""
+        assert arity(Add(1, 2).function, Add.PASS_KWARGS) == 2
+        assert arity(Extend(1, 2).function, Extend.PASS_KWARGS) is None
+        assert arity(ForceReroll(1, 2).function, ForceReroll.PASS_KWARGS) == 3
+        assert roll("(1d1t)t") == 1
+        assert roll("1 | 2, 3 | 4") == [1, 2, 3, 4]
+        assert roll("(1 | 2), 3") == [3, 3]
+
+    def test_inplace(self):
+        """Test that operators only reuse the results of their operands when
+        the trace doesn't keep them"""
+        ast = parse_expression("(1, 2, 3) * 2 + 1")
+        kept = Trace.evaluate(ast)
+        assert kept.results == [[3, 5, 7]]
+        assert kept[ast[0].original_operands[0]] == [2, 4, 6]
+        assert "-> [2, 4, 6]" in verbose_print(ast[0], kept)
+
+        reused = Trace.evaluate(ast, keep_intermediates=False)
+        assert reused.results == [[3, 5, 7]]
+        assert reused[ast[0].original_operands[0]] is reused.results[0]
+
+        # Rolls keep their values, as they're reported from the trace
+        trace = Trace.evaluate(parse_expression("-(6d6 + 1)"), keep_intermediates=False)
+        (element, dice), = trace.rolls()
+        assert isinstance(dice, Roll)
+        assert [-x - 1 for x in dice] == trace.results[0]
+
+    def test_overflow(self):
+        big = 99999999999999999999
+        assert roll("(1, 2) * %i" % big) == [big, 2 * big]
+        assert roll("2 * %i" % big) == 2 * big
+        result = roll("2d6 * 99999999999 * 99999999999")
+        assert all(x % 99999999999 ** 2 == 0 and 1 <= x // 99999999999 ** 2 <= 6 for x in result)
+
+        result = roll("3d%i" % (big + 1), random=random.Random(1))
+        assert isinstance(result, Roll) and isinstance(result, WideValues)
+        assert max(result) > 2 ** 63 and len(result) == 3
+        assert roll("3d%i" % (big + 1), random=random.Random(1)) == result
+
+
+class TestIntegerList(object):
+    def test_wide(self):
+        big = 2 ** 64
+        values = IntegerList([3, 1, 2])
+        values.assign([3, big, 2])
+        assert type(values) is WideIntegerList and isinstance(values, IntegerList)
+        assert values == [3, big, 2] and int(values) == big + 5
+        assert IntegerList([big]) == values[1:2] and IntegerList(values) == values
+        values.sort()
+        assert values == [2, 3, big] and str(values) == "[2, 3, %i] -> %i" % (big, big + 5)
+        assert values.apply(operator.sub, big) == [2 - big, 3 - big, 0]
+        assert values.apply(operator.sub, 1) == [1, 2, big - 1]
+
+        assert roll("(1, 2, %i)^2 | 4" % big) == [2, big, 4]
+        comparisons = roll("(1, %i) >= 3" % big)
+        assert [c.value for c in comparisons] == [False, True]
+        assert comparisons.deltas[1] == big - 3
+
+    def test_wide_roll(self):
+        big = 2 ** 64
+        dice = Dice(3, big)
+        result = Roll(dice, rolled=[1, big, 2])
+        assert type(result) is WideRoll and result.random_element is dice
+        for clone in (copy(result), result.copy(), pickle.loads(pickle.dumps(result))):
+            assert type(clone) is WideRoll and clone == result
+            assert clone.random_element == dice
+        clone = result.copy()
+        clone[0] = 5
+        assert result[0] == 1
+
+        rerolled = roll("3d%i r %i" % (big, big), random=random.Random(2))
+        assert isinstance(rerolled, Roll) and len(rerolled) == 3
+
+    def test_list(self):
+        values = IntegerList([3, 1, 2])
+        assert values == [3, 1, 2] and values != [1, 2, 3]
+        assert int(values) == 6 and str(values) == "[3, 1, 2] -> 6"
+        values.sort()
+        assert values == [1, 2, 3]
+        del values[1:]
+        assert values == [1]
+        values.clear()
+        assert values == [] and repr(values) == "[]"
+
+    def test_apply(self):
+        values = IntegerList([3, 1, 2])
+        assert values.apply(operator.mul, 2) == [6, 2, 4]
+        assert values == [3, 1, 2]
+        assert values.apply(operator.mul, 2, inplace=True) is values
+        assert values == [6, 2, 4]
+
+    def test_pickle(self):
+        for value in (roll("6d6"), roll("(1, 2) + 1"), roll_max("4d6x")):
+            clone = pickle.loads(pickle.dumps(value))
+            assert type(clone) is type(value) and clone == value
+            assert copy(value) == value and type(copy(value)) is type(value)
+        assert pickle.loads(pickle.dumps(roll("6d6"))).random_element == Dice(6, 6)
+
+    def test_comparisons(self):
+        result = roll("(1, 4, 6) > 4")
+        assert isinstance(result, ComparisonList)
+        assert result.values.tolist() == [0, 0, 1]
+        assert result.deltas.tolist() == [4, 1, 1]
+        assert result.successes == 1 and len(result) == 3
+        assert [(c.left, c.right, c.value) for c in result] == [
+            (1, 4, False), (4, 4, False), (6, 4, True)
+        ]
+        assert result[-1].delta == 1 and len(result[1:]) == 2
+        assert roll("3 <= 2").deltas.tolist() == [1]
+        assert tuple(result[0]) == (1, 4, 4, False, ">")
+
+    def test_slots(self):
+        """Test that results have no __dict__, and that their locations are
+        found through the trace instead"""
+        ast = parse_expression("4d6 >= 3") + parse_expression("2d6^1 | 4dF + 1")
+        trace = Trace.evaluate(ast)
+        for element, result in trace._results.values():
+            if not isinstance(result, int):
+                assert not hasattr(result, "__dict__")
+            assert trace.source(result) is element
+        assert not hasattr(trace.results[0][0], "__dict__")
+        assert trace.source(IntegerList()) is None
+
+        dice = parse_expression("1 + 4d6")[0].original_operands[1]
+        trace = Trace.evaluate([dice])
+        assert trace.source(trace.results[0]).location == 4
+
 
 class TestRegisterDice(object):
     def test_reregister(self):
@@ -214,3 +398,96 @@ class TestPickle(object):
         value = roll(expr, raw=True, single=False)
         pickled = pickle.dumps(value)
         clone = pickle.loads(pickled)
+
+
+class TestCountedRoll(object):
+    LISTED = dict(max_dice=1000)
+    COUNTED = dict(max_dice=4, max_pool_dice=1000)
+
+    def test_switch(self):
+        assert isinstance(roll("40d6", **self.LISTED), Roll)
+        assert isinstance(roll("40d6", **self.COUNTED), CountedRoll)
+        # Only rolls refused for having too many dice are counted
+        assert isinstance(roll("4d6", **self.COUNTED), Roll)
+        with raises(DiceFatalException):
+            roll("40d20", **self.COUNTED)
+        with raises(DiceFatalException):
+            roll("2000d6", **self.COUNTED)
+
+        result = roll("40d6", **self.COUNTED)
+        assert len(result) == 40 and sum(result.counts) == 40
+        assert result.values == sorted(set(result))
+        assert int(result) == sum(result)
+
+    def test_matches_lists(self):
+        for expr in ("40d6", "40d6t", "40d6^3", "40d6v3", "40d6m4", "40d6m(0-2)",
+                     "40d6o0", "40d6e4", "40d6f4", "40d6r2", "40d6a",
+                     "40d6 + 2", "40d6 * 2", "40d6 % 4", "-(40d6)", "40d6s",
+                     "40dF a", "40d6m50", "40d6m39", "40d6^50", "40d6v(0-50)"):
+            for extreme in (roll_min, roll_max):
+                try:
+                    listed = extreme(expr, **self.LISTED)
+                except DiceFatalException:
+                    with raises(DiceFatalException):
+                        extreme(expr, **self.COUNTED)
+                    continue
+                counted = extreme(expr, **self.COUNTED)
+                if isinstance(listed, int):
+                    assert counted == listed, expr
+                else:
+                    assert list(counted) == sorted(listed), expr
+
+        # Counted rerolls and explosions always follow force_extreme
+        assert list(roll_min("40d6x", **self.COUNTED)) == [1] * 40
+        with raises(DiceFatalException):
+            roll_max("40d6x", **self.COUNTED)
+        assert list(roll_min("40d6rr3", **self.COUNTED)) == [4] * 40
+        assert list(roll_max("40d6rr3", **self.COUNTED)) == [6] * 40
+
+    def test_comparisons(self):
+        result = roll_max("40d6 >= 5", **self.COUNTED)
+        assert isinstance(result, CountedComparisons)
+        assert result.successes == len(result) == 40
+        (comparison, count), = result.items()
+        assert (comparison.left, comparison.delta, count) == (6, 1, 40)
+
+        assert roll_min("3 < 40d6", **self.COUNTED).successes == 0
+        assert len(roll("40d6 <= 40d6", **self.COUNTED)) == 40
+
+    def test_large(self):
+        result = roll("100000d10", max_pool_dice=10 ** 6)
+        assert len(result) == 100000
+        assert all(8000 < c < 12000 for c in result.counts)
+
+        successes = roll("100000d10e8", max_pool_dice=10 ** 6)
+        assert 28000 < successes < 32000
+        assert roll("100000d10^10t", max_pool_dice=10 ** 6) == 100
+
+        # E[1d6x] = 4.2
+        exploded = roll("100000d6x", max_pool_dice=10 ** 6, random=random.Random(0))
+        assert abs(int(exploded) / 100000 - 4.2) < 0.05
+
+
+class TestVariable(object):
+    def test_bound(self):
+        assert roll("$x", variables={"x": 4}) == 4
+        assert roll("$n d1t + $BS", variables={"n": 3, "BS": 45}) == 48
+
+        result = roll("1d100 <= $BS", variables={"BS": 45}, force_extreme="MAX")
+        assert (result[0].value, result[0].delta) == (False, 55)
+
+    def test_parsed_once(self):
+        ast = parse_expression("$a * 2")
+        assert Trace.evaluate(ast, variables={"a": 3}).results == [6]
+        assert Trace.evaluate(ast, variables={"a": 5}).results == [10]
+        assert repr(ast) == "[Mul($a, 2)]"
+
+    def test_errors(self):
+        with raises(DiceFatalException) as e:
+            roll("1 + $x")
+        assert e.value.msg == "Undefined variable: $x"
+        assert e.value.loc == 4
+
+        with raises(DiceFatalException) as e:
+            roll("1 + $x", variables={"x": "many"})
+        assert e.value.msg == "Non-integer variable: $x"
@@ -153,6 +153,21 @@ class TestVectorOperators(object):
 
         assert len(roll("6d6o(-4)")) == 2
 
+    def test_stable(self):
+        """Test that kept values stay in the order they were rolled, and that
+        of equal values the later rank higher"""
+        assert roll("(5, 1, 4, 2, 3) ^ 3") == [5, 4, 3]
+        assert roll("(5, 1, 4, 2, 3) v 3") == [1, 2, 3]
+        assert roll("(5, 1, 4, 2, 3) o 3") == [4, 2, 3]
+        assert roll("(3, 5, 3) ^ 2") == [5, 3]
+        assert roll("(3, 5, 3) v 1") == [3]
+
+        values = list(roll("100d6"))
+        kept = roll("(%s) ^ 40" % ", ".join(map(str, values)))
+        assert sorted(kept) == sorted(values)[60:]
+        rest = iter(values)
+        assert all(x in rest for x in kept)
+
     def test_successes(self):
         assert roll("(2, 4, 6, 8) e 5") == 2
         assert roll("6 e 5") == 1
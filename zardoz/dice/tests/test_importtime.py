@@ -0,0 +1,60 @@
+from __future__ import absolute_import
+
+import os
+import subprocess
+import sys
+
+# The package containing zardoz, so that the import doesn't need installing
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+# Microseconds. Most of it is pyparsing: importing the bot as well costs
+# several times this.
+IMPORT_BUDGET = 250000
+BOT_MODULES = ("discord", "rich", "xdg", "aiosql", "aiosqlite", "zardoz.cogs")
+
+
+def run(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="")
+    return subprocess.run(
+        (sys.executable,) + args, cwd=ROOT, env=env, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+
+
+def import_time():
+    """Returns the total microseconds spent importing zardoz.dice, as reported
+    by -X importtime for the top-level imports"""
+    stderr = run("-X", "importtime", "-c", "import zardoz.dice").stderr
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.rstrip() in (" zardoz", " zardoz.dice"):
+            total += int(cumulative)
+    return total
+
+
+def test_no_bot_imports():
+    """Test that the dice package imports without any of the bot's
+    dependencies"""
+    code = "import sys, zardoz.dice; print(' '.join(sys.modules))"
+    modules = run("-c", code).stdout.split()
+    assert not [m for m in modules if m.split(".")[0] in BOT_MODULES or m in BOT_MODULES]
+
+
+def test_import_time():
+    # The best of a few runs, since the first pays for reading from disk
+    assert min(import_time() for i in range(3)) < IMPORT_BUDGET
+
+
+def test_lazy_grammar():
+    """Test that the grammar is only built once something is parsed"""
+    code = (
+        "from zardoz.dice import grammar, roll\n"
+        "assert not grammar._built\n"
+        "roll('1d6')\n"
+        "assert grammar.get_expression() is grammar.expression\n"
+    )
+    run("-c", code)
@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+
+import random
+
+from pytest import raises
+
+from dice import Limits, compile, roll
+from dice.exceptions import DiceBaseException, DiceException, DiceLimitException
+
+
+class FakeClock(object):
+    """A clock that moves on by a second each time it's read"""
+
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        self.time += 1
+        return self.time
+
+
+class MaxRandom(random.Random):
+    def randint(self, a, b):
+        return b
+
+    # Explosion chains are as long as a uniform draw can make them
+    def random(self):
+        return 1.0 - 2 ** -53
+
+
+def test_within_limits():
+    limits = Limits()
+    assert len(roll("6d6 + 2", limits=limits)) == 6
+    assert limits.rolled == 6 and limits.steps == 1
+
+    limits = Limits()
+    roll("(4d6r1)t", limits=limits, random=random.Random(0))
+    assert 4 <= limits.rolled <= 8 and limits.steps == 2
+
+
+def test_dice():
+    with raises(DiceLimitException) as e:
+        roll("4d6 + 10d6", limits=Limits(max_rolled=12))
+    assert isinstance(e.value, DiceException)
+    assert e.value.msg == "Too many dice rolled! (max is 12)"
+    assert e.value.loc == 6
+
+    # Explosions are charged for each die they roll
+    with raises(DiceLimitException):
+        roll("10d6x", limits=Limits(max_rolled=100), random=MaxRandom())
+
+
+def test_steps():
+    with raises(DiceLimitException) as e:
+        roll("((1d1 + 2) * 3) - 4", limits=Limits(max_steps=2))
+    assert e.value.msg == "Too many steps! (max is 2)"
+    assert roll("((1d1 + 2) * 3) - 4", limits=Limits(max_steps=3)) == [5]
+
+    # Subtrees without dice are worked out before rolling
+    assert roll("((1 + 2) * 3) - 4", limits=Limits(max_steps=0)) == 5
+
+
+def test_deadline():
+    limits = Limits(timeout=3, clock=FakeClock())
+    with raises(DiceLimitException) as e:
+        roll("20d6 + 1d6 + 1d6 + 1d6", limits=limits)
+    assert e.value.msg == "Took too long! (max is 3s)"
+    assert e.value.loc == 19
+
+    assert roll("1d6", limits=Limits(timeout=None, clock=FakeClock()))
+
+
+def test_compiled():
+    expr = compile("4d6 + 10d6")
+    with raises(DiceLimitException):
+        expr(limits=Limits(max_rolled=12))
+    assert len(expr(limits=Limits(max_rolled=14))) == 4
+
+    with raises(DiceLimitException):
+        compile("10d6x")(limits=Limits(max_rolled=100), random=MaxRandom())
+
+
+def test_wild():
+    """Test that wild dice stop rerolling once they've exploded as often as
+    other dice can"""
+    with raises(DiceBaseException) as e:
+        roll("2w6", random=MaxRandom())
+    assert e.value.msg == "Too many explosions!"
+
+    with raises(DiceBaseException):
+        compile("2w6")(random=MaxRandom())
@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+
+import pickle
+import random
+
+from pytest import mark, raises
+
+from dice import compile, parse_expression, roll
+from dice.compiler import to_plain
+from dice.constants import ValueKind
+from dice.elements import Folded, Integer, Trace
+from dice.exceptions import DiceFatalException
+from dice.optimize import is_random, optimize
+
+EXPRESSIONS = [
+    "1337", "2*4", "6d6", "3d6 + 2*4 - 1", "(2*3)d(4+2) + 10 / 2", "-(2*3)",
+    "4dF", "6w6", "2d(1d6)", "(1, 2, 3)t + 4", "1d100 <= 45 + 10",
+    "(1, 2, 3) * 2", "6d6x(3+3)", "6d6r(0+2)", "6d6a(2*3)", "4d6^(1+2)t",
+    "1 >= 2", "6d6e(2+2)", "2d6 | 3d6, 4d6", "1d20t + 5 + 3", "1d20t - 2 - 3",
+    "-(1d6t)", "+-(1d6t)", "1d20t >= 10", "6d6rr3rr2", "2d6a6a6", "6d(1d6)x",
+]
+
+ERRORS = [
+    "6d6 / (2-2)", "(0-1)d6", "6d6 x (1-2)", "(2 - 3)d6 + 1", "6d(3 - 4)",
+]
+
+
+def evaluate(elements, seed=0):
+    try:
+        trace = Trace.evaluate(elements, random=random.Random(seed))
+    except DiceFatalException as e:
+        return e.args
+    return [to_plain(r) for r in trace.results]
+
+
+@mark.parametrize("expr", EXPRESSIONS + ERRORS)
+def test_same_results(expr):
+    """Test that optimized trees roll the same values, and raise the same
+    errors, as the trees they came from"""
+    ast = parse_expression(expr)
+    optimized = optimize(ast)
+    for seed in range(5):
+        assert evaluate(optimized, seed) == evaluate(ast, seed)
+
+
+def test_folding():
+    ast = optimize(parse_expression("3d6 + 2*4 - 1"))
+    folded = ast[0].original_operands[1]
+    assert type(folded) is Folded and folded == 7
+    assert folded.location == 6 and repr(folded.original) == "Sub(Mul(2, 4), 1)"
+
+    ast = optimize(parse_expression("(1, 2, 3)t + 4"))
+    assert type(ast[0]) is Folded and ast[0] == 10
+
+    # Lists aren't folded, since their results may be modified in place
+    ast = optimize(parse_expression("(1, 2, 3) * 2"))
+    assert not isinstance(ast[0], int)
+
+
+def test_marks():
+    ast = optimize(parse_expression("4d6^3t + (1, 2)"))
+    total, array = ast[0].original_operands
+    assert ast[0].random and total.random and not array.random
+    assert is_random(total) and not is_random(array)
+    assert is_random(parse_expression("2d(1d6)")[0])
+
+
+def test_bounds():
+    dice, = optimize(parse_expression("(2*3)d(4+2)"))
+    assert dice.bounds == (6, 1, 6)
+    assert all(type(b) is Integer for b in dice.bounds)
+    assert len(roll("(2*3)d(4+2)")) == 6
+
+    assert optimize(parse_expression("2d(1d6)"))[0].bounds is None
+    assert optimize(parse_expression("(0-1)d6"))[0].bounds is None
+
+
+def test_kinds():
+    ast = optimize(parse_expression("4d6^3t + 8 <= 1d100"))
+    add, dice = ast[0].original_operands
+    highest = add.original_operands[0].original_operands[0]
+    assert ast[0].kind == ValueKind.COMPARISONS
+    assert add.kind == ValueKind.SCALAR and dice.kind == ValueKind.ROLL
+    assert highest.kind == ValueKind.ROLL
+    assert add.kernel == "scalar_function" and ast[0].kernel == "function"
+
+    # Lists keep the kernel that checks their types
+    ast = optimize(parse_expression("3d6 * 2"))
+    assert ast[0].kind == ValueKind.LIST and ast[0].kernel == "function"
+
+    ast = optimize(parse_expression("2d6, 3"))
+    assert ast[0].kind == ValueKind.LIST
+
+    # Counting successes gives a scalar, whatever is counted
+    ast = optimize(parse_expression("(2d6 <= 3)e1"))
+    assert ast[0].kind == ValueKind.SCALAR
+    assert ast[0].original_operands[0].kind == ValueKind.COMPARISONS
+
+
+def test_unchanged():
+    """Test that the parsed tree is copied rather than modified"""
+    ast = parse_expression("3d6 + 2*4 - 1")
+    before = repr(ast)
+    optimize(ast)
+    assert repr(ast) == before
+    assert not hasattr(ast[0], "random")
+    assert repr(roll("3d6 + 2*4 - 1", raw=True, single=False)) == before
+
+
+def test_cached():
+    first = parse_expression("1d20 + 2 + 3", optimize=True)
+    second = parse_expression("1d20 + 2 + 3", optimize=True)
+    assert first[0] is second[0]
+    assert parse_expression("1d20 + 2 + 3")[0] is not first[0]
+
+
+def test_errors():
+    with raises(DiceFatalException) as e:
+        roll("6d6 / (2-2)")
+    assert e.value.msg == "Division by zero (Sub(2, 2) evaluated to 0)"
+    assert e.value.loc == 7
+
+    with raises(DiceFatalException) as e:
+        compile("(0-1)d6")()
+    assert e.value.msg == "Cannot roll less than zero dice! (Sub(0, 1) evaluated to -1)"
+
+
+def test_pickle():
+    folded = optimize(parse_expression("3d6 + 2*4"))[0].original_operands[1]
+    copied = pickle.loads(pickle.dumps(folded))
+    assert copied == 8 and repr(copied.original) == "Mul(2, 4)"
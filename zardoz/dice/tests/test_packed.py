@@ -0,0 +1,81 @@
+from __future__ import absolute_import
+
+import pickle
+import random
+
+from pytest import mark, raises
+
+from dice import parse_expression
+from dice.compiler import to_plain
+from dice.elements import Add, Dice, Integer, Trace
+from dice.exceptions import DiceFatalException
+from dice.packed import FORMAT_VERSION, Packed, pack, unpack
+
+EXPRESSIONS = [
+    "1337", "d6", "6d6", "6d%", "4dF", "3u6", "6w6", "2d(1d6)", "(2d6)d(2d6)",
+    "6d6t", "3d6 + 2*4 - 1", "-(3d6)", "+-(3d6)", "6d6s", "6d6a4", "6d6e4",
+    "6d6f4", "1, 2, 3", "2d6 | 3d6, 4d6", "3d10 <= 4,5,6", "(0-1)d6",
+    "4d6^3", "6d6v2", "6d6m2", "6d6x5", "6d6r2", "6d6rr3", "4d6^3t + 8 <= 1d100",
+    "(1, 5, 3, 2)m", "10d6 % 4", "2d6a6a6", "20 / 4 == 5", "($n)d6 <= $BS",
+]
+
+
+def evaluate(elements, seed=0):
+    try:
+        trace = Trace.evaluate(elements, random=random.Random(seed),
+                               variables={"n": 3, "BS": 4})
+    except DiceFatalException as e:
+        return e.args
+    return [to_plain(r) for r in trace.results]
+
+
+@mark.parametrize("expr", EXPRESSIONS)
+def test_round_trip(expr):
+    """Test that unpacking gives an equivalent tree, with the same locations"""
+    ast = parse_expression(expr)
+    unpacked = unpack(pickle.loads(pickle.dumps(pack(ast))))
+
+    assert repr(unpacked) == repr(ast)
+    assert evaluate(unpacked) == evaluate(ast)
+    assert pack(unpacked) == pack(ast)
+
+
+def test_compact():
+    ast = parse_expression("4d6^3t + 8 <= 1d100")
+    packed = pack(ast)
+    assert packed.source == "4d6^3t + 8 <= 1d100"
+    assert len(packed.code) == 2 * len(packed.spans)
+    assert len(pickle.dumps(packed)) < len(pickle.dumps(ast)) / 4
+    assert pickle.loads(pickle.dumps(packed)) == packed
+
+
+def test_locations():
+    ast = unpack(pack(parse_expression("2d6 + 4 / (1d6 - 1d6)")))
+    assert ast[0].location == 0
+
+    with raises(DiceFatalException) as e:
+        Trace.evaluate(ast, force_extreme="MIN")
+    assert e.value.loc == 11
+    assert e.value.msg == "Division by zero (Sub(1d6, 1d6) evaluated to 0)"
+
+
+def test_shared():
+    dice = Dice(Integer(2), Integer(6)).set_parse_attributes("2d6", 0, None)
+    ast = unpack(pack([Add(dice, dice)], source="2d6"))
+    assert ast[0].original_operands[0] is ast[0].original_operands[1]
+    assert ast[0].original_operands[0].amount == 2
+
+
+def test_constants():
+    ast = unpack(pack(parse_expression("1d6 + 10000000000")))
+    assert ast[0].original_operands[1] == 10 ** 10
+    assert isinstance(ast[0].original_operands[1], Integer)
+
+
+def test_errors():
+    with raises(TypeError):
+        pack(["d6"])
+
+    packed = pack(parse_expression("1d6"))
+    with raises(ValueError):
+        unpack(Packed(FORMAT_VERSION + 1, *packed[1:]))
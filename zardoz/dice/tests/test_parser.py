@@ -0,0 +1,88 @@
+"""Differential tests of the precedence-climbing parser against the grammar"""
+from __future__ import absolute_import
+
+from pyparsing import ParseBaseException, ParseFatalException
+from pytest import mark, raises
+
+from dice import parser, roll, _parse_uncached
+from dice.elements import Element
+from dice.exceptions import DiceException
+
+
+CORPUS = [
+    # literals, dice and nesting
+    "1337", "d6", "6d6", "D6", "6D%", "d%", "dF", "4dF", "3u6", "u6", "6w6",
+    "2d(1d6)", "(2d6)d(2d6)", "d(d6)", "dd6", "d6d6", "6d6t", "(6)",
+    "  4d6 ^ 3  ", "1d100 <= 45", "4d6^3", "1d20+5", "2d6t + 3d6t",
+    # dice operators and their postfix forms
+    "6d6x", "6d6x5", "6d6X5", "6d6x2x", "6d6xx", "6d6x2x3", "6d6rr", "6d6rr3",
+    "6d6r", "6d6r2", "6d6 r r", "6d6^", "6d6^3", "6d6h3", "6d6H", "6d6v",
+    "6d6l2", "6d6L", "6d6o", "6d6m2", "6d6O", "6d6a", "6d6a6", "6d6e4",
+    "6d6f4", "6d6t", "6d6s", "6d6st", "4d6tt", "6d6^(-3)", "6d6o(-4)",
+    # prefix operators
+    "-2", "--2", "+2", "+-2", "+-(1, 2)", "-(1, 2)", "-2x", "-d6", "+d6",
+    "-+2",
+    # arithmetic and precedence
+    "16 / 8 * 4 + 2 - 1", "16 - 8 + 4 * 2 / 1", "10 - 3 + 2", "1 + 2 * 3",
+    "1--2", "1+-2", "5 % 3", "3d6 + 2*4 - 1", "(1 + 2) * 3", "1d1+1d1+1d1",
+    # lists and comparisons
+    "1, 2, 3", "(1, 2, 5, 9, 3) v 3", "2d6 | 3d6, 4d6", "2d6 | 3d6 | 10 | 4d6",
+    "3d10 < 5", "3d10 <= 3d10", "3d10 < 2d5t", "3d10 <= 4,5,6", "1 == 1",
+    "1 >= 2", "1 > 2", "1<2<3", "4d6^3t + 8 <= 1d100", "((1))",
+    # syntax errors
+    "", "6d", "1+", "[1,2,3]", "f", "3f", "6.+6", "7.-7", "(6d6", "6d6)",
+    "+ -2", "1 0", "< =", "2dd6", "6d6 r r3",
+    # fatal errors raised while parsing
+    "6d6d6", "1d6d6d6", "d0", "6d0", "2wF", "3 + 6d6d6",
+]
+
+
+def dump(node, path=()):
+    """Returns a comparable description of a tree, including locations"""
+    if id(node) in path:
+        return ("cycle", type(node).__name__)
+
+    if not isinstance(node, Element):
+        return (type(node).__name__, node)
+
+    tokens = getattr(node, "tokens", None)
+    if tokens is not None:
+        tokens = tuple(dump(t, path + (id(node),)) for t in tokens)
+
+    return (type(node).__name__, repr(node), node.location, tokens)
+
+
+def outcome(parse, string):
+    try:
+        return ("ok", tuple(dump(node) for node in parse(string)))
+    except ParseFatalException as e:
+        return ("fatal", e.loc, e.msg)
+    except ParseBaseException:
+        return ("error",)
+
+
+@mark.parametrize("string", CORPUS)
+def test_matches_grammar(string):
+    assert outcome(parser.parse, string) == outcome(_parse_uncached, string)
+
+
+def test_syntax_error():
+    with raises(DiceException) as e:
+        parser.parse("(6d6")
+    assert e.value.loc == 4
+
+    with raises(DiceException) as e:
+        parser.parse("6d6)")
+    assert e.value.loc == 3
+
+
+def test_deep_nesting():
+    assert parser.parse("(((((((1)))))))") == [1]
+
+
+def test_select_parser():
+    assert roll("2 + 2", parser="precedence", cache=False) == 4
+    assert roll("6d6t", parser="precedence") <= 36
+
+    with raises(KeyError):
+        roll("2", parser="nonexistent")
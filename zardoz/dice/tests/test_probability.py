@@ -0,0 +1,98 @@
+from __future__ import absolute_import
+
+import time
+
+from pytest import approx, importorskip, mark, raises
+
+from dice import distribution, roll_many
+from dice.exceptions import DiceFatalException
+
+np = importorskip("numpy")
+
+from dice.probability import ComparisonDistribution, Distribution  # noqa: E402
+
+SAMPLED = [
+    "6d6t", "3d6 + 2*4 - 1", "4dF", "4d6^3t", "4d6v1t", "5d6m3t", "6d6rr3t",
+    "6d6r2t", "1d6xt", "3d6x5t", "2d(1d6)t", "6d6s", "-(3d6)t", "+-(3d6)",
+]
+
+
+def test_exact():
+    dist = distribution("2d6")
+    assert dist.min == 2 and dist.max == 12
+    assert dist.probability(7) == approx(6 / 36)
+    assert dist.probability(13) == 0
+    assert dist.mean == approx(7)
+    assert dist.percentile(50) == 7
+
+    assert distribution("20").is_constant
+    assert distribution("4d6^3t").mean == approx(12.2446, abs=1e-4)
+    assert distribution("1d6x").mean == approx(4.2)
+    assert distribution("3d6m1").mean == approx(3.5)
+
+    fudge = distribution("4dF")
+    assert (fudge.min, fudge.max) == (-4, 4)
+    assert fudge.probability(0) == approx(19 / 81)
+
+    assert distribution("6d6rr3t").min == 24
+    assert distribution("1d6r").mean == approx((3.5 + 2 + 3 + 4 + 5 + 6) / 6)
+
+
+def test_comparisons():
+    result = distribution("1d20+5 >= 15")
+    assert isinstance(result, ComparisonDistribution)
+    assert result.probability == approx(0.55)
+    assert result.margin == approx(5)
+
+    result = distribution("3d10 <= 4,5,6")
+    assert [c.probability for c in result] == approx([0.4, 0.5, 0.6])
+
+
+def test_large_pools():
+    start = time.perf_counter()
+    dist = distribution("200d10t")
+    assert time.perf_counter() - start < 2
+    assert isinstance(dist, Distribution)
+    assert (dist.min, dist.max) == (200, 2000)
+    assert dist.mean == approx(1100)
+    assert dist.total_probability() == approx(1)
+
+
+def test_large_selections():
+    start = time.perf_counter()
+    dist = distribution("64d20^32t", max_dice=64)
+    assert time.perf_counter() - start < 2
+    assert (dist.min, dist.max) == (32, 640)
+    assert dist.total_probability() == approx(1)
+
+    with raises(DiceFatalException) as e:
+        distribution("64d1000^32", max_dice=64)
+    assert e.value.msg == "Exact distributions of selections this large are not supported."
+
+
+@mark.parametrize("expr", SAMPLED)
+def test_matches_sampling(expr):
+    dist = distribution(expr)
+    sample = roll_many(expr, 20000, rng=0)
+    if sample.ndim > 1:
+        sample = sample.sum(axis=1)
+    assert sample.mean() == approx(dist.mean, abs=4 * dist.std / np.sqrt(20000) + 1e-9)
+    assert dist.min <= sample.min() and sample.max() <= dist.max
+
+
+def test_errors():
+    with raises(DiceFatalException) as e:
+        distribution("6 / (1 - 1)")
+    assert e.value.loc == 5
+
+    with raises(DiceFatalException) as e:
+        distribution("6w6")
+    assert e.value.msg == "Exact distributions of wild dice are not supported."
+
+    with raises(DiceFatalException) as e:
+        distribution("6d6x^3")
+    assert "selections from exploded dice" in e.value.msg
+
+    with raises(DiceFatalException) as e:
+        distribution("7d6", max_dice=6)
+    assert e.value.msg == "Too many dice! (max is 6)"
@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+
+from collections import Counter
+import random
+
+from pytest import importorskip, mark, raises
+
+from dice import roll
+from dice.rng import WORD, BufferedRandom, NumpyRandom, SecureRandom, engine, geometric
+
+
+class ListRandom(BufferedRandom):
+    """Hands out a fixed sequence of words"""
+
+    def __init__(self, words):
+        self.sequence = list(words)
+        super(ListRandom, self).__init__(block_size=1)
+
+    def fill(self, n):
+        return [self.sequence.pop(0) for i in range(n)]
+
+
+@mark.parametrize("name", ["secure", "numpy"])
+def test_faces(name):
+    if name == "numpy":
+        importorskip("numpy")
+    rng = engine(name, 0)
+
+    counts = Counter(rng.randint(1, 6) for i in range(6000))
+    assert sorted(counts) == [1, 2, 3, 4, 5, 6]
+    assert all(800 < c < 1200 for c in counts.values())
+
+    values = rng.randints(-1, 1, 3000)
+    assert len(values) == 3000 and set(values) == {-1, 0, 1}
+    assert rng.randints(1, 6, 0) == []
+    assert rng.randint(3, 3) == 3
+
+    with raises(ValueError):
+        rng.randint(2, 1)
+
+    assert 0 <= rng.random() < 1
+    assert 0 <= rng.getrandbits(70) < 2 ** 70
+    assert 0 <= rng.randint(0, 2 ** 40) <= 2 ** 40
+
+    values = list(range(20))
+    rng.shuffle(values)
+    assert sorted(values) == list(range(20))
+
+
+@mark.parametrize("name", ["python", "numpy"])
+def test_geometric(name):
+    if name == "numpy":
+        importorskip("numpy")
+    rng = engine(name, 0)
+
+    # Trials up to and including the first success, 4 on average
+    draws = geometric(8000, 0.25, rng)
+    assert min(draws) == 1 and 3.8 < sum(draws) / 8000.0 < 4.2
+    assert 1800 < draws.count(1) < 2200
+    assert geometric(5, 1.0, rng) == [1] * 5
+    assert geometric(0, 0.5, rng) == []
+
+
+def test_rejection():
+    # Words from the largest multiple of 3 below 2**32 up are rejected
+    limit = WORD - WORD % 3
+    rng = ListRandom([limit, WORD - 1, 4, limit + 1, 5])
+    assert rng.randint(1, 3) == 2
+    assert rng.randints(1, 3, 1) == [3]
+
+
+def test_seeded():
+    importorskip("numpy")
+    assert NumpyRandom(7).randints(1, 6, 100) == NumpyRandom(7).randints(1, 6, 100)
+    assert NumpyRandom(7).randints(1, 6, 5) == [NumpyRandom(7).randint(1, 6)] + \
+        NumpyRandom(7).randints(1, 6, 5)[1:]
+
+    rng = NumpyRandom(7)
+    rng.randint(1, 6)
+    state = rng.getstate()
+    first = rng.randints(1, 20, 50)
+    rng.setstate(state)
+    assert rng.randints(1, 20, 50) == first
+
+    with raises(NotImplementedError):
+        SecureRandom().getstate()
+
+
+def test_roll():
+    for name in ("python", "secure"):
+        rng = engine(name)
+        for expr in ("64d6", "6d6x", "6d6rr3", "4d6^3", "6w6", "4dF"):
+            roll(expr, random=rng)
+        assert all(1 <= x <= 6 for x in roll("64d6", random=rng))
+        assert all(x > 3 for x in roll("6d6rr3", random=rng))
+
+    with raises(ValueError):
+        engine("dice")
+
+
+def test_engine_reaches_operators():
+    # Explosions, rerolls and selections draw from the given engine
+    for expr in ("10d10x9", "6d6r2", "4d6^3"):
+        assert roll(expr, random=random.Random(3)) == roll(expr, random=random.Random(3))
@@ -5,29 +5,35 @@ from pytest import raises
 import random
 import string
 
-from dice import roll, utilities
+from dice import grammar, roll, utilities
 from dice.utilities import verbose_print
-from dice.elements import RandomElement, FudgeDice
+from dice.elements import RandomElement, FudgeDice, Trace
 
 
 def test_enable_pyparsing_packrat_parsing():
     """Test that packrat parsing was enabled"""
     import pyparsing
 
+    grammar.get_expression()
+
     assert pyparsing.ParserElement._packratEnabled is True
 
 
 def test_disable_pyparsing_arity_trimming():
     """Test that pyparsing._trim_arity has been replaced"""
     import pyparsing
-    import dice.utilities
 
-    assert pyparsing._trim_arity is dice.utilities._trim_arity
+    grammar.get_expression()
+
+    # Whichever copy of this package built its grammar last did the patching
+    assert pyparsing._trim_arity.__module__.endswith("dice.utilities")
+    assert pyparsing._trim_arity.__name__ == utilities._trim_arity.__name__
 
 
 def test_disable_pyparsing_arity_trimming_works():
     """Tests that arity trimming has been disabled and parse actions with
     the wrong number of arguments will raise TypeErrors"""
+    grammar.get_expression()
     for func in [lambda a: None, lambda a, b: None, lambda a, b, c, d: None]:
         element = Literal("test").setParseAction(func)
         with raises(TypeError):
@@ -37,8 +43,9 @@ def test_disable_pyparsing_arity_trimming_works():
 class TestVerbosePrint(object):
     def _get_vprint(self, expr):
         raw = roll(expr, raw=True)
-        evaluated = raw.evaluate_cached()
-        vprint = verbose_print(raw)
+        trace = Trace()
+        evaluated = raw.evaluate_cached(trace=trace)
+        vprint = verbose_print(raw, trace)
         return evaluated, vprint
 
     def test_dice_simple(self):
@@ -109,3 +116,22 @@ def test_too_many_explosions():
     with raises(ParseFatalException):
         while True:
             roll("1000d1000x2")
+
+
+def test_exploded_order():
+    """Test that chains of explosions are laid out a round at a time"""
+    assert utilities.exploded_order([], [], []) == []
+    assert utilities.exploded_order([1, 3, 2], [6, 5, 4], [1, 2, 3]) == [
+        1, 6, 5, 4, 2, 3
+    ]
+
+
+def test_explode_distribution():
+    """Test that explosions add as many dice as rolling a round at a time"""
+    rnd = random.Random(0)
+    rolls = [roll("10d6x2", random=rnd) for i in range(4000)]
+
+    # Each die adds 5 more on average, 6 to its chain's total of 21
+    assert abs(sum(len(r) for r in rolls) / 4000.0 - 60) < 1
+    assert abs(sum(sum(r) for r in rolls) / 4000.0 - 210) < 4
+    assert all(r[-1] == 1 for r in rolls if len(r) > 10)
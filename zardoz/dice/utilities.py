@@ -2,6 +2,8 @@ from __future__ import absolute_import, unicode_literals
 
 from . import elements
 from .constants import VERBOSE_INDENT
+from collections import Counter
+import heapq
 import warnings
 import pyparsing
 
@@ -60,16 +62,142 @@ def wrap_string(cls, *args, **kwargs):
 
 def add_even_sub_odd(operator, operand):
     """Add even numbers, subtract odd ones. See http://1w6.org/w6 """
+    if isinstance(operand, elements.CountedList):
+        return operand.map(lambda x: -x if x % 2 else x)
+
     try:
-        for i, x in enumerate(operand):
-            if x % 2:
-                operand[i] = -x
-        return operand
-    except TypeError:
+        operand = operand.copy()
+    except AttributeError:
         if operand % 2:
             return -operand
         return operand
 
+    for i, x in enumerate(operand):
+        if x % 2:
+            operand[i] = -x
+    return operand
+
+
+def lowest_window(num, n=None):
+    """Returns the ranks, lowest first, of the values Lowest keeps out of num:
+    the lowest n, all but the highest -n if n is negative, or all but the
+    highest one by default"""
+    if n is None:
+        n = num - 1
+    return 0, slice(n, None).indices(num)[0]
+
+
+def highest_window(num, n=None):
+    """Returns the ranks, lowest first, of the values Highest keeps out of num:
+    the highest n, all but the lowest -n if n is negative, or all but the
+    lowest one by default"""
+    if n is None:
+        n = num - 1
+    return slice(None, -n).indices(num)[1], num
+
+
+def middle_window(num, n=None):
+    """Returns the ranks, lowest first, of the values Middle keeps out of num:
+    the middle n, all but -n if n isn't positive, or all but the lowest and
+    highest by default. Odd values more are removed from the bottom."""
+    if n is None:
+        n = (num - 2) if num > 2 else 1
+    elif n <= 0:
+        n += num
+
+    num_remove = num - n
+    upper = num_remove // 2
+    lower = num_remove - upper
+
+    # The lowest are removed first, then the highest of those left
+    start = slice(None, lower).indices(num)[1]
+    return start, start + slice(-upper, None).indices(num - start)[0]
+
+
+def ranked(values, counts, rank):
+    """Returns the value ranked rank, lowest first, of a list of values, and
+    how many of the values are below it. counts gives the number of times each
+    value occurs."""
+    num = len(values)
+
+    # Dice have few distinct values, which can be walked in order
+    if len(counts) * 8 <= num:
+        below = 0
+        for value in sorted(counts):
+            if below + counts[value] > rank:
+                return value, below
+            below += counts[value]
+
+    # A heap is only worth it near either end; a deep rank is found from a
+    # sorted copy, which heapq would make anyway
+    if (rank + 1) * 8 <= num:
+        lowest = heapq.nsmallest(rank + 1, values)
+    elif (num - rank) * 8 <= num:
+        highest = heapq.nlargest(num - rank, values)
+        value = highest[-1]
+        return value, num - highest.index(value) - counts[value]
+    else:
+        lowest = sorted(values)[:rank + 1]
+
+    value = lowest[-1]
+    return value, lowest.index(value)
+
+
+def select_window(values, start, stop):
+    """Returns the values ranked start to stop, lowest first, in the order they
+    came in. Equal values rank in the order they came in.
+
+    The values at either end of the window are found from the counts of each
+    value, or with a heap, and the rest is one pass over the values, so the
+    list itself is never reordered."""
+    num = len(values)
+    if stop - start >= num:
+        return list(values)
+    elif stop <= start:
+        return []
+
+    counts = Counter(values)
+    low, below_low = ranked(values, counts, start)
+    high, below_high = ranked(values, counts, stop - 1)
+    # Occurrences of low before skip_low rank below start, and occurrences of
+    # high from take_high rank above stop
+    skip_low, take_high = start - below_low, stop - below_high
+
+    if skip_low == 0 and take_high == counts[high]:
+        return [x for x in values if low <= x <= high]
+
+    ret = []
+    seen_low = seen_high = 0
+    for x in values:
+        if low < x < high:
+            ret.append(x)
+        elif x == low:
+            if skip_low <= seen_low and (x != high or seen_low < take_high):
+                ret.append(x)
+            seen_low += 1
+        elif x == high:
+            if seen_high < take_high:
+                ret.append(x)
+            seen_high += 1
+    return ret
+
+
+def exploded_order(chains, hits, misses):
+    """Lays out the dice added by exploding chains in the order they'd be
+    rolled, one round of explosions at a time. chains gives the number of dice
+    each chain adds, hits the faces of the dice that explode again, and misses
+    the faces of the dice that end each chain."""
+    hit, miss = iter(hits).__next__, iter(misses).__next__
+    result = []
+    depth = 1
+
+    while chains:
+        result.extend([hit() if n > depth else miss() for n in chains])
+        chains = [n for n in chains if n > depth]
+        depth += 1
+
+    return result
+
 
 def dice_switch(amount, dice_type, kind="d"):
     kind = kind.lower()
@@ -84,7 +212,7 @@ def dice_switch(amount, dice_type, kind="d"):
     if dice_type == "f":
         if kind not in ("d", "u"):
             raise ValueError("can only use dF or uF", 2)
-        return dice.elements.FudgeDice(amount, 1)
+        return elements.FudgeDice(amount, 1)
     elif kind not in elements.RandomElement.DICE_MAP:
         raise ValueError("unknown dice kind: %s" % kind, 1)
 
@@ -96,12 +224,12 @@ def dice_switch(amount, dice_type, kind="d"):
     return random_element(amount, dice_type)
 
 
-def verbose_print_op(element, depth=0):
+def verbose_print_op(element, trace, depth=0):
     lines = [[depth, classname(element) + "("]]
     num_ops = len(element.original_operands)
 
     for i, e in enumerate(element.original_operands):
-        newlines = verbose_print_sub(e, depth + 1)
+        newlines = verbose_print_sub(e, trace, depth + 1)
 
         if len(newlines) > 1 or num_ops > 1:
             if i + 1 < num_ops:
@@ -110,7 +238,7 @@ def verbose_print_op(element, depth=0):
         else:
             lines[-1].extend(newlines[0][1:])
 
-    closing = ") -> %s" % element.result
+    closing = ") -> %s" % trace[element]
 
     if num_ops > 1 or len(lines) > 1 and lines[-1][0] < lines[-2][0]:
         lines.append([depth, closing])
@@ -120,22 +248,22 @@ def verbose_print_op(element, depth=0):
     return lines
 
 
-def verbose_print_sub(element, indent=0, **kwargs):
+def verbose_print_sub(element, trace, indent=0):
     lines = []
-    if isinstance(element, elements.Element) and not hasattr(element, "result"):
-        element.evaluate_cached(**kwargs)
+    if isinstance(element, elements.Element) and element not in trace:
+        element.evaluate_cached(trace=trace)
 
     if isinstance(element, elements.Operator):
-        return verbose_print_op(element, indent)
+        return verbose_print_op(element, trace, indent)
 
     elif isinstance(element, elements.Dice):
         if any(
             not isinstance(op, (elements.Integer, int))
             for op in element.original_operands
         ):
-            return verbose_print_op(element, indent)
+            return verbose_print_op(element, trace, indent)
 
-        line = "roll %s -> %s" % (element, element.result)
+        line = "roll %s -> %s" % (element, trace[element])
     else:
         line = str(element)
 
@@ -143,7 +271,14 @@ def verbose_print_sub(element, indent=0, **kwargs):
     return lines
 
 
-def verbose_print(element, **kwargs):
-    lines = verbose_print_sub(element, **kwargs)
+def verbose_print(element, trace=None, **kwargs):
+    """Describes the evaluation of an element, as recorded in trace. Without
+    a trace, the element is evaluated with the given keyword arguments."""
+    if trace is None:
+        trace = elements.Trace()
+    if isinstance(element, elements.Element) and element not in trace:
+        element.evaluate_cached(trace=trace, **kwargs)
+
+    lines = verbose_print_sub(element, trace)
     lines = [(" " * (VERBOSE_INDENT * t[0]) + "".join(t[1:])) for t in lines]
     return "\n".join(lines)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (c) Camille Scott, 2021
+# File   : pool.py
+# License: MIT
+# Author : Camille Scott <camille.scott.w@gmail.com>
+# Date   : 22.02.2021
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import signal
+
+from .logging import LoggingMixin
+from .state import MODE_DICE, ROLL_POOL_PENDING, ROLL_POOL_TIMEOUT, ROLL_POOL_WORKERS
+
+
+def warm_parser():
+    """Builds the grammar and parses the default dice of each mode, returning
+    the parse cache packed so it can be handed to other processes."""
+
+    from .dice import parse_cache, parse_expression
+    for die in MODE_DICE.values():
+        parse_expression(f'{die} + 1')
+    return parse_cache.dump()
+
+
+def warm_worker(snapshot=()):
+    """Runs once in each worker. Forked workers inherit the grammar and parse
+    cache built by the pool; the snapshot restores the cache otherwise, and
+    the grammar is built here if it wasn't inherited."""
+
+    # Shutting down is up to the bot, not to ^C reaching the whole group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from .dice import grammar, parse_cache
+    parse_cache.load(snapshot)
+    grammar.get_expression()
+
+
+def call(func, *args, **kwargs):
+    """Calls func in a worker. Errors are sent back as plain ValueErrors:
+    the dice exceptions hold parser state that doesn't pickle."""
+
+    try:
+        return func(*args, **kwargs)
+    except ValueError as e:
+        raise ValueError(str(e)) from None
+
+
+class RollPool(LoggingMixin):
+    """Runs roll evaluation in worker processes, so a heavy roll doesn't
+    block the event loop. At most max_pending tasks are queued or running,
+    and each one is given timeout seconds to finish."""
+
+    def __init__(self, workers=ROLL_POOL_WORKERS, max_pending=ROLL_POOL_PENDING,
+                       timeout=ROLL_POOL_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.futures = set()
+        self.executor = self.build_executor()
+
+        super().__init__()
+
+    def build_executor(self):
+        # Build the grammar here, before the workers are forked
+        snapshot = warm_parser()
+        executor = ProcessPoolExecutor(self.workers, initializer=warm_worker,
+                                       initargs=(snapshot,))
+        # Start the workers now rather than on the first roll
+        for _ in range(self.workers):
+            executor.submit(int)
+        return executor
+
+    async def run(self, func, *args, **kwargs):
+        """Runs func in a worker and returns its result, which must pickle.
+        Raises ValueError when the queue is full or the task times out."""
+
+        if self.pending >= self.max_pending:
+            self.log.error(f'RollPool full: {self.pending} pending')
+            raise ValueError('I\'m rolling as fast as I can, try again in a moment.')
+
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(call, func, *args, **kwargs)
+        except BrokenProcessPool:
+            self.pending -= 1
+            self.restart()
+            raise ValueError('Something broke while rolling, try again.')
+        # A task that times out keeps its worker until it's done, so it's
+        # still pending until then
+        self.futures.add(future)
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self.release, f))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.log.error(f'RollPool task timed out: {func.__name__}{args}')
+            raise ValueError(f'That took too long, I gave up after {self.timeout:g}s.')
+        except BrokenProcessPool:
+            self.restart()
+            raise ValueError('Something broke while rolling, try again.')
+
+    def release(self, future):
+        self.futures.discard(future)
+        self.pending -= 1
+
+    def restart(self):
+        self.log.error('RollPool broken, restarting workers.')
+        self.executor = self.build_executor()
+
+    def close(self):
+        self.log.info('RollPool close()')
+        # shutdown() only takes cancel_futures from 3.9 on; tasks already
+        # handed to a worker can't be cancelled and are left to finish
+        for future in list(self.futures):
+            future.cancel()
+        self.executor.shutdown(wait=False)
@@ -9,132 +9,296 @@
 from dice import DiceBaseException
 from discord.ext import commands
 
+from collections import namedtuple
+from dataclasses import dataclass
+import functools
 import logging
 import re
 
 from .database import ZardozDatabase
-from .state import GameMode, MODE_DICE, MAX_DICE_PER_ROLL
+from .state import (GameMode, MODE_DICE, MAX_DICE_PER_ROLL, MAX_POOL_DICE_PER_ROLL,
+                    ROLL_BUDGET, ROLL_LIMITS, STATS_BUDGET)
 from .utils import SUCCESS, FAILURE
-from .dice import roll as roll_expr
-from .dice.elements import Comparison, Dice, Integer
+from .dice import roll as roll_expr, cost, distribution, parse_cache, Limits
+from .dice.cache import canonicalize
+from .dice.elements import (Comparison, CountedComparisons, CountedList, Integer,
+                             Trace, Variable)
 from .dice.exceptions import DiceBaseException
+from .dice.packed import Packed, pack
+from .dice.probability import NotSupported
 from .dice.utilities import single
 
 
 log = logging.getLogger()
 
-OPS = ['+', '-', '<=', '<', '>=', '>', '(', ')', '==', '.+', '.-', '|', r'#']
-DELIMS = [r'\s']
-SPLIT_PAT = '|'.join(list(map(re.escape, OPS)) + DELIMS)
+OPS = frozenset(['+', '-', '<=', '<', '>=', '>', '(', ')', '==', '.+', '.-', '|'])
+# Operators split words even without whitespace around them, and "#" starts
+# the tag, which runs to the end of the command. Whitespace matches nothing.
+LEXER = re.compile(r"""
+    <= | >= | == | \.[+-] | [-+<>()|\#]
+  | (?: [^\s+\-<>()=|\#.] | =(?!=) | \.(?![+-]) )+
+""", re.VERBOSE)
 
+Lexed = namedtuple('Lexed', 'tokens tag expanded expr template')
 
-def split_tokens(word):
-    log.info(f'SPLIT "{word}" on: "{SPLIT_PAT}"')
-    return [t for t in re.split(f'({SPLIT_PAT})', word)]
 
-
-def filter_tokens(tokens):
-    return [t for t in tokens if t and not re.match(r'\s', t)]
-
-
-def tokenize_roll(cmd: str):
-    """tokenize_roll.
+def lex_roll(cmd, mode=None, variables={}, require_tag=False, expand=True):
+    """Lexes a roll command in one pass.
 
     Parameters
     ----------
-    cmd : str
-        Raw command string to tokenize.
+    cmd : str or list of str
+        Raw command to lex; a list is lexed as if joined by spaces.
+    mode : GameMode
+        Game mode whose default die is substituted for `r`.
+    variables : dict
+        Values substituted for `$name` tokens.
+    require_tag : bool
+        Raise ValueError if the command has no tag.
+    expand : bool
+        Substitute variables and the default die; if False, the expanded
+        tokens are the tokens.
+
+    Returns
+    -------
+    Lexed
+        The tokens before the tag, the tag, the expanded tokens, and the
+        expression they make for the dice parser. The template is the same
+        expression with variables left as `$name` placeholders, to be bound
+        when it's evaluated, where the name allows it.
     """
 
-    raw = []
-
-    log.info(f'Tokenize: "{cmd}"')
-    if isinstance(cmd, str):
-        raw = split_tokens(cmd)
-    else:
-        for arg in cmd:
-            raw.extend(split_tokens(arg))
-
-    raw = filter_tokens(raw)
-
-    tokens, tag = [], ''
-    for i, token in enumerate(raw):
-        if token.startswith('#'):
-            tokens = raw[:i]
-            tag = ' '.join(raw[i:])
-            break
-    if not tag:
-        tokens = raw
-    tag = tag.strip('# ')
-
-    return tokens, tag
-
-
-def expand_tokens(tokens, mode = None, variables = {}):
-    
+    if not isinstance(cmd, str):
+        cmd = ' '.join(cmd)
     if mode is None:
         mode = GameMode.DEFAULT
-
-    if mode is not None and not isinstance(mode, GameMode):
+    if not isinstance(mode, GameMode):
         raise ValueError('mode must be of type GameMode')
 
-    expanded = []
-
+    die = MODE_DICE[mode]
+    tokens = LEXER.findall(cmd)
+    tag, error = '', None
+    if '#' in tokens:
+        i = tokens.index('#')
+        tag = ' '.join(tokens[i:]).strip('# ')
+        del tokens[i:]
+    # The tag is checked before the variables
+    if require_tag and not tag:
+        raise ValueError('Add a tag, it\'s the polite thing to do.')
+
+    if not expand:
+        expr = ' '.join(tokens)
+        return Lexed(tokens, tag, list(tokens), expr, expr)
+
+    # Variables are the only tokens expanded to ints, and the only ones
+    # whose template differs from the expression, so only their places are
+    # kept for it: rolls without any need no other list
+    expanded, bound = [], []
     for token in tokens:
-        if token.isnumeric():
+        if token in OPS:
             expanded.append(token)
-        elif token in OPS:
-            expanded.append(token)
-        elif token.startswith('$'):
+        elif token[0] == '$':
             var = token.strip('$')
-            if var in variables:
-                val = variables[var]
-                if not isinstance(val, int):
-                    raise ValueError('Non-integer variable!')
-                expanded.append(variables[var])
-            else:
-                log.error(f'Undefined var: {var}')
-                raise ValueError(f'Sorry bruh, that variable isn\'t defined: `{var}`')
+            val = variables.get(var)
+            if not isinstance(val, int):
+                if error is None:
+                    error = variable_error(var, variables)
+                continue
+            bound.append((len(expanded), var))
+            expanded.append(val)
+        elif token == 'r':
+            expanded.append(die)
         else:
-            if token == 'r':
-                token = MODE_DICE[mode]
-
             expanded.append(token)
 
-    return expanded
+    if error is not None:
+        log.error(f'Bad variable in roll: {cmd}')
+        raise ValueError(error)
+    if not bound:
+        expr = ' '.join(expanded)
+        return Lexed(tokens, tag, expanded, expr, expr)
+
+    words = [str(token) for token in expanded]
+    expr = ' '.join(words)
+    for i, var in bound:
+        if Variable.NAME.fullmatch(var):
+            words[i] = f'${var}'
+    return Lexed(tokens, tag, expanded, expr, ' '.join(words))
+
 
+def variable_error(var, variables):
+    """The error for a variable without an integer value."""
 
-def parse_tokens(tokens, **kwargs):
-    eval_expr = ' '.join((str(token) for token in tokens))
+    if var not in variables:
+        return f'Sorry bruh, that variable isn\'t defined: `{var}`'
+    return 'Non-integer variable!'
+
+
+def tokenize_roll(cmd):
+    """Splits a roll command into its tokens and its tag."""
+
+    lexed = lex_roll(cmd, expand=False)
+    return lexed.tokens, lexed.tag
+
+
+def parse_roll(expr, **kwargs):
     try:
-        return roll_expr(eval_expr, **kwargs), eval_expr
+        return roll_expr(expr, **kwargs)
     except DiceBaseException as e:
         raise ValueError(e)
 
 
 def roll_expression(roll_expr, variables = {}, require_tag=False,
                     game_mode=GameMode.DEFAULT, **kwargs):
-    tokens, tag = tokenize_roll(roll_expr)
-    expanded = expand_tokens(tokens,
-                             mode = game_mode,
-                             variables = variables)
-    result, eval_expr = parse_tokens(expanded, **kwargs)
+    lexed = lex_roll(roll_expr,
+                     mode = game_mode,
+                     variables = variables,
+                     require_tag = require_tag)
+    result = parse_roll(lexed.expr, **kwargs)
+
+    return result, lexed.expanded, lexed.tag, lexed.expr
 
-    return result, expanded, tag, eval_expr
 
+def check_cost(elements, budget=ROLL_BUDGET, variables=None):
+    """Refuses parsed elements whose worst case goes over the budget,
+    before anything is rolled."""
+    try:
+        return cost.check(elements, budget, max_dice=MAX_DICE_PER_ROLL,
+                          max_pool_dice=MAX_POOL_DICE_PER_ROLL, variables=variables)
+    except DiceBaseException as e:
+        raise ValueError(e)
+
+
+@dataclass(frozen=True)
+class RollReport:
+    """Everything needed to reply to a roll, as plain values that can be
+    sent back from a worker process."""
+
+    tokens: list
+    tag: str
+    expanded: list
+    expr: str
+    rolls: str
+    result: str
+    summary: str
+
+
+def evaluate_roll(roll, variables = {}, require_tag=False,
+                  game_mode=GameMode.DEFAULT, budget=ROLL_BUDGET, limits=ROLL_LIMITS):
+    """Lexes, parses and evaluates a roll request. The expression is parsed
+    with its variables as placeholders, so the parse is shared by every
+    roll of it whatever their values, and bound to them when it's rolled."""
+
+    tokens, tag, expanded, expr, template = lex_roll(roll,
+                                                     mode = game_mode,
+                                                     variables = variables,
+                                                     require_tag = require_tag)
+    log.info('Lexed roll: %s ⤳ %s', tokens, template)
+
+    result = parse_roll(template, single=False, raw=True, optimize=True)
+    check_cost(result, budget, variables)
+    result = RollResult(expr, result, limits=limits, variables=variables)
+
+    return RollReport(tokens, tag, expanded, expr, result.describe_rolls(),
+                      result.describe(mode=game_mode), str(result))
+
+
+@dataclass(frozen=True)
+class CompiledRoll:
+    """A roll command lexed, parsed and checked once, to be rolled any number
+    of times without lexing or parsing it again. Its parse is packed, so it
+    can be sent to the roll workers."""
+
+    roll: str
+    tokens: list
+    tag: str
+    expanded: list
+    template: str
+    packed: Packed
+    variables: frozenset
+
+    def bind(self, variables):
+        """Returns the expanded tokens and the expression with the values of
+        the variables, raising the errors lex_roll would."""
+
+        expanded = []
+        for token in self.expanded:
+            if isinstance(token, str) and token[0] == '$':
+                val = variables.get(token[1:])
+                if not isinstance(val, int):
+                    raise ValueError(variable_error(token[1:], variables))
+                token = val
+            expanded.append(token)
+        return expanded, ' '.join((str(token) for token in expanded))
+
+
+def compile_roll(roll, variables = {}, game_mode=GameMode.DEFAULT, budget=ROLL_BUDGET):
+    """Lexes, parses and checks a roll command for CompiledRoll, raising
+    ValueError as evaluate_roll would."""
+
+    tokens, tag, expanded, _, template = lex_roll(roll,
+                                                  mode = game_mode,
+                                                  variables = variables)
+    names = set()
+    for i, token in enumerate(tokens):
+        if token[0] == '$':
+            var = token.strip('$')
+            if not Variable.NAME.fullmatch(var):
+                raise ValueError(f'Only variables named with letters, digits and _ '
+                                 f'can go in a compiled roll: `{var}`')
+            names.add(var)
+            expanded[i] = f'${var}'
+
+    # Cached trees keep the spans of whichever spelling was parsed first,
+    # and the packed tree has to match the template
+    elements = parse_roll(template, single=False, raw=True, cache=False)
+    check_cost(elements, budget, variables)
 
-def extract_rolls(elements, rolls):
-    for e in elements:
-        if isinstance(e, Dice):
-            rolls.append(e)
-        elif hasattr(e, 'tokens'):
-            extract_rolls(e.tokens, rolls)
+    return CompiledRoll(roll, tokens, tag, expanded, template, pack(elements, template),
+                        frozenset(names))
+
+
+def evaluate_compiled_roll(compiled, variables = {}, tag=None,
+                           game_mode=GameMode.DEFAULT, budget=ROLL_BUDGET,
+                           limits=ROLL_LIMITS):
+    """Binds and evaluates a CompiledRoll, replacing its tag if one is given."""
+
+    expanded, expr = compiled.bind(variables)
+    # The packed parse goes into the worker's cache, if it isn't there yet
+    if compiled.template not in parse_cache:
+        parse_cache.load([(canonicalize(compiled.template), compiled.packed)])
+
+    result = parse_roll(compiled.template, single=False, raw=True, optimize=True)
+    check_cost(result, budget, variables)
+    result = RollResult(expr, result, limits=limits, variables=variables)
+
+    return RollReport(compiled.tokens, tag or compiled.tag, expanded, expr,
+                      result.describe_rolls(), result.describe(mode=game_mode), str(result))
+
+
+async def fetch_macro(pool, db: ZardozDatabase, member_id, name, variables = {},
+                      game_mode=GameMode.DEFAULT):
+    """Returns the CompiledRoll of the macro a member gets by name, compiling
+    it in the pool if it hasn't been since it last changed."""
+
+    key, roll = await db.get_macro(member_id, name)
+    if key is None:
+        raise ValueError(f'There\'s no macro called @{name}.')
+
+    compiled = db.compiled_macros.get(key)
+    if compiled is None:
+        compiled = await pool.run(compile_roll, roll, variables, game_mode=game_mode)
+        # Unless the macro changed while it was compiling
+        if (await db.get_macro(member_id, name)) == (key, roll):
+            db.compiled_macros[key] = compiled
+    return compiled
 
 
 class RollHandler:
 
     def __init__(self, ctx, log, variables, roll,
-                       require_tag=False, game_mode=GameMode.DEFAULT):
+                       require_tag=False, game_mode=GameMode.DEFAULT,
+                       budget=ROLL_BUDGET, limits=ROLL_LIMITS, report=None):
 
         log.info(f'Roll request: {roll}')
 
@@ -143,35 +307,44 @@ class RollHandler:
         self.game_mode = game_mode
         self.roll = roll
 
-        self.tokens, self.tag = tokenize_roll(roll)
-        if require_tag and not self.tag:
-            raise ValueError('Add a tag, it\'s the polite thing to do.')
-        self.log.info(f'Raw tokens: {self.tokens}')
-
-        self.expanded = expand_tokens(self.tokens,
-                                      mode = self.game_mode,
-                                      variables = variables)
-        self.log.info(f'Expanded tokens: {self.expanded}')
-        
-        result, self.expr = parse_tokens(self.expanded, single=False, raw=True)
-        self.result = RollResult(self.expr, result)
-        if self.result is None:
-            log.error(f'Python parsing error: {eval_expr}.')
-            raise ValueError(f'Your syntax was scintillating, but I couldn\'t parse it.')
+        if report is None:
+            report = evaluate_roll(roll, variables, require_tag=require_tag,
+                                   game_mode=game_mode, budget=budget, limits=limits)
+        self.report = report
+        self.tokens, self.tag = report.tokens, report.tag
+        self.expanded = report.expanded
+        self.expr = report.expr
 
         log.info(f'Handled roll: {str(self)}')
 
+    @classmethod
+    async def submit(cls, pool, ctx, log, variables, roll, **kwargs):
+        """Evaluates the roll in the worker pool, without blocking the
+        event loop, and builds the handler from its report."""
+
+        report = await pool.run(evaluate_roll, roll, variables, **kwargs)
+        game_mode = kwargs.get('game_mode', GameMode.DEFAULT)
+        return cls(ctx, log, variables, roll, game_mode=game_mode, report=report)
+
+    @classmethod
+    async def submit_compiled(cls, pool, ctx, log, variables, compiled, **kwargs):
+        """Evaluates a CompiledRoll in the worker pool, like submit."""
+
+        report = await pool.run(evaluate_compiled_roll, compiled, variables, **kwargs)
+        game_mode = kwargs.get('game_mode', GameMode.DEFAULT)
+        return cls(ctx, log, variables, compiled.roll, game_mode=game_mode, report=report)
+
     async def add_to_db(self, db: ZardozDatabase):
         await db.add_roll(self.ctx.author.id, self.ctx.author.nick, self.ctx.author.name,
                           ' '.join(self.tokens), self.tag, self.expr)
 
     def msg(self):
         log = logging.getLogger()
-        log.info(f'RollHandler msg: result {self.result.describe(mode=self.game_mode)}')
+        log.info(f'RollHandler msg: result {self.report.result}')
         header = f':game_die: {self.ctx.author.mention}' + (f': *{self.tag}*' if self.tag else '')
         result = [f'***Request:***  `{" ".join(self.tokens)}`\n',
-                  f'***Rolls:***  `{self.result.describe_rolls()}`\n',
-                  f'***Result:***\n```\n{self.result.describe(mode=self.game_mode)}```']
+                  f'***Rolls:***  `{self.report.rolls}`\n',
+                  f'***Result:***\n```\n{self.report.result}```']
         result = ''.join(result)
         msg = '\n'.join((header, result))
 
@@ -186,8 +359,8 @@ class RollHandler:
               f' tokens={self.tokens}'\
               f' tag="{self.tag}"'\
               f' expanded={self.expanded}'\
-              f' rolls="{self.result.describe_rolls()}"'\
-              f' result={self.result}>'
+              f' rolls="{self.report.rolls}"'\
+              f' result={self.report.summary}>'
         return ret
 
 
@@ -195,7 +368,7 @@ class QuietRollHandler(RollHandler):
 
     def msg(self):
         header = f'*:game_die: {self.tag}*' if self.tag else ''
-        result =f'```{self.result.describe(mode=self.game_mode)}```'
+        result =f'```{self.report.result}```'
         msg = f'{header}\n{result}'
 
         return msg
@@ -206,8 +379,8 @@ class SekretRollHandler(RollHandler):
     def msg(self):
         header = f':game_die: from **{self.ctx.author}** in **{self.ctx.guild}**: ' + (f'*{self.tag}*' if self.tag else '')
         result = [f'***Request:***  `{" ".join(self.tokens)}`\n',
-                  f'***Rolls:***  `{self.result.describe_rolls()}`\n',
-                  f'***Result:***\n```{self.result.describe(mode=self.game_mode)}```']
+                  f'***Rolls:***  `{self.report.rolls}`\n',
+                  f'***Result:***\n```{self.report.result}```']
         result = ''.join(result)
         return '\n'.join((header, result))
 
@@ -217,33 +390,144 @@ class RerollHandler(RollHandler):
     def msg(self, reroll_target):
         header = f':game_die: {self.ctx.author.mention} rerolls {reroll_target}' + (f': *{self.tag}*' if self.tag else '')
         result = [f'***Request:***  `{" ".join(self.tokens)}`\n',
-                  f'***Rolls:***  `{self.result.describe_rolls()}`\n',
-                  f'***Result:***\n```{self.result.describe(mode=self.game_mode)}```']
+                  f'***Rolls:***  `{self.report.rolls}`\n',
+                  f'***Result:***\n```{self.report.result}```']
         result = ''.join(result)
         msg = '\n'.join((header, result))
 
         return msg
 
 
+@dataclass(frozen=True)
+class StatsReport:
+    """The odds of a roll, as plain values like RollReport."""
+
+    tokens: list
+    tag: str
+    expanded: list
+    expr: str
+    odds: str
+
+
+def describe_distributions(results, percentiles=(5, 25, 50, 75, 95)):
+    dsc = []
+    for result in results:
+        if hasattr(result, 'margin'):
+            dsc.append(f'P(success): {result.probability:.2%}, '
+                       f'mean margin: {result.margin:.2f}')
+        else:
+            quantiles = ', '.join((f'{q}%: {result.percentile(q)}'
+                                   for q in percentiles))
+            dsc.append(f'mean: {result.mean:.2f}, sd: {result.std:.2f}, '
+                       f'range: {result.min}..{result.max}\n'
+                       f'{quantiles}')
+    return '\n'.join(dsc)
+
+
+def evaluate_stats(roll, variables = {}, game_mode=GameMode.DEFAULT,
+                   budget=ROLL_BUDGET, stats_budget=STATS_BUDGET):
+    """Lexes a roll request and works out its exact odds, refusing rolls that
+    go over the budget, or whose distribution would be too large to compute,
+    with ValueError."""
+
+    lexed = lex_roll(roll, mode = game_mode, variables = variables)
+    expr = canonicalize(lexed.expr)
+
+    elements = parse_roll(expr, single=False, raw=True)
+    check_cost(elements, budget)
+    work = cost.support(elements, max_dice=MAX_DICE_PER_ROLL,
+                        max_pool_dice=MAX_POOL_DICE_PER_ROLL)
+    if work > stats_budget:
+        raise ValueError(f'Too many outcomes to work out exactly! '
+                         f'({work} to go through, max is {stats_budget})')
+
+    try:
+        result = expression_distribution(expr)
+    except (DiceBaseException, NotSupported, TypeError) as e:
+        raise ValueError(e)
+    results = result if isinstance(result, list) else [result]
+
+    return StatsReport(lexed.tokens, lexed.tag, lexed.expanded, expr,
+                       describe_distributions(results, StatsHandler.percentiles))
+
+
+class StatsHandler:
+
+    percentiles = (5, 25, 50, 75, 95)
+
+    def __init__(self, ctx, log, variables, roll,
+                       game_mode=GameMode.DEFAULT, report=None):
+
+        log.info(f'Stats request: {roll}')
+
+        self.ctx = ctx
+        self.log = log
+        self.game_mode = game_mode
+        self.roll = roll
+
+        if report is None:
+            report = evaluate_stats(roll, variables, game_mode=game_mode)
+        self.report = report
+        self.tokens, self.tag = report.tokens, report.tag
+        self.expanded = report.expanded
+        self.expr = report.expr
+
+        log.info(f'Handled stats: {self.expr} ⤳ {report.odds}')
+
+    @classmethod
+    async def submit(cls, pool, ctx, log, variables, roll, **kwargs):
+        """Works out the odds in the worker pool, like RollHandler.submit."""
+
+        report = await pool.run(evaluate_stats, roll, variables, **kwargs)
+        game_mode = kwargs.get('game_mode', GameMode.DEFAULT)
+        return cls(ctx, log, variables, roll, game_mode=game_mode, report=report)
+
+    def describe(self):
+        return self.report.odds
+
+    def msg(self):
+        header = f':bar_chart: {self.ctx.author.mention}' + (f': *{self.tag}*' if self.tag else '')
+        result = [f'***Request:***  `{" ".join(self.tokens)}`\n',
+                  f'***Odds:***\n```\n{self.describe()}```']
+        return '\n'.join((header, ''.join(result)))
+
+
+@functools.lru_cache(maxsize=512)
+def expression_distribution(expr):
+    """Exact distribution of a canonical expression, computed at most
+    once per expression. evaluate_stats has already held it to the roll and
+    stats budgets, so counted pools get their own limit here too."""
+    return distribution(expr, max_dice=MAX_POOL_DICE_PER_ROLL)
+
+
 class RollResult:
 
-    def __init__(self, expr, roll):
+    def __init__(self, expr, roll, limits=ROLL_LIMITS, variables=None):
         self.expr = expr
         self.roll_elements = roll
         try:
-            roll = single([e.evaluate_cached(max_dice=MAX_DICE_PER_ROLL) for e in roll])
+            self.trace = Trace.evaluate(roll, keep_intermediates=False,
+                                        max_dice=MAX_DICE_PER_ROLL,
+                                        max_pool_dice=MAX_POOL_DICE_PER_ROLL,
+                                        limits=Limits(**limits),
+                                        variables=variables)
         except DiceBaseException as e:
             raise ValueError(e)
+        roll = single(self.trace.results)
 
         log = logging.getLogger()
         log.info(f'Building RollResult from {roll}')
         if isinstance(roll, (int, Integer)):
             self.roll = [DiceResult(int(roll))]
+        elif isinstance(roll, (CountedList, CountedComparisons)):
+            self.roll = [DiceHistogram(roll)]
         else:
             self.roll = []
             for item in roll:
                 if isinstance(item, Comparison):
                     self.roll.append(DiceComparison(item))
+                elif isinstance(item, (CountedList, CountedComparisons)):
+                    self.roll.append(DiceHistogram(item))
                 else:
                     self.roll.append(DiceResult(item))
         log.info(f'Built roll result: {self.roll}')
@@ -253,11 +537,9 @@ class RollResult:
         return dsc if dsc else '0'
 
     def describe_rolls(self):
-        rolls = []
-        extract_rolls(self.roll_elements, rolls)
         dsc = []
-        for roll in rolls:
-            dsc.append(f'{roll} ⤳ {roll.evaluate_cached()}')
+        for element, roll in self.trace.rolls():
+            dsc.append(f'{element} ⤳ {roll}')
         return ', '.join(dsc) if dsc else 'None'
 
     def __iter__(self):
@@ -288,10 +570,45 @@ class DiceResult:
         return self.result
     
 
+class DiceHistogram:
+
+    width = 20
+
+    def __init__(self, result):
+        self.result = result
+
+    def describe(self, **kwargs):
+        counts = list(self.result.counts)
+        peak = max(counts, default=0) or 1
+        lines = []
+        for item, count in self.result.items():
+            bar = '█' * max(1, round(self.width * count / peak))
+            if isinstance(item, Comparison):
+                status = SUCCESS if item.value else FAILURE
+                label = f'{item.left:4} {item.operator} {item.right:<4} ⤳ {status}'
+            else:
+                label = f'{item:4}'
+            lines.append(f'{label} × {count:<7} {bar}')
+
+        if isinstance(self.result, CountedComparisons):
+            lines.append(f'{SUCCESS} {self.result.successes} of {len(self.result)}')
+        else:
+            lines.append(f'total {int(self.result)} from {len(self.result)}')
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return str(self.result)
+
+
 class DiceComparison(Comparison):
 
-    def __init__(self, other):
-        super().__init__(other.left, other.right , other.delta, other.value, other.operator)
+    __slots__ = ()
+
+    def __new__(cls, other):
+        return super().__new__(cls, *other)
+
+    def __getnewargs__(self):
+        return tuple(self),
 
     def describe(self, mode = None, expr = '', **kwargs):
         if mode is not None and not isinstance(mode, GameMode):
@@ -53,3 +53,25 @@ where var=:var;
 
 -- name: get_guild_vars
 select * from guild_vars;
+
+-- name: set_guild_limit!
+insert into guild_limits
+values (:name, :val)
+on conflict (name)
+do update set val=:val;
+
+-- name: get_guild_limits
+select * from guild_limits;
+
+-- name: set_macro!
+insert into macros
+values (:member_id, :name, :roll)
+on conflict (member_id, name)
+do update set roll=:roll;
+
+-- name: get_macros
+select * from macros;
+
+-- name: del_macro!
+delete from macros
+where member_id=:member_id and name=:name;
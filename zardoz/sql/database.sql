@@ -22,3 +22,16 @@ CREATE TABLE IF NOT EXISTS guild_vars (
     val INTEGER not NULL,
     PRIMARY KEY (var)
 );
+
+CREATE TABLE IF NOT EXISTS guild_limits (
+    name TEXT NOT NULL,
+    val INTEGER NOT NULL,
+    PRIMARY KEY (name)
+);
+
+CREATE TABLE IF NOT EXISTS macros (
+    member_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    roll TEXT NOT NULL,
+    PRIMARY KEY (member_id, name)
+);
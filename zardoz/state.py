@@ -11,6 +11,8 @@ from enum import IntEnum, auto
 
 from discord.ext import commands
 
+from .dice.cost import Budget
+
 
 class GameMode(IntEnum):
     DEFAULT = auto()
@@ -31,3 +33,26 @@ MODE_DICE = {GameMode.DEFAULT: '1d6',
              GameMode.AW: '2d6t'}
 
 MAX_DICE_PER_ROLL = 64
+# Bigger rolls of few-sided dice are kept as counts of each face
+MAX_POOL_DICE_PER_ROLL = 10 ** 6
+# Rolls whose worst case goes over these limits are refused before rolling:
+# enough for MAX_DICE_PER_ROLL dice to explode as far as they can
+ROLL_BUDGET = Budget(dice=2 ** 14, length=2 ** 14, output=2 ** 14)
+# Every roll is stopped once it takes more steps, rolls more dice or runs for
+# longer than this; guilds can set lower limits with /zmode limits
+ROLL_LIMITS = dict(max_steps=2 ** 12, max_rolled=2 ** 14, timeout=0.5)
+# /zstats refuses rolls whose exact distribution could take more work than
+# this: the width of the values of any part of the roll times its dice
+STATS_BUDGET = 2 ** 22
+# The limits a guild can set, and the ROLL_LIMITS they lower
+LIMIT_NAMES = {'steps': 'max_steps',
+               'dice': 'max_rolled',
+               'ms': 'timeout'}
+# Rolls are evaluated in worker processes, off the event loop: at most
+# ROLL_POOL_PENDING at once, each given ROLL_POOL_TIMEOUT seconds
+ROLL_POOL_WORKERS = 2
+ROLL_POOL_PENDING = 64
+ROLL_POOL_TIMEOUT = 5.0
+# Each guild keeps its vars, and the user vars of this many of its most
+# recently active members, in memory
+STATE_CACHE_MEMBERS = 256